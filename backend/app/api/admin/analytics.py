@@ -5,6 +5,7 @@ from typing import Any, Dict, List, Optional
 from fastapi import APIRouter, Query
 
 from ...services.db_service import db_service
+from ...services.order_items import parse_applied_offer
 
 router = APIRouter(prefix="/analytics", tags=["admin-analytics"])
 
@@ -23,6 +24,19 @@ async def get_accounts_stats() -> Dict[str, Any]:
         }
     
     try:
+        # Aggregated in SQL from orders + order_items where the backend supports it
+        summary = db_service.get_sales_summary()
+        if summary is not None:
+            confirmed = summary["confirmed_orders"]
+            return {
+                "totalSareesSold": summary["units_sold"],
+                "totalConfirmedOrders": confirmed,
+                "totalConfirmedValue": summary["confirmed_value"],
+                "totalOrders": summary["total_orders"],
+                "totalProducts": summary["total_products"],
+                "averageOrderValue": summary["confirmed_value"] / confirmed if confirmed else 0
+            }
+        
         # Get all orders
         all_orders = db_service.admin_get_all("orders")
         total_orders = len(all_orders)
@@ -54,9 +68,8 @@ async def get_accounts_stats() -> Dict[str, Any]:
                     for item in order["items"]:
                         total_sarees += int(item.get("quantity") or 1)
                 elif order.get("applied_offer"):
-                    import json
-                    parsed = json.loads(order["applied_offer"]) if isinstance(order["applied_offer"], str) else order["applied_offer"]
-                    if parsed and isinstance(parsed, dict) and parsed.get("items"):
+                    parsed = parse_applied_offer(order["applied_offer"])
+                    if parsed and parsed.get("items"):
                         for item in parsed["items"]:
                             total_sarees += int(item.get("quantity") or 1)
                     else:
@@ -90,6 +103,22 @@ async def get_accounts_stats() -> Dict[str, Any]:
         }
 
 
+@router.get("/top-products")
+async def get_top_products(
+    limit: int = Query(10, ge=1, le=100),
+    since: Optional[str] = Query(None, description="ISO date; only orders created on or after it"),
+) -> List[Dict[str, Any]]:
+    """Best-selling products of paid orders (units, revenue, order count)."""
+    if not db_service.is_available():
+        return []
+    
+    try:
+        return db_service.get_top_products(limit=limit, since=since)
+    except Exception as e:
+        print(f"Error fetching top products: {e}")
+        return []
+
+
 @router.get("/visits")
 async def get_visits(
     start_date: Optional[str] = Query(None),
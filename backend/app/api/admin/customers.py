@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 from datetime import datetime
@@ -24,6 +25,18 @@ async def get_customers() -> List[Dict[str, Any]]:
     return []
 
 
+@router.post("/stats/rebuild")
+async def rebuild_customer_stats() -> Dict[str, Any]:
+    """Recompute the customer_stats projection from store bills and online orders."""
+    if not db_service.is_available():
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    customers = await asyncio.to_thread(db_service.rebuild_customer_stats)
+    if customers is None:
+        raise HTTPException(status_code=500, detail="Failed to rebuild customer stats")
+    return {"status": "success", "customers": customers}
+
+
 @router.get("/{customer_id}")
 async def get_customer(customer_id: str) -> Dict[str, Any]:
     """Get a specific customer."""
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 from datetime import datetime
@@ -42,6 +43,31 @@ async def get_inventory(
     return []
 
 
+@router.get("/movements")
+async def get_stock_movements(
+    product_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+) -> List[Dict[str, Any]]:
+    """Latest entries of the stock movements ledger, optionally of one product."""
+    if db_service.is_available():
+        return await asyncio.to_thread(db_service.get_stock_movements, product_id, limit)
+    return []
+
+
+@router.get("/movements/summary")
+async def get_stock_movement_summary(
+    since: Optional[str] = Query(None, description="ISO 8601 start (inclusive)"),
+    until: Optional[str] = Query(None, description="ISO 8601 end (exclusive)"),
+) -> Dict[str, Any]:
+    """Stock in/out per movement type and per product over a period."""
+    if not db_service.is_available():
+        raise HTTPException(status_code=503, detail="Database not available")
+    summary = await asyncio.to_thread(db_service.get_stock_movement_summary, since, until)
+    if summary is None:
+        raise HTTPException(status_code=500, detail="Stock movement summary not available (run db/create_stock_movements.sql)")
+    return summary
+
+
 @router.get("/{inventory_id}")
 async def get_inventory_item(inventory_id: str) -> Dict[str, Any]:
     """Get a specific inventory item."""
@@ -61,21 +87,34 @@ async def update_inventory_item(inventory_id: str, inventory: Dict[str, Any]) ->
     """Update an inventory item."""
     if db_service.is_available():
         try:
+            existing = db_service.admin_get_by_id("inventory", inventory_id)
+            if not existing:
+                raise HTTPException(status_code=404, detail="Inventory item not found")
+            
+            # Stock levels change only through the stock movements ledger, which
+            # updates the product and its inventory rows together
+            current_stock = inventory.pop("current_stock", None)
+            product_id = existing.get("product_id")
+            if current_stock is not None and product_id:
+                status = inventory.pop("status", None)
+                delta = await asyncio.to_thread(
+                    db_service.adjust_stock_level, str(product_id), int(current_stock), inventory_id, "Inventory update"
+                )
+                if delta is None:
+                    # adjust_stock_level() not installed (db/create_stock_movements.sql): write both directly
+                    inventory["current_stock"] = current_stock
+                    if status is not None:
+                        inventory["status"] = status
+                    db_service.admin_update("products", product_id, {
+                        "total_stock": current_stock,
+                        "stock_status": status or existing.get("status", "in_stock"),
+                    })
+            elif current_stock is not None:
+                inventory["current_stock"] = current_stock
+            
             inventory["updated_at"] = datetime.utcnow().isoformat()
             updated = db_service.admin_update("inventory", inventory_id, inventory)
             if updated:
-                # Also update the product if it exists
-                product_id = updated.get("product_id")
-                if product_id:
-                    product_update = {
-                        "total_stock": inventory.get("current_stock", updated.get("current_stock", 0)),
-                        "stock_status": inventory.get("status", updated.get("status", "in_stock"))
-                    }
-                    try:
-                        db_service.admin_update("products", product_id, product_update)
-                    except Exception as e:
-                        print(f"Error updating product stock from inventory: {e}")
-                
                 return updated
             raise HTTPException(status_code=404, detail="Inventory item not found")
         except HTTPException:
@@ -85,4 +124,3 @@ async def update_inventory_item(inventory_id: str, inventory: Dict[str, Any]) ->
             raise HTTPException(status_code=500, detail=f"Failed to update inventory: {str(e)}")
     
     raise HTTPException(status_code=503, detail="Database not available")
-
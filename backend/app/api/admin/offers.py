@@ -6,6 +6,7 @@ from uuid import uuid4
 from fastapi import APIRouter, HTTPException, Query
 
 from ...services.db_service import db_service
+from ...services.offer_engine import offer_engine
 
 router = APIRouter(prefix="/offers", tags=["admin-offers"])
 
@@ -46,6 +47,7 @@ async def create_offer(offer: Dict[str, Any]) -> Dict[str, Any]:
                 offer["id"] = str(uuid4())
             created = db_service.admin_create("offers", offer)
             if created:
+                offer_engine.invalidate()
                 return created
             raise HTTPException(status_code=500, detail="Failed to create offer")
         except HTTPException:
@@ -64,6 +66,7 @@ async def update_offer(offer_id: str, offer: Dict[str, Any]) -> Dict[str, Any]:
         try:
             updated = db_service.admin_update("offers", offer_id, offer)
             if updated:
+                offer_engine.invalidate()
                 return updated
             raise HTTPException(status_code=404, detail="Offer not found")
         except HTTPException:
@@ -82,6 +85,7 @@ async def delete_offer(offer_id: str) -> Dict[str, Any]:
         try:
             deleted = db_service.admin_delete("offers", offer_id)
             if deleted:
+                offer_engine.invalidate()
                 return {"success": True, "message": "Offer deleted successfully"}
             raise HTTPException(status_code=404, detail="Offer not found")
         except HTTPException:
@@ -6,6 +6,7 @@ from datetime import datetime
 from fastapi import APIRouter, HTTPException, Query, Body
 
 from ...services.db_service import db_service
+from ...services.invoice_cache import invoice_cache
 
 router = APIRouter(prefix="/orders", tags=["admin-orders"])
 
@@ -159,6 +160,7 @@ async def update_order_status(
             update_data["updated_at"] = datetime.utcnow().isoformat()
             
             updated = db_service.admin_update("orders", order_id, update_data, id_column="order_id")
+            invoice_cache.invalidate(order_id)
             if updated:
                 return updated
             raise HTTPException(status_code=404, detail="Order not found")
@@ -191,6 +193,7 @@ async def update_orders_status_bulk(
             updated = 0
             for order_id in order_ids:
                 result = db_service.admin_update("orders", order_id, update_data, id_column="order_id")
+                invoice_cache.invalidate(order_id)
                 if result:
                     updated += 1
             
@@ -215,6 +218,7 @@ async def update_order_payment_status(
                 "updated_at": datetime.utcnow().isoformat()
             }
             updated = db_service.admin_update("orders", order_id, update_data, id_column="order_id")
+            invoice_cache.invalidate(order_id)
             if updated:
                 return updated
             raise HTTPException(status_code=404, detail="Order not found")
@@ -260,6 +264,7 @@ async def delete_order(order_id: str) -> Dict[str, Any]:
                 
                 # Delete the order
                 result = db_service.admin_delete("orders", order_uuid)
+                invoice_cache.invalidate(order_id)
                 if result:
                     return {"status": "success", "message": "Order deleted successfully"}
                 raise HTTPException(status_code=404, detail="Order not found")
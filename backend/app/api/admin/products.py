@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+import json
 from typing import Any, Dict, List, Optional
 from uuid import uuid4
 
@@ -7,6 +9,8 @@ from fastapi import APIRouter, HTTPException, Query
 
 from ...data import PRODUCTS, CATEGORIES
 from ...services.db_service import db_service
+from ...services.image_variants import image_variant_service
+from ...services.parsing import parse_json_list
 
 router = APIRouter(prefix="/products", tags=["admin-products"])
 
@@ -58,6 +62,8 @@ async def create_product(product: Dict[str, Any]) -> Dict[str, Any]:
         try:
             if "id" not in product:
                 product["id"] = str(uuid4())
+            # Written by the image-variants route only
+            product.pop("image_variants", None)
             created = db_service.admin_create("products", product)
             if created:
                 return created
@@ -78,12 +84,51 @@ async def create_product(product: Dict[str, Any]) -> Dict[str, Any]:
     return new_product
 
 
+def _update_product_stock(product_id: str, product: Dict[str, Any]) -> None:
+    """
+    Move the stock fields of a product edit through the stock movements ledger, which
+    applies them under the product's row lock so concurrent POS sales are not lost.
+    The stock fields are left in `product` for a direct write only when the ledger
+    functions are not installed.
+    """
+    total_stock = product.pop("total_stock", None)
+    stock_status = product.pop("stock_status", None)
+    raw_fields = {k: v for k, v in (("total_stock", total_stock), ("stock_status", stock_status)) if v is not None}
+
+    if "color_stock" in product:
+        color_stock = parse_json_list(product["color_stock"])
+        if db_service.set_color_stock_levels(product_id, color_stock, product_id, "Product update") is None:
+            # set_color_stock_levels() not installed (db/create_stock_movements.sql)
+            product.update(raw_fields)
+            return
+        product.pop("color_stock")
+        if any(isinstance(entry, dict) for entry in color_stock):
+            # Colour-tracked: total_stock is the sum of color_stock
+            return
+
+    if total_stock is not None:
+        if db_service.adjust_stock_level(product_id, int(total_stock), product_id, "Product update") is None:
+            # adjust_stock_level() not installed (db/create_stock_movements.sql)
+            product.update(raw_fields)
+
+
 @router.put("/{product_id}")
 async def update_product(product_id: str, product: Dict[str, Any]) -> Dict[str, Any]:
     """Update an existing product."""
     if db_service.is_available():
         try:
-            updated = db_service.admin_update("products", product_id, product)
+            # Written by the image-variants route only
+            product.pop("image_variants", None)
+            existing = db_service.admin_get_by_id("products", product_id)
+            if not existing:
+                raise HTTPException(status_code=404, detail="Product not found")
+            if {"total_stock", "color_stock", "stock_status"} & product.keys():
+                await asyncio.to_thread(_update_product_stock, product_id, product)
+            if product:
+                updated = db_service.admin_update("products", product_id, product)
+            else:
+                # A stock-only edit, already written by the ledger
+                updated = db_service.admin_get_by_id("products", product_id)
             if updated:
                 return updated
             raise HTTPException(status_code=404, detail="Product not found")
@@ -128,6 +173,34 @@ async def delete_product(product_id: str) -> Dict[str, Any]:
     return {"status": "success", "message": "Product deleted"}
 
 
+@router.post("/{product_id}/image-variants")
+async def generate_image_variants(product_id: str) -> Dict[str, Any]:
+    """Generate thumb/card/zoom variants for every image of a product."""
+    if not image_variant_service.is_enabled():
+        raise HTTPException(status_code=503, detail="Image variants are not enabled")
+
+    product = None
+    if db_service.is_available():
+        product = db_service.admin_get_by_id("products", product_id)
+    in_db = bool(product)
+    if not product:
+        product = next((p for p in PRODUCTS if p.get("id") == product_id), None)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    result = await image_variant_service.ensure_product_variants(product)
+    variants = result.pop("variants")
+    if variants:
+        # Saved on the product so the storefront only advertises variants that exist
+        stored = {**image_variant_service.stored_variants(product), **variants}
+        if in_db:
+            if not db_service.admin_update("products", product_id, {"image_variants": json.dumps(stored)}):
+                raise HTTPException(status_code=500, detail="Variants were generated but could not be saved")
+        else:
+            product["image_variants"] = stored
+    return {"status": "success", "product_id": product_id, **result}
+
+
 @router.post("/{product_id}/hide")
 async def hide_product(product_id: str) -> Dict[str, Any]:
     """Hide a product."""
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException, Query
@@ -7,16 +8,23 @@ from fastapi import APIRouter, HTTPException, Query
 from .storefront import _orders
 from ..data import SETTINGS
 from ..services.db_service import db_service
+from ..services.invoice_cache import invoice_cache
+from ..services.order_items import invoice_items, parse_applied_offer
+from ..services.payment_status import payment_status_hub
 from ..models.responses import sanitize_orders, sanitize_order
 
 router = APIRouter(prefix="/customer", tags=["customer"])
 
 
 @router.get("/orders/by-email")
-async def get_orders_by_email(email: str = Query(...)) -> List[Dict[str, Any]]:
-    """Get orders by customer email - uses database if available."""
+async def get_orders_by_email(
+    email: str = Query(...),
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=100),
+) -> List[Dict[str, Any]]:
+    """Get orders by customer email, newest first - uses database if available."""
     if db_service.is_available():
-        orders = db_service.get_orders_by_email(email)
+        orders = await asyncio.to_thread(db_service.get_orders_by_email, email, size, (page - 1) * size)
         return sanitize_orders(orders)
     
     # Fallback to in-memory
@@ -31,10 +39,14 @@ async def get_orders_by_email(email: str = Query(...)) -> List[Dict[str, Any]]:
 async def get_orders_by_customer_details(
     email: Optional[str] = Query(None),
     phone: Optional[str] = Query(None),
+    page: int = Query(1, ge=1),
+    size: int = Query(50, ge=1, le=100),
 ) -> List[Dict[str, Any]]:
-    """Get orders by customer email and/or phone - uses database if available."""
+    """Get orders by customer email or phone, newest first - uses database if available."""
     if db_service.is_available():
-        orders = db_service.get_orders_by_customer(email=email, phone=phone)
+        orders = await asyncio.to_thread(
+            db_service.get_orders_by_customer, email=email, phone=phone, limit=size, offset=(page - 1) * size
+        )
         return sanitize_orders(orders)
     
     # Fallback to in-memory
@@ -151,65 +163,75 @@ async def update_order_payment_status(
     return order
 
 
+def _product_image(product: Dict[str, Any], colors: List[Any]) -> Optional[str]:
+    """Image of the ordered colour, falling back to the product's cover image."""
+    # Try to get color-specific image
+    if colors and isinstance(product.get("colors"), list) and isinstance(product.get("color_images"), list):
+        color_index = None
+        for i, c in enumerate(product["colors"]):
+            if str(c).lower() == str(colors[0]).lower():
+                color_index = i
+                break
+        if color_index is not None and color_index < len(product.get("color_images", [])):
+            color_images = product["color_images"][color_index]
+            if isinstance(color_images, list) and len(color_images) > 0:
+                return color_images[0]
+    
+    # Fallback to cover image
+    if isinstance(product.get("images"), list):
+        cover_index = product.get("cover_image_index") or 0
+        if cover_index < len(product["images"]):
+            return product["images"][cover_index]
+    return None
+
+
 @router.get("/orders/{order_id}/invoice")
 async def get_invoice_data(order_id: str) -> Dict[str, Any]:
     """Get invoice data for an order - uses database if available."""
     if not db_service.is_available():
         raise HTTPException(status_code=503, detail="Invoice service unavailable")
     
-    order_data = db_service.get_complete_order_for_invoice(order_id)
+    cached = invoice_cache.get(order_id)
+    if cached is not None:
+        return cached
+    
+    # Order, product, vendor and line items in one round trip
+    order_data = await asyncio.to_thread(db_service.get_complete_order_for_invoice, order_id)
     if not order_data:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    # Build invoice items
-    items = []
+    # Normalized line items written at checkout
+    items = invoice_items(order_data.get("items") or [])
     
-    # Try to get items from applied_offer (consolidated items from checkout)
-    try:
-        applied_offer = order_data.get("applied_offer")
-        if applied_offer:
-            if isinstance(applied_offer, str):
-                import json
-                applied_offer = json.loads(applied_offer)
-            
-            if isinstance(applied_offer, dict) and isinstance(applied_offer.get("items"), list):
-                for it in applied_offer["items"]:
-                    items.append({
-                        "name": it.get("name", ""),
-                        "quantity": int(it.get("quantity", 1)),
-                        "price": float(it.get("price", 0)),
-                        "total": float(it.get("price", 0)) * int(it.get("quantity", 1)),
-                        "image": it.get("image"),
-                        "colors": [it.get("color")] if it.get("color") else (it.get("colors") or []),
-                        "sizes": [it.get("size")] if it.get("size") else (it.get("sizes") or []),
-                        "sareeId": it.get("sareeId")
-                    })
-    except Exception as e:
-        print(f"Error parsing applied_offer: {e}")
+    # Orders created before order_items existed: consolidated items from applied_offer
+    if not items:
+        applied_offer = parse_applied_offer(order_data.get("applied_offer"))
+        if applied_offer and isinstance(applied_offer.get("items"), list):
+            for it in applied_offer["items"]:
+                product_id = it.get("productId") or it.get("product_id")
+                items.append({
+                    "productId": str(product_id) if product_id is not None else None,
+                    "name": it.get("name", ""),
+                    "quantity": int(it.get("quantity", 1)),
+                    "price": float(it.get("price", 0)),
+                    "total": float(it.get("price", 0)) * int(it.get("quantity", 1)),
+                    "image": it.get("image"),
+                    "colors": [it.get("color")] if it.get("color") else (it.get("colors") or []),
+                    "sizes": [it.get("size")] if it.get("size") else (it.get("sizes") or []),
+                    "sareeId": it.get("sareeId")
+                })
+    
+    product = order_data.get("product") or {}
+    product_colors = order_data.get("product_colors") or []
+    
+    # Lines of the order's own product may carry no image; other lines keep theirs (or none)
+    for item in items:
+        if not item.get("image") and product and item.get("productId") == str(product.get("id")):
+            item["image"] = _product_image(product, item.get("colors") or product_colors)
     
     # If no consolidated items, build from single product
     if not items:
-        product = order_data.get("product") or {}
-        selected_image = None
-        
-        # Try to get color-specific image
-        product_colors = order_data.get("product_colors") or []
-        if product_colors and isinstance(product.get("colors"), list) and isinstance(product.get("color_images"), list):
-            color_index = None
-            for i, c in enumerate(product["colors"]):
-                if str(c).lower() == str(product_colors[0]).lower():
-                    color_index = i
-                    break
-            if color_index is not None and color_index < len(product.get("color_images", [])):
-                color_images = product["color_images"][color_index]
-                if isinstance(color_images, list) and len(color_images) > 0:
-                    selected_image = color_images[0]
-        
-        # Fallback to cover image
-        if not selected_image and isinstance(product.get("images"), list):
-            cover_index = product.get("cover_image_index", 0)
-            if cover_index < len(product["images"]):
-                selected_image = product["images"][cover_index]
+        selected_image = _product_image(product, product_colors)
         
         quantity = int(order_data.get("quantity", 1))
         amount = float(order_data.get("amount", 0))
@@ -265,5 +287,9 @@ async def get_invoice_data(order_id: str) -> Dict[str, Any]:
         "coverImageIndex": (order_data.get("product") or {}).get("cover_image_index", 0)
     }
     
+    # Paid / failed invoices no longer change; pending ones are rebuilt each time
+    if payment_status_hub.is_final(order_data):
+        invoice_cache.put(invoice_data["orderId"], invoice_data, aliases=[order_id, order_data.get("id")])
+    
     return invoice_data
 
@@ -6,6 +6,7 @@ Reference: https://docs.easebuzz.in/docs/payment-gateway/jl5acj6genz7q-python
 
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import hmac
 from typing import Any, Dict, Optional
@@ -24,6 +25,9 @@ except ImportError:
     print("Warning: Easebuzz SDK not installed. Install with: pip install easebuzz")
 
 from ...services.db_service import db_service
+from ...services.gateway_config import gateway_configs
+from ...services.gateway_http import gateway_http
+from ...services.webhook_pipeline import WebhookEvent, webhook_pipeline
 from ...config import get_settings
 
 router = APIRouter(prefix="/payments/easebuzz", tags=["easebuzz"])
@@ -43,53 +47,33 @@ class EasebuzzInitiateRequest(BaseModel):
 
 
 def get_easebuzz_config() -> Optional[Dict[str, Any]]:
-    """Get Easebuzz configuration from database."""
-    if not db_service.is_available():
-        return None
-    
-    try:
-        # Get payment config from database
-        configs = db_service.admin_get_all("payment_config", filters={"payment_method": "easebuzz"})
-        if configs and len(configs) > 0:
-            config = configs[0]
-            encrypted_keys = config.get("encrypted_keys", {})
-            configuration = config.get("configuration", {})
-            
-            # Merge encrypted_keys and configuration
-            merged_config = {}
-            if isinstance(encrypted_keys, dict):
-                if "encrypted_data" in encrypted_keys:
-                    merged_config.update(encrypted_keys["encrypted_data"])
-                else:
-                    merged_config.update(encrypted_keys)
-            if isinstance(configuration, dict):
-                merged_config.update(configuration)
-            
-            return merged_config if merged_config else None
-    except Exception as e:
-        print(f"Error getting Easebuzz config: {e}")
-    
-    return None
+    """Get Easebuzz configuration from the in-memory gateway config cache."""
+    config = gateway_configs.easebuzz()
+    return config.as_dict() if config else None
+
+
+# SDK client built for the currently cached config
+_easebuzz_api: Optional[Any] = None
+_easebuzz_api_config: Optional[Any] = None
 
 
 def get_easebuzz_api() -> Optional[Any]:
-    """Initialize and return Easebuzz API instance using official SDK."""
+    """Return the Easebuzz API instance (official SDK) for the current config."""
+    global _easebuzz_api, _easebuzz_api_config
     if not EASEBUZZ_SDK_AVAILABLE:
         return None
     
-    config = get_easebuzz_config()
-    if not config:
+    config = gateway_configs.easebuzz()
+    if not config or not config.merchant_key or not config.salt:
         return None
     
-    merchant_key = config.get("merchantKey") or config.get("merchant_key") or config.get("merchantKey")
-    salt = config.get("salt") or config.get("saltKey")
-    environment = config.get("environment", "test")  # 'test' or 'prod'
-    
-    if not merchant_key or not salt:
-        return None
+    if config is _easebuzz_api_config and _easebuzz_api is not None:
+        return _easebuzz_api
     
     try:
-        return EasebuzzAPIs(merchant_key, salt, environment)
+        _easebuzz_api = EasebuzzAPIs(config.merchant_key, config.salt, config.environment)
+        _easebuzz_api_config = config
+        return _easebuzz_api
     except Exception as e:
         print(f"Error initializing Easebuzz API: {e}")
         return None
@@ -119,6 +103,16 @@ def generate_easebuzz_hash(data: Dict[str, Any], salt: str) -> str:
     return hashlib.sha512(hash_string.encode()).hexdigest()
 
 
+def verify_easebuzz_response_hash(data: Dict[str, Any], salt: str) -> bool:
+    """Verify the reverse hash Easebuzz sends with a payment response/webhook."""
+    # Reverse hash format: hash(salt|status|udf10|udf9|...|udf1|email|firstname|productinfo|amount|txnid|key)
+    fields = [salt, data.get("status", "")]
+    fields += [data.get(f"udf{i}", "") for i in range(10, 0, -1)]
+    fields += [data.get(name, "") for name in ("email", "firstname", "productinfo", "amount", "txnid", "key")]
+    expected = hashlib.sha512("|".join(str(v) for v in fields).encode()).hexdigest()
+    return hmac.compare_digest(expected, str(data.get("hash", "")).lower())
+
+
 @router.post("/initiate")
 async def initiate_easebuzz_payment(request: EasebuzzInitiateRequest) -> Dict[str, Any]:
     """
@@ -143,8 +137,8 @@ async def initiate_easebuzz_payment(request: EasebuzzInitiateRequest) -> Dict[st
                     'udf2': request.order_id,
                 }
                 
-                # Use official SDK method
-                response = easebuzz_api.initiate_payment_api(payment_params)
+                # Use official SDK method (blocking HTTP inside the SDK, so run it off the event loop)
+                response = await asyncio.to_thread(easebuzz_api.initiate_payment_api, payment_params)
                 
                 if isinstance(response, dict) and response.get("status") == 1:
                     access_key = response.get("data", "")
@@ -240,13 +234,11 @@ async def initiate_easebuzz_payment(request: EasebuzzInitiateRequest) -> Dict[st
         payment_data["hash"] = hash_value
         
         # Call Easebuzz API manually
-        import requests
         easebuzz_url = "https://pay.easebuzz.in/payment/initiate"
         
-        response = requests.post(
+        response = await gateway_http.client("easebuzz").post(
             easebuzz_url,
             data=payment_data,
-            timeout=30
         )
         
         if response.status_code != 200:
@@ -354,73 +346,48 @@ async def easebuzz_webhook(
             payment_status = "failed"
             order_status = "cancelled"
         
-        # Store webhook
-        if db_service.is_available():
-            try:
-                webhook_record = {
-                    "gateway": "easebuzz",
-                    "order_id": order_id,
-                    "transaction_id": mihpayid or txnid,
-                    "payment_id": mihpayid,
-                    "status": status,
-                    "payment_status": payment_status,
-                    "amount": float(amount) if amount else 0,
-                    "raw_payload": webhook_data,
-                    "headers": headers_dict,
-                    "signature": webhook_data.get("hash", ""),
-                    "processed": False,
-                    "created_at": datetime.utcnow().isoformat(),
-                }
-                db_service.admin_create("payment_webhooks", webhook_record)
-            except Exception as e:
-                print(f"Error storing webhook: {e}")
+        # Verify the reverse hash when the salt is configured
+        signature_verified = None
+        config = gateway_configs.easebuzz()
+        if config and config.salt and webhook_data.get("hash"):
+            signature_verified = verify_easebuzz_response_hash(webhook_data, config.salt)
+            if not signature_verified:
+                print(f"⚠️  Easebuzz webhook hash mismatch for order {order_id}")
         
-        # Update order
-        if order_id and db_service.is_available():
-            try:
-                # Get existing order
-                orders = db_service.admin_get_all("orders", filters={"order_id": order_id})
-                if orders and len(orders) > 0:
-                    order = orders[0]
-                    update_data = {
-                        "payment_status": payment_status,
-                        "status": order_status,
-                        "transaction_id": mihpayid or txnid,
-                        "payment_gateway_response": webhook_data,
-                        "updated_at": datetime.utcnow().isoformat(),
-                    }
-                    db_service.admin_update("orders", order.get("id"), update_data)
-                    
-                    # Mark webhook as processed
-                    if db_service.is_available():
-                        try:
-                            webhooks = db_service.admin_get_all(
-                                "payment_webhooks",
-                                filters={"order_id": order_id, "transaction_id": mihpayid or txnid}
-                            )
-                            if webhooks:
-                                db_service.admin_update(
-                                    "payment_webhooks",
-                                    webhooks[0].get("id"),
-                                    {"processed": True, "order_updated": True, "processed_at": datetime.utcnow().isoformat()}
-                                )
-                        except:
-                            pass
-                    
-                    # Broadcast WebSocket update
-                    try:
-                        from .websocket import broadcast_payment_update
-                        await broadcast_payment_update(order_id, order_status, payment_status, mihpayid or txnid)
-                    except Exception as ws_error:
-                        print(f"WebSocket broadcast error: {ws_error}")
-            except Exception as e:
-                print(f"Error updating order: {e}")
+        # Record, dedupe and queue; the order is updated in the background
+        event = WebhookEvent(
+            gateway="easebuzz",
+            order_id=order_id,
+            payment_id=mihpayid or txnid,
+            status=status,
+            payment_status=payment_status,
+            order_status=order_status,
+            transaction_id=mihpayid or txnid,
+            payload=webhook_data,
+            signature_verified=signature_verified,
+            record={
+                "gateway": "easebuzz",
+                "order_id": order_id,
+                "transaction_id": mihpayid or txnid,
+                "payment_id": mihpayid,
+                "status": status,
+                "payment_status": payment_status,
+                "amount": float(amount) if amount else 0,
+                "raw_payload": webhook_data,
+                "headers": headers_dict,
+                "signature": webhook_data.get("hash", ""),
+                "signature_verified": bool(signature_verified),
+                "processed": False,
+                "created_at": datetime.utcnow().isoformat(),
+            },
+        )
+        await webhook_pipeline.submit(event)
         
         # Always return 200 as per Easebuzz requirements
         return JSONResponse(
             content={
                 "success": True,
-                "message": "Webhook processed successfully",
+                "message": "Webhook received",
                 "orderId": order_id,
                 "status": payment_status
             },
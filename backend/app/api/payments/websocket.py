@@ -6,25 +6,120 @@ from __future__ import annotations
 
 import json
 import asyncio
-from typing import Dict, Set, Any
+from typing import Dict, List, Optional, Set, Any
 from datetime import datetime
+from uuid import uuid4
 
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 
+from ...config import get_settings
+from ...services.broadcast import payment_broadcast
 from ...services.db_service import db_service
+from ...services.payment_status import payment_status_hub
 
 router = APIRouter(prefix="/ws", tags=["websocket"], include_in_schema=True)
+settings = get_settings()
+
+SSE_KEEPALIVE_SECONDS = 15
+
+
+class ConnectionAuditLog:
+    """
+    Optional audit trail of WebSocket connections in `websocket_connections`.
+
+    Connects and disconnects are buffered in memory and written by a
+    background task every few seconds, off the event loop. A socket that
+    connects and disconnects between two flushes costs a single insert.
+    """
+
+    def __init__(self) -> None:
+        self.settings = get_settings()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._closed: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def enabled(self) -> bool:
+        return self.settings.websocket_audit_enabled and db_service.is_available()
+
+    def _ensure_flusher(self) -> None:
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._run())
+            except RuntimeError:
+                # No running loop; the buffer is written on the next flush
+                pass
+
+    def record_connect(self, connection_id: str, order_id: str, connection_type: str, connected_at: str) -> None:
+        if not self.enabled():
+            return
+        self._pending[connection_id] = {
+            "connection_id": connection_id,
+            "order_id": order_id,
+            "connection_type": connection_type,
+            "is_active": True,
+            "connected_at": connected_at,
+            # Every row of a batched insert has the same columns
+            "disconnected_at": None,
+        }
+        self._ensure_flusher()
+
+    def record_disconnect(self, connection_id: str) -> None:
+        if not self.enabled():
+            return
+        update = {"is_active": False, "disconnected_at": datetime.utcnow().isoformat()}
+        if connection_id in self._pending:
+            self._pending[connection_id].update(update)
+        else:
+            self._closed[connection_id] = update
+        self._ensure_flusher()
+
+    def _write(self, created: List[Dict[str, Any]], closed: Dict[str, Dict[str, Any]]) -> None:
+        # One multi-row insert and one update per flush, however many sockets came and went
+        db_service.create_websocket_connections(created)
+        db_service.close_websocket_connections(
+            [{"connection_id": connection_id, "disconnected_at": update["disconnected_at"]}
+             for connection_id, update in closed.items()]
+        )
+
+    async def flush(self) -> None:
+        if not self._pending and not self._closed:
+            return
+        created, self._pending = list(self._pending.values()), {}
+        closed, self._closed = self._closed, {}
+        await asyncio.to_thread(self._write, created, closed)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.websocket_audit_flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Error flushing connection audit: {e}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error flushing connection audit: {e}")
 
 
 class ConnectionManager:
-    """Manages WebSocket connections."""
+    """Manages WebSocket connections held by this worker (in memory only)."""
     
     def __init__(self):
         # Store connections by order_id
         self.active_connections: Dict[str, Set[WebSocket]] = {}
         # Store connection metadata
         self.connection_metadata: Dict[WebSocket, Dict[str, Any]] = {}
+        self.audit = ConnectionAuditLog()
     
     async def connect(self, websocket: WebSocket, order_id: str, connection_type: str = "payment_status"):
         """Connect a WebSocket client."""
@@ -33,31 +128,22 @@ class ConnectionManager:
         if order_id not in self.active_connections:
             self.active_connections[order_id] = set()
         
+        connected_at = datetime.utcnow().isoformat()
+        connection_id = f"ws_{order_id}_{uuid4().hex[:12]}"
         self.active_connections[order_id].add(websocket)
         self.connection_metadata[websocket] = {
+            "connection_id": connection_id,
             "order_id": order_id,
             "connection_type": connection_type,
-            "connected_at": datetime.utcnow().isoformat(),
+            "connected_at": connected_at,
         }
-        
-        # Store connection in database
-        if db_service.is_available():
-            try:
-                connection_id = f"ws_{order_id}_{int(datetime.utcnow().timestamp())}"
-                connection_data = {
-                    "connection_id": connection_id,
-                    "order_id": order_id,
-                    "connection_type": connection_type,
-                    "is_active": True,
-                    "connected_at": datetime.utcnow().isoformat(),
-                }
-                db_service.admin_create("websocket_connections", connection_data)
-            except Exception as e:
-                print(f"Error storing connection: {e}")
+        self.audit.record_connect(connection_id, order_id, connection_type, connected_at)
     
     def disconnect(self, websocket: WebSocket):
         """Disconnect a WebSocket client."""
-        metadata = self.connection_metadata.get(websocket, {})
+        metadata = self.connection_metadata.pop(websocket, None)
+        if metadata is None:
+            return
         order_id = metadata.get("order_id")
         
         if order_id and order_id in self.active_connections:
@@ -65,27 +151,10 @@ class ConnectionManager:
             if not self.active_connections[order_id]:
                 del self.active_connections[order_id]
         
-        if websocket in self.connection_metadata:
-            del self.connection_metadata[websocket]
-        
-        # Update connection in database
-        if db_service.is_available() and order_id:
-            try:
-                connections = db_service.admin_get_all(
-                    "websocket_connections",
-                    filters={"order_id": order_id, "is_active": True}
-                )
-                if connections:
-                    db_service.admin_update(
-                        "websocket_connections",
-                        connections[0].get("id"),
-                        {
-                            "is_active": False,
-                            "disconnected_at": datetime.utcnow().isoformat(),
-                        }
-                    )
-            except Exception as e:
-                print(f"Error updating connection: {e}")
+        self.audit.record_disconnect(metadata["connection_id"])
+    
+    def stats(self) -> Dict[str, int]:
+        return {"orders": len(self.active_connections), "connections": len(self.connection_metadata)}
     
     async def send_personal_message(self, message: Dict[str, Any], websocket: WebSocket):
         """Send message to a specific WebSocket."""
@@ -98,7 +167,7 @@ class ConnectionManager:
         """Broadcast message to all connections for an order."""
         if order_id in self.active_connections:
             disconnected = set()
-            for connection in self.active_connections[order_id]:
+            for connection in list(self.active_connections[order_id]):
                 try:
                     await connection.send_json(message)
                 except:
@@ -119,20 +188,18 @@ async def payment_status_websocket(websocket: WebSocket, order_id: str):
     
     try:
         # Send initial status
-        if db_service.is_available():
-            try:
-                orders = db_service.admin_get_all("orders", filters={"order_id": order_id})
-                if orders:
-                    order = orders[0]
-                    await manager.send_personal_message({
-                        "type": "payment_status",
-                        "order_id": order_id,
-                        "status": order.get("status"),
-                        "payment_status": order.get("payment_status"),
-                        "transaction_id": order.get("transaction_id"),
-                    }, websocket)
-            except:
-                pass
+        try:
+            snapshot = (await payment_status_hub.get(order_id)).snapshot
+            if snapshot:
+                await manager.send_personal_message({
+                    "type": "payment_status",
+                    "order_id": order_id,
+                    "status": snapshot.get("status"),
+                    "payment_status": snapshot.get("payment_status"),
+                    "transaction_id": snapshot.get("transaction_id"),
+                }, websocket)
+        except:
+            pass
         
         # Keep connection alive and listen for messages
         while True:
@@ -154,43 +221,65 @@ async def payment_status_websocket(websocket: WebSocket, order_id: str):
 
 
 @router.get("/payment-status/{order_id}/poll")
-async def poll_payment_status(order_id: str) -> Dict[str, Any]:
-    """Poll payment status (alternative to WebSocket)."""
+async def poll_payment_status(
+    order_id: str,
+    version: Optional[int] = Query(None, description="Version from the previous response; waits until the status differs"),
+    wait: int = Query(0, ge=0, description="Seconds to wait for a change (long-poll)"),
+) -> Dict[str, Any]:
+    """
+    Poll payment status (alternative to WebSocket).
+
+    Pass the `version` of the last response plus `wait` to long-poll: the
+    request returns as soon as the status changes, or with the unchanged
+    status when the wait runs out.
+    """
     if not db_service.is_available():
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        # Get from payment session
-        sessions = db_service.admin_get_all("payment_sessions", filters={"order_id": order_id})
-        if sessions:
-            session = sessions[0]
-            return {
-                "order_id": order_id,
-                "gateway": session.get("gateway"),
-                "status": session.get("status"),
-                "payment_status": session.get("payment_status"),
-                "transaction_id": session.get("transaction_id"),
-                "amount": session.get("amount"),
-            }
-        
-        # Get from order
-        orders = db_service.admin_get_all("orders", filters={"order_id": order_id})
-        if orders:
-            order = orders[0]
-            return {
-                "order_id": order_id,
-                "status": order.get("status"),
-                "payment_status": order.get("payment_status"),
-                "transaction_id": order.get("transaction_id"),
-                "amount": order.get("amount"),
-            }
-        
-        raise HTTPException(status_code=404, detail="Order not found")
+        timeout = min(wait, settings.payment_status_max_wait_seconds)
+        entry = await payment_status_hub.wait_for_change(order_id, version, timeout)
+        if not entry.snapshot:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return {**entry.snapshot, "version": entry.version}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/payment-status/{order_id}/events")
+async def payment_status_events(order_id: str, request: Request) -> StreamingResponse:
+    """Server-Sent Events stream of payment status; ends once the payment is final."""
+    if not db_service.is_available():
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    entry = await payment_status_hub.get(order_id)
+    if not entry.snapshot:
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    async def stream():
+        current = entry
+        deadline = asyncio.get_running_loop().time() + settings.payment_status_stream_seconds
+        yield f"id: {current.version}\nevent: payment_status\ndata: {json.dumps(current.snapshot, default=str)}\n\n"
+        while not payment_status_hub.is_final(current.snapshot):
+            if await request.is_disconnected() or asyncio.get_running_loop().time() > deadline:
+                return
+            changed = await payment_status_hub.wait_for_change(order_id, current.version, SSE_KEEPALIVE_SECONDS)
+            if changed.version == current.version:
+                yield ": keepalive\n\n"
+                continue
+            current = changed
+            yield f"id: {current.version}\nevent: payment_status\ndata: {json.dumps(current.snapshot, default=str)}\n\n"
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Helper function to broadcast payment status updates
 async def broadcast_payment_update(order_id: str, status: str, payment_status: str, transaction_id: str = None):
     """Broadcast payment status update to all connected clients."""
@@ -202,5 +291,16 @@ async def broadcast_payment_update(order_id: str, status: str, payment_status: s
         "transaction_id": transaction_id,
         "timestamp": datetime.utcnow().isoformat(),
     }
-    await manager.broadcast_to_order(order_id, message)
+    # Every worker receives it and delivers to its own sockets
+    await payment_broadcast.publish(message)
+
+
+async def deliver_payment_update(message: Dict[str, Any]) -> None:
+    """Deliver a broadcast message to the sockets connected to this worker."""
+    order_id = message.get("order_id")
+    if order_id:
+        await manager.broadcast_to_order(order_id, message)
+
+
+payment_broadcast.subscribe(deliver_payment_update)
 
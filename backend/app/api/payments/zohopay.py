@@ -10,13 +10,16 @@ import hashlib
 import traceback
 from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
-import requests
 
 from fastapi import APIRouter, HTTPException, Request, Body, Header
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from ...services.db_service import db_service
+from ...services.gateway_config import gateway_configs
+from ...services.gateway_http import gateway_http
+from ...services.token_refresher import get_zoho_token_row, store_zoho_token
+from ...services.webhook_pipeline import WebhookEvent, webhook_pipeline
 from ...config import get_settings
 
 router = APIRouter(prefix="/payments/zohopay", tags=["zohopay"])
@@ -54,124 +57,9 @@ class ZohoPayInitiateRequest(BaseModel):
 
 
 def get_zohopay_config() -> Optional[Dict[str, Any]]:
-    """Get ZohoPay configuration from database."""
-    if not db_service.is_available():
-        print("[get_zohopay_config] Database service not available")
-        return None
-    
-    try:
-        # Get payment config
-        print("[get_zohopay_config] Fetching payment_config...")
-        configs = db_service.admin_get_all("payment_config", filters={"payment_method": "zohopay"})
-        print(f"[get_zohopay_config] Found {len(configs) if configs else 0} config(s)")
-        
-        if configs and len(configs) > 0:
-            config = configs[0]
-            print(f"[get_zohopay_config] Config keys: {list(config.keys())}")
-            encrypted_keys = config.get("encrypted_keys", {})
-            print(f"[get_zohopay_config] encrypted_keys type: {type(encrypted_keys).__name__}")
-            
-            encrypted_data = None
-            if isinstance(encrypted_keys, dict):
-                if "encrypted_data" in encrypted_keys:
-                    encrypted_data = encrypted_keys["encrypted_data"]
-                    print(f"[get_zohopay_config] encrypted_data keys: {list(encrypted_data.keys()) if isinstance(encrypted_data, dict) else 'not a dict'}")
-                else:
-                    # encrypted_keys itself might be the data
-                    encrypted_data = encrypted_keys
-                    print(f"[get_zohopay_config] Using encrypted_keys directly, keys: {list(encrypted_keys.keys())}")
-            
-            if isinstance(encrypted_data, dict):
-                # Normalize keys: handle both camelCase and snake_case
-                normalized_config = {}
-                
-                # Map camelCase to snake_case
-                key_mapping = {
-                    "accountId": "account_id",
-                    "account_id": "account_id",
-                    "accessToken": "access_token",
-                    "access_token": "access_token",
-                    "apiKey": "api_key",
-                    "api_key": "api_key",
-                    "refreshToken": "refresh_token",
-                    "refresh_token": "refresh_token",
-                    "clientId": "client_id",
-                    "client_id": "client_id",
-                    "clientSecret": "client_secret",
-                    "client_secret": "client_secret",
-                    "domain": "domain",
-                    "environment": "environment",
-                }
-                
-                for key, value in encrypted_data.items():
-                    # Map to normalized key
-                    normalized_key = key_mapping.get(key, key)
-                    normalized_config[normalized_key] = value
-                    # Also keep original key for backward compatibility
-                    if normalized_key != key:
-                        normalized_config[key] = value
-                
-                # Ensure we have account_id (from accountId)
-                if "account_id" not in normalized_config and "accountId" in encrypted_data:
-                    normalized_config["account_id"] = encrypted_data["accountId"]
-                
-                # Ensure we have access_token (from accessToken or access_token)
-                if "access_token" not in normalized_config:
-                    if "accessToken" in encrypted_data:
-                        normalized_config["access_token"] = encrypted_data["accessToken"]
-                    elif "access_token" in encrypted_data:
-                        normalized_config["access_token"] = encrypted_data["access_token"]
-                
-                # Ensure we have api_key (from apiKey or access_token)
-                if "api_key" not in normalized_config:
-                    if "apiKey" in encrypted_data:
-                        normalized_config["api_key"] = encrypted_data["apiKey"]
-                    elif "access_token" in normalized_config:
-                        normalized_config["api_key"] = normalized_config["access_token"]
-                
-                # Set domain (default to IN for India)
-                if "domain" not in normalized_config:
-                    normalized_config["domain"] = "IN"
-                
-                print(f"[get_zohopay_config] Normalized config keys: {list(normalized_config.keys())}")
-                return normalized_config
-        
-        # Try to get from zoho_oauth_tokens (without limit parameter)
-        print("[get_zohopay_config] Trying zoho_oauth_tokens...")
-        try:
-            tokens = db_service.admin_get_all("zoho_oauth_tokens")
-            if tokens and len(tokens) > 0:
-                token = tokens[0]
-                print(f"[get_zohopay_config] Found token in zoho_oauth_tokens")
-                print(f"[get_zohopay_config] Token keys: {list(token.keys())}")
-                print(f"[get_zohopay_config] account_id: {token.get('account_id')}")
-                print(f"[get_zohopay_config] api_key: {token.get('api_key')}")
-                # Return all necessary fields including account_id and api_key
-                config = {
-                    "access_token": token.get("access_token"),
-                    "api_key": token.get("api_key") or token.get("access_token"),  # Use api_key if available, fallback to access_token
-                    "api_domain": token.get("api_domain"),
-                    "domain": "IN",  # Default domain for ZohoPay
-                }
-                # Add account_id if available
-                if token.get("account_id"):
-                    config["account_id"] = token.get("account_id")
-                # Add refresh_token if available
-                if token.get("refresh_token"):
-                    config["refresh_token"] = token.get("refresh_token")
-                print(f"[get_zohopay_config] Returning config with keys: {list(config.keys())}")
-                return config
-        except Exception as e:
-            print(f"[get_zohopay_config] Error fetching zoho_oauth_tokens: {e}")
-            import traceback
-            traceback.print_exc()
-        
-        print("[get_zohopay_config] No config found")
-    except Exception as e:
-        print(f"[get_zohopay_config] Error: {e}")
-        traceback.print_exc()
-    
-    return None
+    """Get ZohoPay configuration from the in-memory gateway config cache."""
+    config = gateway_configs.zohopay()
+    return config.as_dict() if config else None
 
 
 @router.post("/oauth/exchange")
@@ -189,11 +77,10 @@ async def exchange_oauth_token(request: ZohoOAuthExchangeRequest) -> Dict[str, A
             "code": request.auth_code,
         }
         
-        response = requests.post(
+        response = await gateway_http.client("zohopay").post(
             token_url,
             data=payload,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
-            timeout=30
         )
         
         if response.status_code not in [200, 201]:
@@ -243,14 +130,8 @@ async def exchange_oauth_token(request: ZohoOAuthExchangeRequest) -> Dict[str, A
                     "created_at": datetime.utcnow().isoformat(),
                 }
                 
-                # Check if token exists
-                existing_tokens = db_service.admin_get_all("zoho_oauth_tokens", limit=1)
-                if existing_tokens:
-                    # Update existing token
-                    db_service.admin_update("zoho_oauth_tokens", existing_tokens[0].get("id"), token_data)
-                else:
-                    # Create new token
-                    db_service.admin_create("zoho_oauth_tokens", token_data)
+                # Update the existing token row or create it
+                store_zoho_token(token_data)
             except Exception as e:
                 print(f"Error storing OAuth tokens: {e}")
         
@@ -286,11 +167,10 @@ async def refresh_oauth_token(request: ZohoOAuthRefreshRequest) -> Dict[str, Any
             "refresh_token": request.refresh_token,
         }
         
-        response = requests.post(
+        response = await gateway_http.client("zohopay").post(
             token_url,
             data=payload,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
-            timeout=30
         )
         
         if response.status_code not in [200, 201]:
@@ -327,8 +207,8 @@ async def refresh_oauth_token(request: ZohoOAuthRefreshRequest) -> Dict[str, Any
                 api_key = request.api_key or access_token
                 
                 # Get existing token to preserve account_id if not provided in request
-                existing_tokens = db_service.admin_get_all("zoho_oauth_tokens", limit=1)
-                existing_account_id = existing_tokens[0].get("account_id") if existing_tokens else None
+                existing_token = get_zoho_token_row()
+                existing_account_id = existing_token.get("account_id") if existing_token else None
                 
                 token_data = {
                     "access_token": access_token,
@@ -342,13 +222,8 @@ async def refresh_oauth_token(request: ZohoOAuthRefreshRequest) -> Dict[str, Any
                     "updated_at": datetime.utcnow().isoformat(),
                 }
                 
-                # Update existing token
-                if existing_tokens:
-                    db_service.admin_update("zoho_oauth_tokens", existing_tokens[0].get("id"), token_data)
-                else:
-                    # Create new token if none exists
-                    token_data["created_at"] = datetime.utcnow().isoformat()
-                    db_service.admin_create("zoho_oauth_tokens", token_data)
+                # Update existing token (or create it if none exists)
+                store_zoho_token(token_data)
             except Exception as e:
                 print(f"Error storing refreshed token: {e}")
         
@@ -486,11 +361,10 @@ async def initiate_zohopay_payment(request: ZohoPayInitiateRequest) -> Dict[str,
             "Content-Type": "application/json",
         }
         
-        response = requests.post(
+        response = await gateway_http.client("zohopay").post(
             session_url,
             json=payment_payload,
             headers=headers,
-            timeout=30
         )
         
         print(f"[ZohoPay Initiate] Response Status: {response.status_code}")
@@ -604,7 +478,7 @@ async def zohopay_webhook(
         signature = x_zoho_webhook_signature or x_zoho_signature or ""
         
         # Verify signature if signing key is configured
-        signing_key = settings.phonepe_merchant_secret  # Reuse or add zohopay_signing_key
+        signing_key = settings.zohopay_webhook_signing_key or settings.phonepe_merchant_secret
         signature_verified = False
         if signing_key and signature:
             signature_verified = verify_webhook_signature(body_text, signature, signing_key)
@@ -632,73 +506,41 @@ async def zohopay_webhook(
             payment_status = "failed"
             order_status = "cancelled"
         
-        # Store webhook
-        if db_service.is_available():
-            try:
-                webhook_record = {
-                    "gateway": "zohopay",
-                    "order_id": reference_id,
-                    "transaction_id": payment_id,
-                    "payment_id": payment_id,
-                    "reference_id": reference_id,
-                    "status": status,
-                    "payment_status": payment_status,
-                    "amount": float(amount) if amount else 0,
-                    "raw_payload": webhook_data,
-                    "headers": headers_dict,
-                    "signature": signature,
-                    "signature_verified": signature_verified,
-                    "processed": False,
-                    "created_at": datetime.utcnow().isoformat(),
-                }
-                db_service.admin_create("payment_webhooks", webhook_record)
-            except Exception as e:
-                print(f"Error storing webhook: {e}")
-        
-        # Update order
-        if reference_id and db_service.is_available():
-            try:
-                orders = db_service.admin_get_all("orders", filters={"order_id": reference_id})
-                if orders and len(orders) > 0:
-                    order = orders[0]
-                    update_data = {
-                        "payment_status": payment_status,
-                        "status": order_status,
-                        "transaction_id": payment_id,
-                        "payment_gateway_response": webhook_data,
-                        "updated_at": datetime.utcnow().isoformat(),
-                    }
-                    db_service.admin_update("orders", order.get("id"), update_data)
-                    
-                    # Mark webhook as processed
-                    if db_service.is_available():
-                        try:
-                            webhooks = db_service.admin_get_all(
-                                "payment_webhooks",
-                                filters={"order_id": reference_id, "payment_id": payment_id}
-                            )
-                            if webhooks:
-                                db_service.admin_update(
-                                    "payment_webhooks",
-                                    webhooks[0].get("id"),
-                                    {"processed": True, "order_updated": True, "processed_at": datetime.utcnow().isoformat()}
-                                )
-                        except:
-                            pass
-                    
-                    # Broadcast WebSocket update
-                    try:
-                        from .websocket import broadcast_payment_update
-                        await broadcast_payment_update(reference_id, order_status, payment_status, payment_id)
-                    except Exception as ws_error:
-                        print(f"WebSocket broadcast error: {ws_error}")
-            except Exception as e:
-                print(f"Error updating order: {e}")
+        # Record, dedupe and queue; the order is updated in the background
+        event = WebhookEvent(
+            gateway="zohopay",
+            order_id=reference_id,
+            payment_id=payment_id or session_id,
+            status=status,
+            payment_status=payment_status,
+            order_status=order_status,
+            transaction_id=payment_id,
+            payload=webhook_data,
+            # Only a dedicated ZohoPay signing key is trusted to reject webhooks
+            signature_verified=signature_verified if settings.zohopay_webhook_signing_key else None,
+            record={
+                "gateway": "zohopay",
+                "order_id": reference_id,
+                "transaction_id": payment_id,
+                "payment_id": payment_id,
+                "reference_id": reference_id,
+                "status": status,
+                "payment_status": payment_status,
+                "amount": float(amount) if amount else 0,
+                "raw_payload": webhook_data,
+                "headers": headers_dict,
+                "signature": signature,
+                "signature_verified": signature_verified,
+                "processed": False,
+                "created_at": datetime.utcnow().isoformat(),
+            },
+        )
+        await webhook_pipeline.submit(event)
         
         return JSONResponse(
             content={
                 "status": 1,
-                "message": "Webhook processed successfully",
+                "message": "Webhook received",
                 "orderId": reference_id,
                 "paymentId": payment_id,
                 "status": payment_status
@@ -719,13 +561,6 @@ async def get_zohopay_widget_config() -> Dict[str, Any]:
     """Get ZohoPay configuration for frontend widget."""
     try:
         config = get_zohopay_config()
-        print(f"[ZohoPay Config] Retrieved config: {bool(config)}")
-        if config:
-            print(f"[ZohoPay Config] Keys in config: {list(config.keys())}")
-            print(f"[ZohoPay Config] account_id: {bool(config.get('account_id'))}")
-            print(f"[ZohoPay Config] access_token: {bool(config.get('access_token'))}")
-            print(f"[ZohoPay Config] api_key: {bool(config.get('api_key'))}")
-        
         if not config:
             # Return empty config instead of 404 - widget will show error message
             return {
@@ -739,10 +574,6 @@ async def get_zohopay_widget_config() -> Dict[str, Any]:
         api_key = config.get("api_key") or config.get("access_token", "")
         domain = config.get("domain", "IN")
         
-        print(f"[ZohoPay Config] Returning - account_id: {bool(account_id)}, api_key: {bool(api_key)}, domain: {domain}")
-        print(f"[ZohoPay Config] account_id value: {account_id[:20] if account_id else 'None'}...")
-        print(f"[ZohoPay Config] api_key value: {api_key[:20] if api_key else 'None'}...")
-        
         return {
             "account_id": account_id,
             "api_key": api_key,
@@ -823,8 +654,9 @@ async def debug_zohopay_config() -> Dict[str, Any]:
         except Exception as e:
             debug_info["zoho_oauth_tokens_error"] = str(e)
         
-        # Get parsed config
+        # Get parsed config (re-read so the debug view reflects the database)
         try:
+            gateway_configs.refresh("zohopay")
             parsed_config = get_zohopay_config()
             debug_info["parsed_config"] = {
                 "exists": bool(parsed_config),
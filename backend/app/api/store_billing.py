@@ -6,18 +6,24 @@ Handles invoice generation, discounts, stock management, holds, refunds, and mor
 
 from __future__ import annotations
 
+import asyncio
+import time
 from typing import Any, Dict, List, Optional
 from datetime import datetime
-from uuid import uuid4
 import json
 
 from fastapi import APIRouter, HTTPException, Body, Query
 from pydantic import BaseModel
 
+from ..config import get_settings
+from ..services.customer_search import normalize_phone
 from ..services.db_service import db_service
+from ..services.discounts import discount_service
 from ..services.email_service import email_service
+from ..services.held_carts import held_cart_store
 from ..services.sms_service import sms_service
 from ..services.invoice_pdf import invoice_pdf_service
+from ..services.pos_catalog import pos_catalog
 
 router = APIRouter(prefix="/store/billing", tags=["store-billing"])
 
@@ -59,6 +65,7 @@ class HoldTransaction(BaseModel):
     customer_phone: Optional[str] = None
     items: List[BillItemCreate]
     notes: Optional[str] = None
+    terminal_id: Optional[str] = None
 
 
 class RefundRequest(BaseModel):
@@ -80,81 +87,27 @@ async def get_store_products(
         return []
     
     try:
-        filters = {}
-        if category_id:
-            filters["category_id"] = category_id
-        
-        products = db_service.admin_get_all("products", order_by="name", desc=False, filters=filters)
-        
-        # Barcode search (by SKU)
+        # Served from the in-memory POS catalog; barcode scans use its SKU map
         if barcode:
-            products = [p for p in products if p.get("sku", "").upper() == barcode.upper()]
+            product = await pos_catalog.lookup_sku(barcode)
+            products = [product] if product else []
+        else:
+            products = await pos_catalog.products()
+        
+        if category_id:
+            products = [p for p in products if str(p.get("category_id")) == category_id]
         
         # Apply search filter
         if search:
             search_lower = search.lower()
             products = [
                 p for p in products
-                if search_lower in p.get("name", "").lower()
+                if search_lower in (p.get("name", "") or "").lower()
                 or search_lower in (p.get("sku", "") or "").lower()
                 or search_lower in (p.get("description", "") or "").lower()
             ]
         
-        # Enrich with category info and stock details
-        categories = db_service.admin_get_all("categories")
-        category_map = {c.get("id"): c for c in categories}
-        
-        result = []
-        for product in products:
-            # Parse color_stock
-            color_stock = product.get("color_stock", [])
-            if isinstance(color_stock, str):
-                try:
-                    color_stock = json.loads(color_stock)
-                except:
-                    color_stock = []
-            
-            # Calculate stock value
-            price = product.get("price", 0)
-            total_stock = product.get("total_stock", 0)
-            stock_value = price * total_stock
-            
-            # Get category name
-            cat_id = product.get("category_id")
-            category_name = category_map.get(cat_id, {}).get("name", "Uncategorized") if cat_id else "Uncategorized"
-            
-            # Parse color_images
-            color_images = product.get("color_images", [])
-            if isinstance(color_images, str):
-                try:
-                    color_images = json.loads(color_images)
-                except:
-                    color_images = []
-            if not isinstance(color_images, list):
-                color_images = []
-            
-            product_data = {
-                "id": product.get("id"),
-                "name": product.get("name"),
-                "sku": product.get("sku"),
-                "price": price,
-                "original_price": product.get("original_price"),
-                "images": product.get("images", []),
-                "colors": product.get("colors", []),
-                "color_images": color_images,  # Include color_images for display
-                "sizes": product.get("sizes", []),
-                "category_id": cat_id,
-                "category_name": category_name,
-                "total_stock": total_stock,
-                "stock_status": product.get("stock_status", "in_stock"),
-                "color_stock": color_stock,
-                "stock_value": stock_value,
-                "description": product.get("description"),
-            }
-            
-            result.append(product_data)
-        
-        return result
+        return products
     except Exception as e:
         print(f"Error fetching store products: {e}")
         import traceback
@@ -162,6 +115,36 @@ async def get_store_products(
         return []
 
 
+@router.get("/products/scan/{sku}")
+async def scan_product(sku: str) -> Dict[str, Any]:
+    """Look up a scanned barcode (product SKU)."""
+    if not db_service.is_available():
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    product = await pos_catalog.lookup_sku(sku)
+    if not product:
+        raise HTTPException(status_code=404, detail="No product with this SKU")
+    return product
+
+
+@router.get("/products/sync")
+async def sync_store_products(
+    updated_since: Optional[str] = Query(None),
+) -> Dict[str, Any]:
+    """
+    Catalog delta for POS terminals: products changed since `updated_since`
+    (the whole catalog without it). Pass `next_updated_since` from the
+    response on the next call; do a full sync now and then to drop deleted products.
+    """
+    if not db_service.is_available():
+        return {"products": [], "full": True, "next_updated_since": updated_since}
+    
+    try:
+        return await pos_catalog.changes_since(updated_since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/categories")
 async def get_store_categories() -> List[Dict[str, Any]]:
     """Get all categories for store billing."""
@@ -183,80 +166,122 @@ async def get_store_categories() -> List[Dict[str, Any]]:
         return []
 
 
-@router.get("/inventory-summary")
-async def get_inventory_summary() -> Dict[str, Any]:
-    """Get inventory summary with stock values and counts."""
-    if not db_service.is_available():
-        return {
-            "total_products": 0,
-            "total_stock": 0,
-            "total_stock_value": 0,
-            "low_stock_count": 0,
-            "out_of_stock_count": 0,
-            "category_breakdown": [],
-        }
+EMPTY_INVENTORY_SUMMARY = {
+    "total_products": 0,
+    "total_stock": 0,
+    "total_stock_value": 0,
+    "low_stock_count": 0,
+    "out_of_stock_count": 0,
+    "category_breakdown": [],
+    "color_breakdown": [],
+}
+
+# Last computed inventory summary and when it expires (time.monotonic())
+_inventory_summary_cache: Dict[str, Any] = {"summary": None, "expires_at": 0.0}
+
+
+def _invalidate_inventory_summary() -> None:
+    _inventory_summary_cache["expires_at"] = 0.0
+
+
+def _compute_inventory_summary() -> Dict[str, Any]:
+    """Totals in Python, for databases without inventory_summary() (db/create_inventory_summary.sql)."""
+    products = db_service.admin_get_all("products")
+    categories = db_service.admin_get_all("categories")
+    category_map = {c.get("id"): c.get("name", "Uncategorized") for c in categories}
     
-    try:
-        products = db_service.admin_get_all("products")
-        categories = db_service.admin_get_all("categories")
-        category_map = {c.get("id"): c.get("name", "Uncategorized") for c in categories}
+    total_stock = 0
+    total_stock_value = 0
+    low_stock_count = 0
+    out_of_stock_count = 0
+    category_breakdown = {}
+    color_breakdown = {}
+    
+    for product in products:
+        stock = product.get("total_stock", 0) or 0
+        price = product.get("price", 0) or 0
+        stock_value = stock * price
         
-        total_products = len(products)
-        total_stock = 0
-        total_stock_value = 0
-        low_stock_count = 0
-        out_of_stock_count = 0
-        category_breakdown = {}
+        total_stock += stock
+        total_stock_value += stock_value
         
-        for product in products:
-            stock = product.get("total_stock", 0)
-            price = product.get("price", 0)
-            stock_value = stock * price
-            
-            total_stock += stock
-            total_stock_value += stock_value
-            
-            status = product.get("stock_status", "in_stock")
-            if status == "low_stock":
-                low_stock_count += 1
-            elif status == "out_of_stock":
-                out_of_stock_count += 1
-            
-            category_id = product.get("category_id")
-            category_name = category_map.get(category_id, "Uncategorized") if category_id else "Uncategorized"
-            
-            if category_name not in category_breakdown:
-                category_breakdown[category_name] = {
-                    "category_name": category_name,
-                    "product_count": 0,
-                    "total_stock": 0,
-                    "stock_value": 0,
-                }
-            
-            category_breakdown[category_name]["product_count"] += 1
-            category_breakdown[category_name]["total_stock"] += stock
-            category_breakdown[category_name]["stock_value"] += stock_value
+        status = product.get("stock_status", "in_stock")
+        if status == "low_stock":
+            low_stock_count += 1
+        elif status == "out_of_stock":
+            out_of_stock_count += 1
         
-        return {
-            "total_products": total_products,
-            "total_stock": total_stock,
-            "total_stock_value": total_stock_value,
-            "low_stock_count": low_stock_count,
-            "out_of_stock_count": out_of_stock_count,
-            "category_breakdown": list(category_breakdown.values()),
-        }
+        category_id = product.get("category_id")
+        category_name = category_map.get(category_id, "Uncategorized") if category_id else "Uncategorized"
+        
+        if category_name not in category_breakdown:
+            category_breakdown[category_name] = {
+                "category_name": category_name,
+                "product_count": 0,
+                "total_stock": 0,
+                "stock_value": 0,
+            }
+        
+        category_breakdown[category_name]["product_count"] += 1
+        category_breakdown[category_name]["total_stock"] += stock
+        category_breakdown[category_name]["stock_value"] += stock_value
+        
+        color_stock = product.get("color_stock") or []
+        if isinstance(color_stock, str):
+            try:
+                color_stock = json.loads(color_stock)
+            except ValueError:
+                color_stock = []
+        colors_seen = set()
+        for entry in color_stock if isinstance(color_stock, list) else []:
+            color = str(entry.get("color") or "").strip() if isinstance(entry, dict) else ""
+            if not color:
+                continue
+            key = color.lower()
+            bucket = color_breakdown.setdefault(key, {"color": color, "product_count": 0, "total_stock": 0, "stock_value": 0})
+            if key not in colors_seen:
+                colors_seen.add(key)
+                bucket["product_count"] += 1
+            color_units = float(entry.get("stock") or 0)
+            bucket["total_stock"] += color_units
+            bucket["stock_value"] += color_units * price
+    
+    return {
+        "total_products": len(products),
+        "total_stock": total_stock,
+        "total_stock_value": total_stock_value,
+        "low_stock_count": low_stock_count,
+        "out_of_stock_count": out_of_stock_count,
+        "category_breakdown": sorted(category_breakdown.values(), key=lambda c: c["category_name"]),
+        "color_breakdown": sorted(color_breakdown.values(), key=lambda c: c["total_stock"], reverse=True),
+    }
+
+
+@router.get("/inventory-summary")
+async def get_inventory_summary(
+    refresh: bool = Query(False),
+) -> Dict[str, Any]:
+    """Get inventory summary with stock values, counts and per-category / per-colour breakdowns."""
+    if not db_service.is_available():
+        return dict(EMPTY_INVENTORY_SUMMARY)
+    
+    cached = _inventory_summary_cache["summary"]
+    if cached is not None and not refresh and _inventory_summary_cache["expires_at"] > time.monotonic():
+        return cached
+    
+    try:
+        # One grouped query in the database; Python fallback when the function is not installed
+        summary = await asyncio.to_thread(db_service.get_inventory_summary)
+        if summary is None:
+            summary = await asyncio.to_thread(_compute_inventory_summary)
+        _inventory_summary_cache["summary"] = summary
+        _inventory_summary_cache["expires_at"] = time.monotonic() + get_settings().inventory_summary_cache_seconds
+        return summary
     except Exception as e:
         print(f"Error fetching inventory summary: {e}")
         import traceback
         traceback.print_exc()
-        return {
-            "total_products": 0,
-            "total_stock": 0,
-            "total_stock_value": 0,
-            "low_stock_count": 0,
-            "out_of_stock_count": 0,
-            "category_breakdown": [],
-        }
+        return dict(EMPTY_INVENTORY_SUMMARY)
 
 
 @router.get("/orders-summary")
@@ -327,48 +352,14 @@ async def get_orders_summary(
 @router.get("/customers/search")
 async def search_customers(
     query: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=50),
 ) -> List[Dict[str, Any]]:
-    """Search customers by name, phone, or email."""
+    """Search customers by name, phone, or email prefix (includes store-bill-only customers)."""
     if not db_service.is_available():
         return []
     
     try:
-        all_customers = db_service.admin_get_all("customers")
-        query_lower = query.lower()
-        
-        results = [
-            c for c in all_customers
-            if query_lower in (c.get("name", "") or "").lower()
-            or query_lower in (c.get("phone", "") or "").lower()
-            or query_lower in (c.get("email", "") or "").lower()
-        ]
-        
-        # Also search in store bills for customers
-        store_bills = db_service.admin_get_all("store_bills")
-        bill_customers = {}
-        for bill in store_bills:
-            phone = bill.get("customer_phone")
-            name = bill.get("customer_name")
-            if phone and query_lower in (phone or "").lower():
-                if phone not in bill_customers:
-                    bill_customers[phone] = {
-                        "id": f"bill_customer_{phone}",
-                        "name": name,
-                        "phone": phone,
-                        "email": bill.get("customer_email"),
-                        "total_spent": 0,
-                        "order_count": 0,
-                    }
-                bill_customers[phone]["total_spent"] += float(bill.get("final_amount", 0))
-                bill_customers[phone]["order_count"] += 1
-        
-        # Merge results
-        existing_phones = {c.get("phone") for c in results if c.get("phone")}
-        for phone, customer in bill_customers.items():
-            if phone not in existing_phones:
-                results.append(customer)
-        
-        return results[:20]  # Limit to 20 results
+        return await asyncio.to_thread(db_service.search_customers, query, limit)
     except Exception as e:
         print(f"Error searching customers: {e}")
         return []
@@ -381,31 +372,42 @@ async def get_customer_history(customer_id: str) -> Dict[str, Any]:
         return {"store_bills": [], "online_orders": [], "total_spent": 0, "total_orders": 0}
     
     try:
-        # Get customer info
-        customer = db_service.admin_get_by_id("customers", customer_id)
-        customer_phone = customer.get("phone") if customer else None
-        
-        # Get store bills
-        store_bills = db_service.admin_get_all("store_bills")
-        if customer_phone:
-            store_bills = [b for b in store_bills if b.get("customer_phone") == customer_phone]
-        
-        # Get online orders
-        online_orders = db_service.admin_get_all("orders")
-        if customer_phone:
-            online_orders = [o for o in online_orders if o.get("customer_phone") == customer_phone]
-        
-        total_spent = (
-            sum(float(b.get("final_amount", 0)) for b in store_bills) +
-            sum(float(o.get("amount", 0)) for o in online_orders if o.get("payment_status", "").lower() == "paid")
-        )
+        # Get customer info (search results for bill-only customers carry the phone in the id)
+        if customer_id.startswith("bill_customer_"):
+            customer = None
+            customer_phone = customer_id[len("bill_customer_"):]
+        else:
+            customer = db_service.admin_get_by_id("customers", customer_id)
+            customer_phone = customer.get("phone") if customer else None
+        phone_normalized = normalize_phone(customer_phone)
+        if not phone_normalized:
+            return {"customer": customer, "store_bills": [], "online_orders": [], "total_spent": 0, "total_orders": 0}
+        
+        store_bills = db_service.admin_get_all("store_bills", filters={"customer_phone_normalized": phone_normalized})
+        online_orders = db_service.get_orders_by_customer(phone=customer_phone, limit=100)
+        
+        # Lifetime totals: completed store bills + paid online orders
+        stats = db_service.get_customer_stats(customer_phone)
+        if stats:
+            total_spent = stats.get("total_spent", 0)
+            total_orders = stats.get("order_count", 0)
+        else:
+            # customer_stats not created yet (db/create_customer_stats.sql)
+            completed_bills = [b for b in store_bills if b.get("status") == "completed"]
+            paid_orders = [o for o in online_orders if (o.get("payment_status") or "").lower() == "paid"]
+            total_spent = (
+                sum(float(b.get("final_amount", 0)) for b in completed_bills) +
+                sum(float(o.get("amount", 0)) for o in paid_orders)
+            )
+            total_orders = len(completed_bills) + len(paid_orders)
         
         return {
             "customer": customer,
             "store_bills": store_bills,
             "online_orders": online_orders,
             "total_spent": total_spent,
-            "total_orders": len(store_bills) + len(online_orders),
+            "total_orders": total_orders,
+            "last_purchase_at": (stats or {}).get("last_purchase_at"),
         }
     except Exception as e:
         print(f"Error fetching customer history: {e}")
@@ -419,28 +421,20 @@ async def hold_transaction(hold_data: HoldTransaction) -> Dict[str, Any]:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        # Create a hold record (using store_bills table with status='held')
-        hold_id = str(uuid4())
-        hold_record = {
-            "id": hold_id,
-            "bill_number": f"HOLD-{datetime.now().strftime('%Y%m%d')}-{hold_id[:8]}",
-            "customer_name": hold_data.customer_name,
-            "customer_phone": hold_data.customer_phone,
-            "status": "held",
-            "payment_status": "pending",
-            "items": json.dumps([item.dict() for item in hold_data.items]),
-            "notes": hold_data.notes,
-            "created_at": datetime.utcnow().isoformat(),
-        }
-        
-        # Store in a holds table or use store_bills with status='held'
-        # For now, we'll use a simple approach - store in store_bills with special status
-        created = db_service.admin_create("store_bills", hold_record)
+        cart = await asyncio.to_thread(
+            held_cart_store.hold,
+            hold_data.customer_name,
+            [item.model_dump() for item in hold_data.items],
+            customer_phone=hold_data.customer_phone,
+            terminal_id=hold_data.terminal_id,
+            notes=hold_data.notes,
+        )
         
         return {
             "status": "success",
-            "hold_id": hold_id,
-            "hold_number": hold_record["bill_number"],
+            "hold_id": cart["id"],
+            "hold_number": cart["hold_number"],
+            "expires_at": cart["expires_at"],
             "message": "Transaction held successfully"
         }
     except Exception as e:
@@ -451,19 +445,109 @@ async def hold_transaction(hold_data: HoldTransaction) -> Dict[str, Any]:
 
 
 @router.get("/holds")
-async def get_held_transactions() -> List[Dict[str, Any]]:
-    """Get all held transactions."""
+async def get_held_transactions(
+    terminal_id: Optional[str] = Query(None),
+    phone: Optional[str] = Query(None),
+) -> List[Dict[str, Any]]:
+    """Get held transactions (oldest first), optionally of one terminal or customer."""
     if not db_service.is_available():
         return []
     
     try:
-        holds = db_service.admin_get_all("store_bills", filters={"status": "held"})
-        return holds
+        return await asyncio.to_thread(held_cart_store.list_carts, terminal_id, phone)
     except Exception as e:
         print(f"Error fetching holds: {e}")
         return []
 
 
+@router.get("/holds/{hold_id}")
+async def get_held_transaction(hold_id: str) -> Dict[str, Any]:
+    """Get a held transaction without resuming it."""
+    cart = await asyncio.to_thread(held_cart_store.get, hold_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Held transaction not found or expired")
+    return cart
+
+
+@router.post("/holds/{hold_id}/resume")
+async def resume_held_transaction(hold_id: str) -> Dict[str, Any]:
+    """Take a held transaction back to the till (it is removed from the held list)."""
+    cart = await asyncio.to_thread(held_cart_store.resume, hold_id)
+    if not cart:
+        raise HTTPException(status_code=404, detail="Held transaction not found, expired or already resumed")
+    return cart
+
+
+@router.delete("/holds/{hold_id}")
+async def discard_held_transaction(hold_id: str) -> Dict[str, Any]:
+    """Discard a held transaction."""
+    if not await asyncio.to_thread(held_cart_store.discard, hold_id):
+        raise HTTPException(status_code=404, detail="Held transaction not found")
+    return {"success": True, "message": "Held transaction discarded"}
+
+
+def _refund_item_by_item(refund_data: RefundRequest) -> float:
+    """Refund without process_store_refund() (db/create_stock_movements.sql not run yet)."""
+    bill = db_service.admin_get_by_id("store_bills", refund_data.bill_id)
+    if not bill:
+        raise HTTPException(status_code=404, detail="Bill not found")
+    
+    # Calculate refund amount
+    refund_amount = refund_data.refund_amount
+    if refund_amount is None:
+        # Calculate from items
+        bill_items = db_service.admin_get_all("store_bill_items", filters={"bill_id": refund_data.bill_id})
+        refund_amount = sum(float(item.get("line_total", 0)) for item in bill_items)
+    
+    # Update bill status
+    db_service.admin_update("store_bills", refund_data.bill_id, {
+        "status": "refunded",
+        "updated_at": datetime.utcnow().isoformat()
+    })
+    
+    # Restore inventory for refunded items
+    for item_data in refund_data.items_to_refund:
+        product_id = item_data.get("product_id")
+        quantity = item_data.get("quantity", 0)
+        color = item_data.get("color")
+        
+        if product_id:
+            product = db_service.admin_get_by_id("products", product_id)
+            if product:
+                if color:
+                    # Restore color stock
+                    color_stock = product.get("color_stock", [])
+                    if isinstance(color_stock, str):
+                        try:
+                            color_stock = json.loads(color_stock)
+                        except:
+                            color_stock = []
+                    
+                    for color_entry in color_stock:
+                        if color_entry.get("color", "").lower() == color.lower():
+                            color_entry["stock"] = color_entry.get("stock", 0) + quantity
+                            break
+                    
+                    new_total = sum(c.get("stock", 0) for c in color_stock)
+                    db_service.admin_update("products", product_id, {
+                        "total_stock": new_total,
+                        "color_stock": color_stock,
+                        "stock_status": "out_of_stock" if new_total == 0 else ("low_stock" if new_total <= 5 else "in_stock"),
+                        "updated_at": datetime.utcnow().isoformat()
+                    })
+                else:
+                    # Restore total stock
+                    current_stock = product.get("total_stock", 0)
+                    new_stock = current_stock + quantity
+                    db_service.admin_update("products", product_id, {
+                        "total_stock": new_stock,
+                        "stock_status": "out_of_stock" if new_stock == 0 else ("low_stock" if new_stock <= 5 else "in_stock"),
+                        "updated_at": datetime.utcnow().isoformat()
+                    })
+    
+    return refund_amount
+
+
 @router.post("/refund")
 async def process_refund(refund_data: RefundRequest) -> Dict[str, Any]:
     """Process a refund for a store bill."""
@@ -471,72 +555,26 @@ async def process_refund(refund_data: RefundRequest) -> Dict[str, Any]:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        # Get original bill
-        bill = db_service.admin_get_by_id("store_bills", refund_data.bill_id)
-        if not bill:
+        # Bill status, restock (record_stock_movements) and the stock movements, in one transaction
+        result = await asyncio.to_thread(
+            db_service.process_store_refund,
+            refund_data.bill_id,
+            refund_data.items_to_refund,
+            refund_data.reason,
+            refund_data.refund_amount,
+        )
+        if result is None:
+            # Only when the function does not exist; its errors surface as a 500 below
+            refund_amount = await asyncio.to_thread(_refund_item_by_item, refund_data)
+        elif result.get("status") == "not_found":
             raise HTTPException(status_code=404, detail="Bill not found")
+        elif result.get("status") == "already_refunded":
+            raise HTTPException(status_code=409, detail="Bill has already been refunded")
+        else:
+            refund_amount = float(result.get("refund_amount") or 0)
         
-        # Calculate refund amount
-        refund_amount = refund_data.refund_amount
-        if refund_amount is None:
-            # Calculate from items
-            bill_items = db_service.admin_get_all("store_bill_items", filters={"bill_id": refund_data.bill_id})
-            refund_amount = sum(float(item.get("line_total", 0)) for item in bill_items)
-        
-        # Create refund record
-        refund_record = {
-            "bill_id": refund_data.bill_id,
-            "refund_amount": refund_amount,
-            "reason": refund_data.reason,
-            "status": "processed",
-            "created_at": datetime.utcnow().isoformat(),
-        }
-        
-        # Update bill status
-        db_service.admin_update("store_bills", refund_data.bill_id, {
-            "status": "refunded",
-            "updated_at": datetime.utcnow().isoformat()
-        })
-        
-        # Restore inventory for refunded items
-        for item_data in refund_data.items_to_refund:
-            product_id = item_data.get("product_id")
-            quantity = item_data.get("quantity", 0)
-            color = item_data.get("color")
-            
-            if product_id:
-                product = db_service.admin_get_by_id("products", product_id)
-                if product:
-                    if color:
-                        # Restore color stock
-                        color_stock = product.get("color_stock", [])
-                        if isinstance(color_stock, str):
-                            try:
-                                color_stock = json.loads(color_stock)
-                            except:
-                                color_stock = []
-                        
-                        for color_entry in color_stock:
-                            if color_entry.get("color", "").lower() == color.lower():
-                                color_entry["stock"] = color_entry.get("stock", 0) + quantity
-                                break
-                        
-                        new_total = sum(c.get("stock", 0) for c in color_stock)
-                        db_service.admin_update("products", product_id, {
-                            "total_stock": new_total,
-                            "color_stock": color_stock,
-                            "stock_status": "out_of_stock" if new_total == 0 else ("low_stock" if new_total <= 5 else "in_stock"),
-                            "updated_at": datetime.utcnow().isoformat()
-                        })
-                    else:
-                        # Restore total stock
-                        current_stock = product.get("total_stock", 0)
-                        new_stock = current_stock + quantity
-                        db_service.admin_update("products", product_id, {
-                            "total_stock": new_stock,
-                            "stock_status": "out_of_stock" if new_stock == 0 else ("low_stock" if new_stock <= 5 else "in_stock"),
-                            "updated_at": datetime.utcnow().isoformat()
-                        })
+        pos_catalog.mark_stale()
+        _invalidate_inventory_summary()
         
         return {
             "status": "success",
@@ -552,6 +590,71 @@ async def process_refund(refund_data: RefundRequest) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=f"Failed to process refund: {str(e)}")
 
 
+def _decrement_stock_item_by_item(items: List[BillItemCreate]) -> None:
+    """Stock decrement without record_stock_movements() (db/create_stock_movements.sql not run yet)."""
+    for item in items:
+        # Update inventory - decrement store stock (color-wise if color specified)
+        if item.product_id:
+            product = db_service.admin_get_by_id("products", item.product_id)
+            if product:
+                # Handle color-wise stock decrement
+                if item.color:
+                    color_stock = product.get("color_stock", [])
+                    if isinstance(color_stock, str):
+                        try:
+                            color_stock = json.loads(color_stock)
+                        except:
+                            color_stock = []
+                    
+                    # Find and decrement the specific color
+                    color_found = False
+                    for color_entry in color_stock:
+                        if color_entry.get("color", "").lower() == item.color.lower():
+                            current_color_stock = color_entry.get("stock", 0)
+                            color_entry["stock"] = max(0, current_color_stock - item.quantity)
+                            color_found = True
+                            break
+                    
+                    # If color not found, try to decrement from any available color
+                    if not color_found and color_stock:
+                        remaining = item.quantity
+                        for color_entry in color_stock:
+                            if remaining <= 0:
+                                break
+                            available = color_entry.get("stock", 0)
+                            if available > 0:
+                                decrement = min(remaining, available)
+                                color_entry["stock"] = max(0, available - decrement)
+                                remaining -= decrement
+                    
+                    # Recalculate total stock from color_stock
+                    new_total_stock = sum(c.get("stock", 0) for c in color_stock) if color_stock else 0
+                    if not color_stock:
+                        # Fallback to total_stock decrement
+                        current_stock = product.get("total_stock", 0)
+                        new_total_stock = max(0, current_stock - item.quantity)
+                    
+                    # Update product with color_stock
+                    update_data = {
+                        "total_stock": new_total_stock,
+                        "stock_status": "out_of_stock" if new_total_stock == 0 else ("low_stock" if new_total_stock <= 5 else "in_stock"),
+                        "updated_at": datetime.utcnow().isoformat()
+                    }
+                    if color_stock:
+                        update_data["color_stock"] = color_stock
+                    
+                    db_service.admin_update("products", item.product_id, update_data)
+                else:
+                    # No color specified, decrement total stock
+                    current_stock = product.get("total_stock", 0)
+                    new_stock = max(0, current_stock - item.quantity)
+                    db_service.admin_update("products", item.product_id, {
+                        "total_stock": new_stock,
+                        "stock_status": "out_of_stock" if new_stock == 0 else ("low_stock" if new_stock <= 5 else "in_stock"),
+                        "updated_at": datetime.utcnow().isoformat()
+                    })
+
+
 @router.post("/create")
 async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
     """Create a new store bill/invoice."""
@@ -565,33 +668,21 @@ async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
             for item in bill_data.items
         )
         
-        # Apply discount if provided
+        # Apply discount if provided (its use is counted right before the bill is created)
         discount_amount = bill_data.discount_amount or 0
+        discount = None
         if bill_data.discount_code:
-            # Validate and get discount
-            discounts = db_service.admin_get_all(
-                "store_discounts",
-                filters={"discount_code": bill_data.discount_code, "is_active": True}
-            )
-            if discounts:
-                discount = discounts[0]
-                # Check if discount is valid
-                now = datetime.utcnow().isoformat()
-                if discount.get("start_date") and discount.get("start_date") > now:
-                    raise HTTPException(status_code=400, detail="Discount not yet active")
-                if discount.get("end_date") and discount.get("end_date") < now:
-                    raise HTTPException(status_code=400, detail="Discount has expired")
-                if discount.get("max_uses") and discount.get("current_uses", 0) >= discount.get("max_uses", 0):
-                    raise HTTPException(status_code=400, detail="Discount usage limit reached")
+            discount = await asyncio.to_thread(discount_service.get, bill_data.discount_code)
+            if discount:
+                reason = discount_service.check(discount, subtotal)
+                if reason:
+                    raise HTTPException(status_code=400, detail=reason)
                 
                 # Calculate discount
+                discount_amount = discount_service.amount_for(discount, subtotal)
                 if discount.get("discount_type") == "percentage":
-                    discount_amount = subtotal * (discount.get("discount_value", 0) / 100)
-                    if discount.get("maximum_discount_amount"):
-                        discount_amount = min(discount_amount, discount.get("maximum_discount_amount"))
                     bill_data.discount_percentage = discount.get("discount_value", 0)
                 else:
-                    discount_amount = discount.get("discount_value", 0)
                     bill_data.discount_amount = discount_amount
                 
                 bill_data.discount_type = "store_special"
@@ -695,6 +786,20 @@ async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
         print(f"[Store Billing] Database service: {db_service.get_service_name()}")
         print(f"[Store Billing] Database available: {db_service.is_available()}")
         
+        if discount:
+            # One conditional UPDATE: concurrent checkouts cannot overshoot max_uses
+            discount, reason = await asyncio.to_thread(discount_service.redeem, discount)
+            if reason:
+                raise HTTPException(status_code=400, detail=reason)
+            # Price the bill from the row just redeemed; the cached copy may predate an edit
+            discount_amount = discount_service.amount_for(discount, subtotal)
+            total_amount = final_amount = subtotal - discount_amount + tax_amount
+            bill_data_dict["discount_amount"] = float(discount_amount)
+            bill_data_dict["total_amount"] = float(total_amount)
+            bill_data_dict["final_amount"] = float(final_amount)
+            if discount.get("discount_type") == "percentage":
+                bill_data_dict["discount_percentage"] = float(discount.get("discount_value") or 0)
+        
         try:
             bill = db_service.admin_create("store_bills", bill_data_dict)
             if not bill:
@@ -708,8 +813,12 @@ async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
                 raise HTTPException(status_code=500, detail=error_detail)
             print(f"[Store Billing] Bill created successfully: {bill.get('id')}")
         except HTTPException:
+            if discount:
+                discount_service.release(discount)
             raise
         except Exception as create_error:
+            if discount:
+                discount_service.release(discount)
             error_msg = f"Failed to create bill: {str(create_error)}"
             print(f"[Store Billing] Error in admin_create: {create_error}")
             import traceback
@@ -743,76 +852,32 @@ async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
                 import traceback
                 traceback.print_exc()
                 # Continue with other items even if one fails
-            
-            # Update inventory - decrement store stock (color-wise if color specified)
-            if item.product_id:
-                product = db_service.admin_get_by_id("products", item.product_id)
-                if product:
-                    # Handle color-wise stock decrement
-                    if item.color:
-                        color_stock = product.get("color_stock", [])
-                        if isinstance(color_stock, str):
-                            try:
-                                color_stock = json.loads(color_stock)
-                            except:
-                                color_stock = []
-                        
-                        # Find and decrement the specific color
-                        color_found = False
-                        for color_entry in color_stock:
-                            if color_entry.get("color", "").lower() == item.color.lower():
-                                current_color_stock = color_entry.get("stock", 0)
-                                color_entry["stock"] = max(0, current_color_stock - item.quantity)
-                                color_found = True
-                                break
-                        
-                        # If color not found, try to decrement from any available color
-                        if not color_found and color_stock:
-                            remaining = item.quantity
-                            for color_entry in color_stock:
-                                if remaining <= 0:
-                                    break
-                                available = color_entry.get("stock", 0)
-                                if available > 0:
-                                    decrement = min(remaining, available)
-                                    color_entry["stock"] = max(0, available - decrement)
-                                    remaining -= decrement
-                        
-                        # Recalculate total stock from color_stock
-                        new_total_stock = sum(c.get("stock", 0) for c in color_stock) if color_stock else 0
-                        if not color_stock:
-                            # Fallback to total_stock decrement
-                            current_stock = product.get("total_stock", 0)
-                            new_total_stock = max(0, current_stock - item.quantity)
-                        
-                        # Update product with color_stock
-                        update_data = {
-                            "total_stock": new_total_stock,
-                            "stock_status": "out_of_stock" if new_total_stock == 0 else ("low_stock" if new_total_stock <= 5 else "in_stock"),
-                            "updated_at": datetime.utcnow().isoformat()
-                        }
-                        if color_stock:
-                            update_data["color_stock"] = color_stock
-                        
-                        db_service.admin_update("products", item.product_id, update_data)
-                    else:
-                        # No color specified, decrement total stock
-                        current_stock = product.get("total_stock", 0)
-                        new_stock = max(0, current_stock - item.quantity)
-                        db_service.admin_update("products", item.product_id, {
-                            "total_stock": new_stock,
-                            "stock_status": "out_of_stock" if new_stock == 0 else ("low_stock" if new_stock <= 5 else "in_stock"),
-                            "updated_at": datetime.utcnow().isoformat()
-                        })
         
-        # Update discount usage if applied
-        if bill_data.discount_code and discounts:
-            discount = discounts[0]
-            current_uses = discount.get("current_uses", 0)
-            db_service.admin_update("store_discounts", discount["id"], {
-                "current_uses": current_uses + 1,
-                "updated_at": datetime.utcnow().isoformat()
-            })
+        # Take the sold items out of stock: one ledger write across all products/colours
+        movements = [
+            {"product_id": item.product_id, "color": item.color or None, "quantity": -int(item.quantity)}
+            for item in bill_data.items
+            if item.product_id
+        ]
+        # The bill (and its discount use) is already committed: a stock failure must not
+        # fail the request, or the till's retry would bill and redeem a second time
+        stock_sync_failed = False
+        if movements:
+            try:
+                recorded = await asyncio.to_thread(
+                    db_service.record_stock_movements, "sale", movements, reference_id=str(bill["id"])
+                )
+                if recorded is None:
+                    # record_stock_movements() not installed (db/create_stock_movements.sql)
+                    await asyncio.to_thread(_decrement_stock_item_by_item, bill_data.items)
+            except Exception as stock_error:
+                stock_sync_failed = True
+                print(f"[Store Billing] Stock not updated for bill {bill.get('id')}: {stock_error}")
+                import traceback
+                traceback.print_exc()
+        
+        pos_catalog.mark_stale()
+        _invalidate_inventory_summary()
         
         # Generate PDF invoice
         invoice_pdf_path = None
@@ -872,7 +937,11 @@ async def create_store_bill(bill_data: StoreBillCreate) -> Dict[str, Any]:
             "status": "success",
             "bill": bill,
             "invoice_pdf": invoice_pdf_path,
-            "message": "Store bill created successfully"
+            "stock_sync_failed": stock_sync_failed,
+            "message": (
+                "Store bill created, but stock could not be updated"
+                if stock_sync_failed else "Store bill created successfully"
+            ),
         }
         
     except HTTPException:
@@ -1065,38 +1134,18 @@ async def validate_discount_code(
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        discounts = db_service.admin_get_all(
-            "store_discounts",
-            filters={"discount_code": code, "is_active": True}
-        )
-        
-        if not discounts:
+        discount = await asyncio.to_thread(discount_service.get, code)
+        if not discount:
             return {"valid": False, "message": "Invalid discount code"}
         
-        discount = discounts[0]
-        now = datetime.utcnow().isoformat()
-        
-        if discount.get("start_date") and discount.get("start_date") > now:
-            return {"valid": False, "message": "Discount not yet active"}
-        if discount.get("end_date") and discount.get("end_date") < now:
-            return {"valid": False, "message": "Discount has expired"}
-        if discount.get("max_uses") and discount.get("current_uses", 0) >= discount.get("max_uses", 0):
-            return {"valid": False, "message": "Discount usage limit reached"}
-        if discount.get("minimum_amount") and amount < discount.get("minimum_amount", 0):
-            return {"valid": False, "message": f"Minimum purchase amount of ₹{discount.get('minimum_amount')} required"}
-        
-        # Calculate discount amount
-        if discount.get("discount_type") == "percentage":
-            discount_amount = amount * (discount.get("discount_value", 0) / 100)
-            if discount.get("maximum_discount_amount"):
-                discount_amount = min(discount_amount, discount.get("maximum_discount_amount"))
-        else:
-            discount_amount = discount.get("discount_value", 0)
+        reason = discount_service.check(discount, amount)
+        if reason:
+            return {"valid": False, "message": reason}
         
         return {
             "valid": True,
             "discount": discount,
-            "discount_amount": discount_amount,
+            "discount_amount": discount_service.amount_for(discount, amount),
             "message": "Discount applied successfully"
         }
     except Exception as e:
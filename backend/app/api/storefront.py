@@ -1,11 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, Field
 
 from ..data import CATEGORIES, PINCODE_DETAILS, PRODUCTS, SETTINGS, TESTIMONIALS
 from ..services.db_service import db_service
+from ..services.offer_engine import offer_engine
+from ..services.pos_catalog import pos_catalog
 from ..models.responses import sanitize_products, sanitize_product
 
 router = APIRouter(prefix="/store", tags=["storefront"])
@@ -13,6 +17,17 @@ router = APIRouter(prefix="/store", tags=["storefront"])
 _orders: List[Dict[str, Any]] = []
 
 
+class CartLine(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+    color: Optional[str] = None
+    size: Optional[str] = None
+
+
+class CartQuoteRequest(BaseModel):
+    items: List[CartLine] = Field(min_length=1, max_length=100)
+
+
 def _filter_products(
     *,
     limit: Optional[int] = None,
@@ -303,8 +318,37 @@ async def get_order(order_id: str) -> Dict[str, Any]:
 async def get_offers() -> List[Dict[str, Any]]:
     """Get active offers - uses database if available."""
     if db_service.is_available():
-        return db_service.get_offers(is_active=True)
+        return await offer_engine.active_offers()
     
     # Fallback to empty list (no offers in fixtures)
     return []
 
+
+@router.post("/cart/quote")
+async def quote_cart(cart: CartQuoteRequest) -> Dict[str, Any]:
+    """
+    Price a whole cart in one call: current prices, the best live offer per
+    product and the totals checkout should charge.
+    """
+    product_ids = list(dict.fromkeys(line.product_id for line in cart.items))
+    products = await pos_catalog.get_many(product_ids)
+    for product_id in product_ids:
+        if product_id in products:
+            continue
+        # Not in the catalog yet (or no database): single lookup, then the fixtures
+        product = None
+        if db_service.is_available():
+            product = await asyncio.to_thread(db_service.get_product_by_id, product_id)
+        product = product or next((p for p in PRODUCTS if str(p.get("id")) == product_id), None)
+        if not product:
+            raise HTTPException(status_code=404, detail=f"Product not found: {product_id}")
+        products[product_id] = product
+
+    try:
+        return await offer_engine.quote(
+            (products[line.product_id], line.model_dump()) for line in cart.items
+        )
+    except Exception as e:
+        print(f"Error quoting cart: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to quote cart: {str(e)}")
+
@@ -32,6 +32,18 @@ class Settings(BaseSettings):
     r2_secret_access_key: Optional[str] = None
     r2_bucket_name: Optional[str] = None
     r2_public_base_url: Optional[str] = None
+    r2_max_pool_connections: int = 32
+    r2_multipart_threshold: int = 16 * 1024 * 1024
+    r2_multipart_chunk_size: int = 8 * 1024 * 1024
+    r2_multipart_concurrency: int = 4
+    r2_presign_bucket_seconds: int = 300
+    r2_presign_cache_size: int = 4096
+
+    # Product image variants (thumb/card/zoom) stored in R2
+    image_variants_enabled: bool = False
+    image_variant_formats: str = "webp,avif"
+    image_variant_quality: int = 80
+    image_variant_workers: int = 2
 
     # PhonePe
     phonepe_enabled: bool = False
@@ -48,6 +60,70 @@ class Settings(BaseSettings):
 
     phonepe_payment_callback_url: Optional[str] = None
 
+    # ZohoPay OAuth client (used to refresh the stored token in the background)
+    zoho_client_id: Optional[str] = None
+    zoho_client_secret: Optional[str] = None
+    zoho_accounts_url: str = "https://accounts.zoho.in"
+    # When set, ZohoPay webhooks with a missing or wrong signature are not applied
+    zohopay_webhook_signing_key: Optional[str] = None
+
+    # Background OAuth token refresh for PhonePe and ZohoPay
+    oauth_refresh_enabled: bool = True
+    oauth_refresh_check_seconds: int = 60
+    oauth_refresh_margin_seconds: int = 300
+    # Longest wait between retries after a refresh (or saving its token) keeps failing
+    oauth_refresh_max_backoff_seconds: int = 1800
+
+    # Shared HTTP clients for payment gateway calls
+    gateway_http_timeout: float = 30.0
+    gateway_http_connect_timeout: float = 5.0
+    gateway_http_max_connections: int = 20
+    gateway_http_max_keepalive: int = 10
+    gateway_http_keepalive_expiry: float = 60.0
+    gateway_http_retries: int = 3
+    gateway_http2: bool = True
+    # Gateway credentials are cached in memory and re-read in the background after this long
+    gateway_config_ttl_seconds: int = 300
+
+    # Payment webhooks are acknowledged immediately and applied by background workers
+    webhook_workers: int = 4
+    webhook_queue_size: int = 1000
+    webhook_drain_timeout_seconds: float = 10.0
+
+    # Payment status fan-out across workers: 'auto' (Postgres if DATABASE_URL is set), 'postgres' or 'memory'
+    broadcast_backend: str = "auto"
+    broadcast_channel: str = "payment_status"
+    # Optional websocket_connections audit rows, written in batches in the background
+    websocket_audit_enabled: bool = False
+    websocket_audit_flush_seconds: float = 5.0
+    # Payment status polling: cache lifetime per order and long-poll / SSE limits
+    payment_status_cache_seconds: float = 5.0
+    payment_status_max_wait_seconds: int = 30
+    payment_status_stream_seconds: int = 900
+    # Rendered invoices of orders with a final payment status, per worker
+    invoice_cache_seconds: float = 300.0
+    invoice_cache_size: int = 2000
+    # POS catalog kept in memory: incremental refresh interval and full reload interval
+    pos_catalog_refresh_seconds: float = 2.0
+    pos_catalog_full_refresh_seconds: int = 600
+    # How long /store/billing/inventory-summary reuses its last result (0 disables)
+    inventory_summary_cache_seconds: float = 30.0
+    # Active store discount codes cached per worker (usage is always counted in the database)
+    discount_cache_seconds: float = 60.0
+    # Active offers compiled into pricing rules for /store/cart/quote (admin edits apply at once)
+    offer_rules_refresh_seconds: float = 60.0
+    # Parked POS carts: lifetime, and how often a worker reloads carts parked by other workers
+    held_cart_ttl_seconds: int = 14400
+    held_carts_sync_seconds: float = 5.0
+
+    # Background reconciliation of pending PhonePe orders
+    reconcile_enabled: bool = True
+    reconcile_interval_seconds: int = 60
+    reconcile_min_age_seconds: int = 120
+    reconcile_max_age_hours: int = 48
+    reconcile_batch_size: int = 200
+    reconcile_concurrency: int = 5
+
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="allow")
 
 
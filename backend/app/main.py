@@ -2,6 +2,7 @@ from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+import asyncio
 import traceback
 
 from .config import get_settings
@@ -10,8 +11,16 @@ from .api import admin as admin_api
 from .api import storefront, customer
 from .api import store_billing
 from .api.payments import router as payments_router
+from .api.payments.websocket import manager as websocket_manager
 from .services.db_service import db_service
 from .services.storage import storage_client
+from .services.image_variants import image_variant_service
+from .services.gateway_http import gateway_http
+from .services.gateway_config import gateway_configs
+from .services.token_refresher import oauth_token_refresher
+from .services.webhook_pipeline import webhook_pipeline
+from .services.broadcast import payment_broadcast
+from .services.reconciliation import payment_reconciler
 
 
 def create_app() -> FastAPI:
@@ -74,15 +83,49 @@ def create_app() -> FastAPI:
         else:
             print("⚠️  Database: Not configured (using fixtures)")
         
+        # Load payment gateway credentials before the first checkout
+        if db_service.is_available():
+            try:
+                await asyncio.to_thread(gateway_configs.warm)
+            except Exception as e:
+                print(f"⚠️  Payment gateways: Failed to load config: {e}")
+        
+        # Refresh gateway OAuth tokens ahead of expiry
+        await oauth_token_refresher.start()
+        
+        # Payment status updates reach WebSocket clients on every worker
+        await payment_broadcast.start()
+        print(f"✅ Payment broadcast: {payment_broadcast.name}")
+        
+        # Apply payment webhooks in the background
+        await webhook_pipeline.start()
+        
+        # Settle pending PhonePe orders whose webhook never arrived
+        await payment_reconciler.start()
+        
         # Storage status
         try:
             storage_client._verify_settings()
+            await storage_client.start()
             print(f"✅ Storage: Cloudflare R2 ({storage_client.settings.r2_bucket_name})")
         except RuntimeError:
             print("⚠️  Storage: Cloudflare R2 not configured")
+        except Exception as e:
+            print(f"⚠️  Storage: Failed to open Cloudflare R2 client: {e}")
         
         print("=" * 60)
 
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await payment_reconciler.stop()
+        await webhook_pipeline.stop()
+        await payment_broadcast.stop()
+        await websocket_manager.audit.stop()
+        await oauth_token_refresher.stop()
+        image_variant_service.shutdown()
+        await storage_client.close()
+        await gateway_http.close()
+
     return app
 
 
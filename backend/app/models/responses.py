@@ -3,6 +3,8 @@
 from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field
 
+from ..services.image_variants import image_variant_service
+
 
 class ProductResponse(BaseModel):
     """Sanitized product response - only includes public fields."""
@@ -90,6 +92,9 @@ def sanitize_product(product: Dict[str, Any]) -> Dict[str, Any]:
     images = product.get('images', [])
     if images and not isinstance(images, list):
         images = []
+
+    # Only images whose variants were generated have them in R2
+    stored_variants = image_variant_service.stored_variants(product) if image_variant_service.is_enabled() else {}
     
     # Debug logging
     print(f"🔍 sanitize_product - Product: {product.get('name', 'Unknown')}")
@@ -105,9 +110,14 @@ def sanitize_product(product: Dict[str, Any]) -> Dict[str, Any]:
         'price': product.get('price'),
         'original_price': product.get('original_price'),
         'images': images,
+        'image_variants': [stored_variants.get(img, {}) for img in images],  # Aligned with images
         'video_url': product.get('video_url'),  # Video URL for product showcase
         'colors': product.get('colors', []),
         'color_images': color_images,  # Include color_images for gallery display
+        'color_image_variants': [
+            [stored_variants.get(img, {}) for img in group] if isinstance(group, list) else []
+            for group in color_images
+        ],
         'sizes': product.get('sizes', []),
         'fabric': product.get('fabric'),
         'care_instructions': product.get('care_instructions'),
@@ -1,5 +1,10 @@
+from typing import Any
+
 from fastapi import APIRouter
 
+from ..services.gateway_http import gateway_http
+from ..services.webhook_pipeline import webhook_pipeline
+
 router = APIRouter(tags=["health"])
 
 
@@ -8,3 +13,15 @@ async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@router.get("/healthz/gateways")
+async def gateway_latency() -> dict[str, Any]:
+    """Latency and error counters of the payment gateway HTTP clients."""
+    return gateway_http.metrics()
+
+
+
+
+@router.get("/healthz/webhooks")
+async def webhook_queue() -> dict[str, Any]:
+    """Counters and queue depth of the payment webhook pipeline."""
+    return webhook_pipeline.metrics()
@@ -1,18 +1,67 @@
+import asyncio
 import logging
+from datetime import datetime
+from typing import Optional
 
 from fastapi import APIRouter, HTTPException, status
 
-from ..services.phonepe import PhonePeInitRequest, PhonePeStatusRequest, service
+from ..services.db_service import db_service
+from ..services.phonepe import (
+    PHONEPE_FINAL_STATES,
+    PhonePeInitRequest,
+    PhonePeStatusRequest,
+    service,
+    store_order_id,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def record_payment_session(payload: PhonePeInitRequest, result: dict) -> None:
+    """Remember the PhonePe merchantOrderId so pending orders can be reconciled later."""
+    if not db_service.is_available():
+        return
+    try:
+        db_service.admin_create("payment_sessions", {
+            "order_id": payload.order_id,
+            "gateway": "phonepe",
+            "transaction_id": result["merchantOrderId"],
+            "payment_url": result.get("paymentUrl"),
+            "amount": payload.amount,
+            "customer_name": payload.customer_name,
+            "customer_email": payload.customer_email,
+            "customer_phone": payload.customer_phone,
+            "status": "initiated",
+            "payment_status": "pending",
+            "created_at": datetime.utcnow().isoformat(),
+        })
+    except Exception:
+        logger.exception("Failed to store PhonePe payment session")
+
+
+def session_order_id(merchant_order_id: str) -> Optional[str]:
+    """Our order id for a PhonePe merchantOrderId, from its payment session."""
+    if not merchant_order_id:
+        return None
+    try:
+        sessions = db_service.admin_get_all(
+            "payment_sessions", filters={"gateway": "phonepe", "transaction_id": merchant_order_id}
+        )
+    except Exception:
+        logger.exception("Failed to look up PhonePe payment session %s", merchant_order_id)
+        return None
+    return next((session["order_id"] for session in sessions if session.get("order_id")), None)
+
+
 @router.post("/init")
 async def initiate_phonepe_payment(payload: PhonePeInitRequest):
     try:
-        return await service.initiate_payment(payload)
+        result = await service.initiate_payment(payload)
+        if result.get("status") == 1 and result.get("paymentUrl") and result.get("merchantOrderId"):
+            await asyncio.to_thread(record_payment_session, payload, result)
+        return result
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
     except HTTPException:
@@ -22,10 +71,45 @@ async def initiate_phonepe_payment(payload: PhonePeInitRequest):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error") from exc
 
 
+async def settle_order(result: dict) -> None:
+    """
+    Save a final PhonePe state on its still-pending order, then tell the
+    clients waiting on it. Nothing is announced unless the write succeeded.
+    """
+    state = str(result.get("state") or "").upper()
+    if result.get("status") != 1 or state not in PHONEPE_FINAL_STATES or not db_service.is_available():
+        return
+    raw = result.get("raw") if isinstance(result.get("raw"), dict) else {}
+    merchant_order_id = result.get("merchantOrderId") or ""
+    # The session is authoritative: fallback merchant ids are truncated and cannot be split
+    order_id = (
+        await asyncio.to_thread(session_order_id, merchant_order_id)
+        or store_order_id(merchant_order_id, raw)
+    )
+    payment_status, order_status = PHONEPE_FINAL_STATES[state]
+    updated = await asyncio.to_thread(db_service.bulk_update_order_payments, [{
+        "order_id": order_id,
+        "payment_status": payment_status,
+        "status": order_status,
+        "transaction_id": result.get("transactionId"),
+        "payment_gateway_response": raw or None,
+    }])
+    if order_id not in updated:
+        return
+
+    from ..api.payments.websocket import broadcast_payment_update
+    try:
+        await broadcast_payment_update(order_id, order_status, payment_status, result.get("transactionId"))
+    except Exception:
+        logger.exception("Failed to broadcast PhonePe status for %s", order_id)
+
+
 @router.post("/status")
 async def phonepe_order_status(payload: PhonePeStatusRequest):
     try:
-        return await service.get_order_status(payload)
+        result = await service.get_order_status(payload)
+        await settle_order(result)
+        return result
     except HTTPException:
         raise
     except Exception as exc:  # pragma: no cover - safety net
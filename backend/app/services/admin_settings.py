@@ -8,6 +8,7 @@ from .admin_settings_models import (
     SettingKey,
 )
 from .db_service import db_service
+from .gateway_config import gateway_configs
 
 
 class AdminSettingsService:
@@ -207,6 +208,7 @@ class AdminSettingsService:
                 print(f"Error saving payment config to database: {e}")
                 import traceback
                 traceback.print_exc()
+            gateway_configs.refresh(config.payment_method)
         
         if config.is_primary:
             await self.set_primary_payment_method(config.payment_method)
@@ -246,6 +248,7 @@ class AdminSettingsService:
                     db_service.admin_update("payment_config", db_configs[0].get("id"), update_data)
             except Exception as e:
                 print(f"Error updating payment config in database: {e}")
+            gateway_configs.refresh(payment_method)
 
         if payload.is_primary:
             await self.set_primary_payment_method(payment_method)
@@ -271,6 +274,7 @@ class AdminSettingsService:
                     })
             except Exception as e:
                 print(f"Error updating payment config toggle in database: {e}")
+            gateway_configs.refresh(payment_method)
         
         return updated
 
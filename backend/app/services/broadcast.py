@@ -0,0 +1,168 @@
+"""Fan-out of payment status messages to every backend worker."""
+
+import abc
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..config import Settings, get_settings
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    asyncpg = None
+    ASYNCPG_AVAILABLE = False
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_BYTES = 7900
+
+
+class BroadcastBackend(abc.ABC):
+    """
+    Publishes messages to every worker; each worker hands them to its
+    subscribers (e.g. the WebSocket manager delivering to local sockets).
+    """
+
+    name = "base"
+
+    def __init__(self) -> None:
+        self._handlers: List[Handler] = []
+
+    def subscribe(self, handler: Handler) -> None:
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    async def deliver(self, message: Dict[str, Any]) -> None:
+        for handler in list(self._handlers):
+            try:
+                await handler(message)
+            except Exception as e:
+                print(f"Error delivering broadcast message: {e}")
+
+    async def start(self) -> None:
+        return None
+
+    async def stop(self) -> None:
+        return None
+
+    @abc.abstractmethod
+    async def publish(self, message: Dict[str, Any]) -> None:
+        """Send `message` to the subscribers of every worker."""
+
+
+class InMemoryBroadcast(BroadcastBackend):
+    """Single-process backend: publishing delivers straight to local subscribers."""
+
+    name = "memory"
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        await self.deliver(message)
+
+
+class PostgresBroadcast(BroadcastBackend):
+    """
+    LISTEN/NOTIFY backend. Every worker listens on one channel, so a message
+    published by any worker (including itself) is delivered by all of them.
+    While the connection is down, messages are delivered locally only.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, channel: str) -> None:
+        super().__init__()
+        self.dsn = dsn.replace("postgresql+asyncpg://", "postgresql://", 1)
+        self.channel = channel
+        self._conn = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._lost: Optional[asyncio.Event] = None
+
+    def is_connected(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        asyncio.get_running_loop().create_task(self.deliver(message))
+
+    def _on_terminate(self, connection: Any) -> None:
+        if self._lost is not None:
+            self._lost.set()
+
+    async def _connect(self) -> None:
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_terminate)
+        await conn.add_listener(self.channel, self._on_notify)
+        self._conn = conn
+
+    async def _run(self) -> None:
+        delay = 1.0
+        while True:
+            self._lost = asyncio.Event()
+            try:
+                await self._connect()
+                delay = 1.0
+                await self._lost.wait()
+                print(f"⚠️  Broadcast: lost LISTEN connection on '{self.channel}', reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error connecting broadcast listener: {e}")
+            await self._close_conn()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    async def _close_conn(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None and not conn.is_closed():
+            try:
+                await conn.close()
+            except Exception:
+                conn.terminate()
+
+    async def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_conn()
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        payload = json.dumps(message, default=str)
+        if self.is_connected() and len(payload.encode()) < MAX_NOTIFY_BYTES:
+            try:
+                async with self._lock:
+                    await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                return
+            except Exception as e:
+                print(f"Error publishing broadcast message: {e}")
+        # Could not reach the other workers; at least serve our own sockets
+        await self.deliver(message)
+
+
+def create_broadcast_backend(settings: Optional[Settings] = None) -> BroadcastBackend:
+    settings = settings or get_settings()
+    backend = settings.broadcast_backend.lower()
+    if backend == "memory":
+        return InMemoryBroadcast()
+    if backend in ("postgres", "auto"):
+        if settings.database_url and ASYNCPG_AVAILABLE:
+            return PostgresBroadcast(settings.database_url, settings.broadcast_channel)
+        if backend == "postgres":
+            print("⚠️  Broadcast: postgres backend needs DATABASE_URL and asyncpg, using in-memory")
+    return InMemoryBroadcast()
+
+
+payment_broadcast = create_broadcast_backend()
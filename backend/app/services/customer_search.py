@@ -0,0 +1,59 @@
+"""Normalization of customer phones/emails and POS search terms."""
+
+import re
+from typing import Any, Dict, Optional
+
+# Indian mobile numbers: keep the 10-digit subscriber number
+PHONE_DIGITS = 10
+# Shortest digit run treated as a phone search instead of a name search
+MIN_PHONE_QUERY_DIGITS = 3
+# Generated by the database (db/add_customer_search.sql, db/add_orders_customer_lookup.sql); never written
+NORMALIZED_COLUMNS = frozenset({
+    "phone_normalized", "email_normalized", "customer_phone_normalized", "customer_email_normalized",
+})
+
+
+def normalize_phone(phone: Any) -> Optional[str]:
+    """
+    Digits of a phone number without country code or trunk prefix, matching
+    the generated `*_phone_normalized` columns: "+91 98765-43210" -> "9876543210".
+    """
+    digits = re.sub(r"\D", "", str(phone or ""))
+    return digits[-PHONE_DIGITS:] or None
+
+
+def normalize_email(email: Any) -> Optional[str]:
+    value = str(email or "").strip().lower()
+    return value or None
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def customer_search_terms(query: str) -> Dict[str, Optional[str]]:
+    """
+    LIKE patterns for a POS search box entry. Digit-only input searches phone
+    prefixes; anything else searches name word prefixes and email prefixes.
+    """
+    query = (query or "").strip()
+    terms: Dict[str, Optional[str]] = {"name_prefix": None, "name_word_prefix": None, "phone_prefix": None, "email_prefix": None}
+    if not query:
+        return terms
+
+    digits = re.sub(r"\D", "", query)
+    if re.fullmatch(r"[\d\s()+-]+", query) and len(digits) >= MIN_PHONE_QUERY_DIGITS:
+        # Typed with a country code or trunk zero: drop it, as normalize_phone keeps
+        # only the subscriber number ("09876" searches "9876%")
+        if query.startswith("+91") or (digits.startswith("91") and len(digits) > PHONE_DIGITS):
+            digits = digits[2:]
+        if digits.startswith("0"):
+            digits = digits[1:]
+        terms["phone_prefix"] = _escape_like(digits[-PHONE_DIGITS:]) + "%"
+        return terms
+
+    escaped = _escape_like(query.lower())
+    terms["name_prefix"] = escaped + "%"
+    terms["name_word_prefix"] = "% " + escaped + "%"
+    terms["email_prefix"] = escaped + "%"
+    return terms
@@ -3,6 +3,7 @@
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 import json
+import uuid
 
 from sqlalchemy import create_engine, text, select, func, or_, and_
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
@@ -10,6 +11,17 @@ from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import NullPool
 
 from ..config import get_settings
+from .customer_search import customer_search_terms, normalize_email, normalize_phone
+from .db_errors import is_undefined_function
+from .order_items import build_order_items
+
+
+def _as_uuid(value: str) -> Optional[str]:
+    """`value` if it is a UUID, else None (orders are looked up by order_id or id)."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
 
 
 class DatabaseService:
@@ -21,6 +33,8 @@ class DatabaseService:
         self.async_engine = None
         self.SessionLocal = None
         self.AsyncSessionLocal = None
+        # Cleared when order_items is missing, so invoices are loaded without it
+        self._order_items_joined = True
         
         if settings.database_url:
             # Convert postgres:// to postgresql:// for SQLAlchemy
@@ -223,6 +237,50 @@ class DatabaseService:
             print(f"Error fetching product by name: {e}")
             return None
     
+    def _product_from_row(self, row: Any) -> Dict[str, Any]:
+        product = dict(row._mapping)
+        # Convert types
+        for key in ["id", "category_id", "vendor_id"]:
+            if product.get(key):
+                product[key] = str(product[key])
+        # Convert timestamps
+        for key in ["created_at", "updated_at", "new_collection_start_date", "new_collection_end_date"]:
+            if product.get(key) and isinstance(product[key], datetime):
+                product[key] = product[key].isoformat()
+        return product
+    
+    def get_product_by_sku(self, sku: str) -> Optional[Dict[str, Any]]:
+        """Get a product (active or not) by SKU, case-insensitively, via the SKU index."""
+        if not self.engine or not sku:
+            return None
+        try:
+            with self.get_session() as session:
+                row = session.execute(
+                    text("SELECT * FROM products WHERE upper(sku) = upper(:sku) LIMIT 1"),
+                    {"sku": sku.strip()},
+                ).fetchone()
+                return self._product_from_row(row) if row else None
+        except Exception as e:
+            print(f"Error fetching product by SKU: {e}")
+            return None
+    
+    def get_products_updated_since(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All products (active or not) changed at or after `since`, oldest change first; all products without it."""
+        if not self.engine:
+            return []
+        try:
+            with self.get_session() as session:
+                since_clause = "WHERE updated_at >= CAST(:since AS timestamptz)" if since else ""
+                result = session.execute(text(f"""
+                    SELECT * FROM products
+                    {since_clause}
+                    ORDER BY updated_at ASC NULLS FIRST
+                """), {"since": since})
+                return [self._product_from_row(row) for row in result.fetchall()]
+        except Exception as e:
+            print(f"Error fetching updated products: {e}")
+            return []
+    
     def get_categories(self) -> List[Dict[str, Any]]:
         """Get all active categories."""
         if not self.engine:
@@ -407,8 +465,9 @@ class DatabaseService:
                 """)
                 
                 result = session.execute(insert_query, order_data)
-                session.commit()
                 row = result.fetchone()
+                self._insert_order_items(session, order_data)
+                session.commit()
                 if row:
                     order = dict(row._mapping)
                     # Convert types
@@ -432,87 +491,463 @@ class DatabaseService:
             traceback.print_exc()
             return None
     
-    def get_orders_by_email(self, email: str) -> List[Dict[str, Any]]:
-        """Get orders by customer email."""
+    def _insert_order_items(self, session: Session, order_data: Dict[str, Any]) -> None:
+        """Write the order's line items; a failure here never loses the order itself."""
+        items = build_order_items(order_data)
+        if not items:
+            return
+        try:
+            with session.begin_nested():
+                session.execute(text("""
+                    INSERT INTO order_items (
+                        order_id, position, product_id, saree_id, name, color, size,
+                        image, quantity, unit_price, line_total
+                    ) VALUES (
+                        :order_id, :position, :product_id, :saree_id, :name, :color, :size,
+                        :image, :quantity, :unit_price, :line_total
+                    ) ON CONFLICT (order_id, position) DO NOTHING
+                """), items)
+        except Exception as e:
+            print(f"Error creating order items: {e}")
+    
+    def get_order_items(self, order_id: str) -> List[Dict[str, Any]]:
+        """Line items of an order, in cart order."""
         if not self.engine:
             return []
         try:
             with self.get_session() as session:
-                query = text("""
-                    SELECT * FROM orders
-                    WHERE customer_email = :email
-                    ORDER BY created_at DESC
-                """)
-                result = session.execute(query, {"email": email})
-                rows = result.fetchall()
-                
-                orders = []
-                for row in rows:
-                    order = dict(row._mapping)
-                    # Convert types
-                    if order.get("id"):
-                        order["id"] = str(order["id"])
-                    if order.get("product_id"):
-                        order["product_id"] = str(order["product_id"])
-                    if order.get("customer_id"):
-                        order["customer_id"] = str(order["customer_id"])
-                    if order.get("vendor_id"):
-                        order["vendor_id"] = str(order["vendor_id"])
-                    # Convert timestamps
-                    for key in ["created_at", "updated_at"]:
-                        if order.get(key) and isinstance(order[key], datetime):
-                            order[key] = order[key].isoformat()
-                    orders.append(order)
-                
-                return orders
+                result = session.execute(text("""
+                    SELECT * FROM order_items
+                    WHERE order_id = :order_id
+                    ORDER BY position
+                """), {"order_id": order_id})
+                items = []
+                for row in result.fetchall():
+                    item = dict(row._mapping)
+                    item["id"] = str(item["id"])
+                    for key in ("unit_price", "line_total"):
+                        if item.get(key) is not None:
+                            item[key] = float(item[key])
+                    if item.get("created_at") and isinstance(item["created_at"], datetime):
+                        item["created_at"] = item["created_at"].isoformat()
+                    items.append(item)
+                return items
         except Exception as e:
-            print(f"Error fetching orders: {e}")
+            print(f"Error fetching order items: {e}")
             return []
     
-    def get_orders_by_customer(self, email: Optional[str] = None, phone: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get orders by customer email or phone."""
+    def get_sales_summary(self) -> Optional[Dict[str, Any]]:
+        """All-time order, revenue and unit totals computed in SQL."""
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                row = session.execute(text("""
+                    SELECT
+                        COUNT(*) AS total_orders,
+                        COUNT(*) FILTER (WHERE LOWER(o.payment_status) = 'paid') AS confirmed_orders,
+                        COALESCE(SUM(o.amount) FILTER (WHERE LOWER(o.payment_status) = 'paid'), 0) AS confirmed_value,
+                        COALESCE(SUM(COALESCE(oi.units, o.quantity, 1)) FILTER (
+                            WHERE LOWER(COALESCE(o.status, '')) NOT IN ('cancelled', 'failed')
+                              AND LOWER(COALESCE(o.payment_status, '')) NOT IN ('pending', 'failed')
+                        ), 0) AS units_sold,
+                        (SELECT COUNT(*) FROM products) AS total_products
+                    FROM orders o
+                    LEFT JOIN (
+                        SELECT order_id, SUM(quantity) AS units
+                        FROM order_items
+                        GROUP BY order_id
+                    ) oi ON oi.order_id = o.order_id
+                """)).fetchone()
+                summary = dict(row._mapping)
+                return {
+                    "total_orders": int(summary["total_orders"]),
+                    "confirmed_orders": int(summary["confirmed_orders"]),
+                    "confirmed_value": float(summary["confirmed_value"]),
+                    "units_sold": int(summary["units_sold"]),
+                    "total_products": int(summary["total_products"]),
+                }
+        except Exception as e:
+            print(f"Error fetching sales summary: {e}")
+            return None
+    
+    def get_inventory_summary(self) -> Optional[Dict[str, Any]]:
+        """Stock totals and breakdowns from inventory_summary(); None if the function is missing."""
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                summary = session.execute(text("SELECT inventory_summary()")).scalar()
+                return summary if isinstance(summary, dict) else None
+        except Exception as e:
+            print(f"Error fetching inventory summary: {e}")
+            return None
+    
+    def get_top_products(self, limit: int = 10, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Best-selling products of paid orders by revenue, from order_items."""
         if not self.engine:
             return []
         try:
             with self.get_session() as session:
-                if email:
-                    query = text("""
-                        SELECT * FROM orders
-                        WHERE customer_email = :email
-                        ORDER BY created_at DESC
-                    """)
-                    result = session.execute(query, {"email": email})
-                elif phone:
-                    clean_phone = phone.replace(" ", "").replace("-", "").replace("+", "")
-                    query = text("""
-                        SELECT * FROM orders
-                        WHERE customer_phone ILIKE :phone
-                        ORDER BY created_at DESC
-                    """)
-                    result = session.execute(query, {"phone": f"%{clean_phone}%"})
-                else:
-                    return []
-                
-                rows = result.fetchall()
-                orders = []
-                for row in rows:
-                    order = dict(row._mapping)
-                    # Convert types
-                    if order.get("id"):
-                        order["id"] = str(order["id"])
-                    if order.get("product_id"):
-                        order["product_id"] = str(order["product_id"])
-                    if order.get("customer_id"):
-                        order["customer_id"] = str(order["customer_id"])
-                    if order.get("vendor_id"):
-                        order["vendor_id"] = str(order["vendor_id"])
-                    # Convert timestamps
-                    for key in ["created_at", "updated_at"]:
-                        if order.get(key) and isinstance(order[key], datetime):
-                            order[key] = order[key].isoformat()
-                    orders.append(order)
-                
-                return orders
+                since_clause = "AND o.created_at >= CAST(:since AS timestamptz)" if since else ""
+                result = session.execute(text(f"""
+                    SELECT MAX(oi.product_id) AS product_id,
+                           MAX(oi.name) AS name,
+                           SUM(oi.quantity) AS units,
+                           SUM(oi.line_total) AS revenue,
+                           COUNT(DISTINCT oi.order_id) AS orders
+                    FROM order_items oi
+                    JOIN orders o ON o.order_id = oi.order_id
+                    WHERE LOWER(o.payment_status) = 'paid' {since_clause}
+                    GROUP BY COALESCE(oi.product_id, oi.name)
+                    ORDER BY revenue DESC
+                    LIMIT :limit
+                """), {"limit": limit, "since": since})
+                return [
+                    {
+                        "product_id": row.product_id,
+                        "name": row.name,
+                        "units": int(row.units or 0),
+                        "revenue": float(row.revenue or 0),
+                        "orders": int(row.orders or 0),
+                    }
+                    for row in result.fetchall()
+                ]
+        except Exception as e:
+            print(f"Error fetching top products: {e}")
+            return []
+    
+    def search_customers(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        POS customer search on the indexed normalized columns: name word
+        prefixes, email prefixes or phone prefixes. Customers that only exist
+        on store bills are included for phone searches. Spend and purchase
+        counts come from the customer_stats projection.
+        """
+        if not self.engine:
+            return []
+        terms = customer_search_terms(query)
+        if not any(terms.values()):
+            return []
+        try:
+            with self.get_session() as session:
+                result = session.execute(text("""
+                    WITH matched AS (
+                        SELECT to_jsonb(c) AS customer, c.phone_normalized, 0 AS source
+                        FROM customers c
+                        WHERE c.name ILIKE :name_prefix
+                           OR c.name ILIKE :name_word_prefix
+                           OR c.email_normalized LIKE :email_prefix
+                           OR c.phone_normalized LIKE :phone_prefix
+                        ORDER BY c.name
+                        LIMIT :limit
+                    ),
+                    bill_only AS (
+                        SELECT DISTINCT ON (b.customer_phone_normalized)
+                               jsonb_build_object(
+                                   'id', 'bill_customer_' || b.customer_phone,
+                                   'name', b.customer_name,
+                                   'phone', b.customer_phone,
+                                   'email', b.customer_email
+                               ) AS customer,
+                               b.customer_phone_normalized AS phone_normalized,
+                               1 AS source
+                        FROM store_bills b
+                        WHERE b.customer_phone_normalized LIKE :phone_prefix
+                          AND NOT EXISTS (
+                              SELECT 1 FROM customers c WHERE c.phone_normalized = b.customer_phone_normalized
+                          )
+                        ORDER BY b.customer_phone_normalized, b.created_at DESC
+                        LIMIT :limit
+                    ),
+                    results AS (
+                        SELECT * FROM matched
+                        UNION ALL
+                        SELECT * FROM bill_only
+                        ORDER BY source
+                        LIMIT :limit
+                    )
+                    SELECT r.customer,
+                           COALESCE(cs.total_spent, 0) AS total_spent,
+                           COALESCE(cs.order_count, 0) AS order_count,
+                           cs.last_purchase_at
+                    FROM results r
+                    LEFT JOIN customer_stats cs ON cs.phone_normalized = r.phone_normalized
+                    ORDER BY r.source
+                """), {**terms, "limit": limit})
+                return [
+                    {
+                        **row.customer,
+                        "total_spent": float(row.total_spent or 0),
+                        "order_count": int(row.order_count or 0),
+                        "last_purchase_at": row.last_purchase_at.isoformat() if row.last_purchase_at else None,
+                    }
+                    for row in result.fetchall()
+                ]
+        except Exception as e:
+            print(f"Error searching customers: {e}")
+            return []
+    
+    def get_customer_stats(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Lifetime stats of the customer with this phone from customer_stats."""
+        phone_normalized = normalize_phone(phone)
+        if not self.engine or not phone_normalized:
+            return None
+        try:
+            with self.get_session() as session:
+                row = session.execute(
+                    text("SELECT * FROM customer_stats WHERE phone_normalized = :phone"),
+                    {"phone": phone_normalized},
+                ).fetchone()
+                if not row:
+                    return None
+                stats = dict(row._mapping)
+                for key, value in stats.items():
+                    if isinstance(value, datetime):
+                        stats[key] = value.isoformat()
+                    elif key.endswith("_spent"):
+                        stats[key] = float(value or 0)
+                return stats
+        except Exception as e:
+            print(f"Error fetching customer stats: {e}")
+            return None
+    
+    def rebuild_customer_stats(self) -> Optional[int]:
+        """Recompute customer_stats from store bills and orders. Returns the number of customers."""
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                count = session.execute(text("SELECT rebuild_customer_stats()")).scalar()
+                session.commit()
+                return int(count or 0)
+        except Exception as e:
+            print(f"Error rebuilding customer stats: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def record_stock_movements(
+        self,
+        movement_type: str,
+        items: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Append stock movements and apply them to products and inventory with
+        record_stock_movements(). Returns the number of products changed; None
+        if the function does not exist. Other database errors are raised.
+        """
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                count = session.execute(
+                    text("""
+                        SELECT record_stock_movements(
+                            CAST(:movement_type AS text), CAST(:items AS jsonb), CAST(:reference_id AS text), CAST(:note AS text)
+                        )
+                    """),
+                    {"movement_type": movement_type, "items": json.dumps(items), "reference_id": reference_id, "note": note},
+                ).scalar()
+                session.commit()
+                return int(count or 0)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"record_stock_movements() not found (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error recording stock movements: {e}")
+            raise
+    
+    def adjust_stock_level(
+        self, product_id: str, stock: int, reference_id: Optional[str] = None, note: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Set a product's stock as an adjustment movement. Returns the change; None
+        if the product or the function does not exist. Other database errors are raised.
+        """
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                delta = session.execute(
+                    text("""
+                        SELECT adjust_stock_level(
+                            CAST(:product_id AS uuid), CAST(:stock AS integer), CAST(:reference_id AS text), CAST(:note AS text)
+                        )
+                    """),
+                    {"product_id": product_id, "stock": int(stock), "reference_id": reference_id, "note": note},
+                ).scalar()
+                session.commit()
+                return None if delta is None else int(delta)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"adjust_stock_level() not found (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error adjusting stock level: {e}")
+            raise
+    
+    def set_color_stock_levels(
+        self,
+        product_id: str,
+        color_stock: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Set a product's per-colour stock as adjustment movements, under the product's
+        row lock. Returns the change in total stock; None if the product or the
+        function does not exist. Other database errors are raised.
+        """
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                delta = session.execute(
+                    text("""
+                        SELECT set_color_stock_levels(
+                            CAST(:product_id AS uuid), CAST(:color_stock AS jsonb), CAST(:reference_id AS text), CAST(:note AS text)
+                        )
+                    """),
+                    {"product_id": product_id, "color_stock": json.dumps(color_stock), "reference_id": reference_id, "note": note},
+                ).scalar()
+                session.commit()
+                return None if delta is None else int(delta)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"set_color_stock_levels() not found (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error setting colour stock levels: {e}")
+            raise
+    
+    def get_stock_movements(self, product_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest stock movements, optionally of one product."""
+        if not self.engine:
+            return []
+        try:
+            with self.get_session() as session:
+                where_clause = "WHERE m.product_id = CAST(:product_id AS uuid)" if product_id else ""
+                result = session.execute(text(f"""
+                    SELECT m.*, p.name AS product_name, p.sku AS product_sku
+                    FROM stock_movements m
+                    LEFT JOIN products p ON p.id = m.product_id
+                    {where_clause}
+                    ORDER BY m.created_at DESC, m.id DESC
+                    LIMIT :limit
+                """), {"product_id": product_id, "limit": limit})
+                movements = []
+                for row in result.fetchall():
+                    movement = dict(row._mapping)
+                    movement["product_id"] = str(movement["product_id"])
+                    if isinstance(movement.get("created_at"), datetime):
+                        movement["created_at"] = movement["created_at"].isoformat()
+                    movements.append(movement)
+                return movements
+        except Exception as e:
+            print(f"Error fetching stock movements: {e}")
+            return []
+    
+    def get_stock_movement_summary(self, since: Optional[str] = None, until: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Movement totals per type and product from stock_movement_summary(); None if it is missing."""
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                summary = session.execute(
+                    text("SELECT stock_movement_summary(CAST(:since AS timestamptz), CAST(:until AS timestamptz))"),
+                    {"since": since, "until": until},
+                ).scalar()
+                return summary if isinstance(summary, dict) else None
+        except Exception as e:
+            print(f"Error fetching stock movement summary: {e}")
+            return None
+    
+    def process_store_refund(
+        self,
+        bill_id: str,
+        items: List[Dict[str, Any]],
+        reason: Optional[str] = None,
+        refund_amount: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Refund a store bill with process_store_refund(): bill status, restock and
+        stock movements in one transaction. None if the function does not exist;
+        any other database error is raised, since the refund may have been applied.
+        """
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                result = session.execute(
+                    text("""
+                        SELECT process_store_refund(
+                            CAST(:bill_id AS uuid), CAST(:items AS jsonb), CAST(:reason AS text), CAST(:refund_amount AS numeric)
+                        )
+                    """),
+                    {
+                        "bill_id": bill_id,
+                        "items": json.dumps(items),
+                        "reason": reason,
+                        "refund_amount": refund_amount,
+                    },
+                ).scalar()
+                session.commit()
+                if not isinstance(result, dict):
+                    raise RuntimeError(f"process_store_refund() returned {result!r}")
+                return result
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"process_store_refund() not found (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error processing store refund: {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+    
+    def _order_from_row(self, row: Any) -> Dict[str, Any]:
+        order = dict(row._mapping)
+        # Convert types
+        for key in ["id", "product_id", "customer_id", "vendor_id"]:
+            if order.get(key):
+                order[key] = str(order[key])
+        # Convert timestamps
+        for key in ["created_at", "updated_at"]:
+            if order.get(key) and isinstance(order[key], datetime):
+                order[key] = order[key].isoformat()
+        return order
+    
+    def get_orders_by_email(self, email: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get orders by customer email, newest first."""
+        return self.get_orders_by_customer(email=email, limit=limit, offset=offset)
+    
+    def get_orders_by_customer(
+        self, email: Optional[str] = None, phone: Optional[str] = None, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Get orders by customer email or phone, newest first, one page at a time.
+        Both are equality lookups on the indexed normalized columns.
+        """
+        if not self.engine:
+            return []
+        if email:
+            column, value = "customer_email_normalized", normalize_email(email)
+        elif phone:
+            column, value = "customer_phone_normalized", normalize_phone(phone)
+        else:
+            return []
+        if not value:
+            return []
+        try:
+            with self.get_session() as session:
+                query = text(f"""
+                    SELECT * FROM orders
+                    WHERE {column} = :value
+                    ORDER BY created_at DESC
+                    LIMIT :limit OFFSET :offset
+                """)
+                result = session.execute(query, {"value": value, "limit": limit, "offset": offset})
+                return [self._order_from_row(row) for row in result.fetchall()]
         except Exception as e:
             print(f"Error fetching orders: {e}")
             return []
@@ -547,88 +982,261 @@ class DatabaseService:
             print(f"Error fetching order: {e}")
             return None
     
-    def get_complete_order_for_invoice(self, order_id: str) -> Optional[Dict[str, Any]]:
-        """Get complete order data with product information for invoice generation."""
+    def get_pending_payment_orders(self, created_before: datetime, created_after: datetime, limit: int = 200) -> List[Dict[str, Any]]:
+        """PhonePe orders still waiting for payment, oldest first, with their latest merchant order id."""
         if not self.engine:
-            return None
+            return []
         try:
             with self.get_session() as session:
-                # Try by order_id first
                 query = text("""
-                    SELECT o.*, 
-                           p.id as product_id, p.name as product_name, p.images, 
-                           p.cover_image_index, p.colors, p.color_images, p.saree_id,
-                           v.id as vendor_id, v.name as vendor_name, v.vendor_code
+                    SELECT o.order_id, o.payment_method, o.amount, o.created_at,
+                           ps.transaction_id AS gateway_order_id
                     FROM orders o
-                    LEFT JOIN products p ON o.product_id = p.id
-                    LEFT JOIN vendors v ON o.vendor_id = v.id
-                    WHERE o.order_id = :order_id
-                    LIMIT 1
+                    JOIN LATERAL (
+                        SELECT transaction_id FROM payment_sessions
+                        WHERE order_id = o.order_id AND gateway = 'phonepe'
+                        ORDER BY created_at DESC
+                        LIMIT 1
+                    ) ps ON TRUE
+                    WHERE o.payment_status = 'pending'
+                      AND o.created_at < :created_before
+                      AND o.created_at >= :created_after
+                    ORDER BY o.created_at ASC
+                    LIMIT :limit
                 """)
-                result = session.execute(query, {"order_id": order_id})
-                row = result.fetchone()
-                
-                if not row:
-                    # Try by UUID
-                    query = text("""
-                        SELECT o.*, 
-                               p.id as product_id, p.name as product_name, p.images, 
-                               p.cover_image_index, p.colors, p.color_images, p.saree_id,
-                               v.id as vendor_id, v.name as vendor_name, v.vendor_code
+                result = session.execute(query, {
+                    "created_before": created_before,
+                    "created_after": created_after,
+                    "limit": limit,
+                })
+                orders = []
+                for row in result.fetchall():
+                    order = dict(row._mapping)
+                    if order.get("created_at") and isinstance(order["created_at"], datetime):
+                        order["created_at"] = order["created_at"].isoformat()
+                    orders.append(order)
+                return orders
+        except Exception as e:
+            print(f"Error fetching pending orders: {e}")
+            return []
+    
+    def bulk_update_order_payments(self, updates: List[Dict[str, Any]]) -> List[str]:
+        """
+        Settle several pending orders in one statement. Orders that are no
+        longer pending (e.g. a webhook won the race) are left untouched.
+        Returns the order_ids that were updated.
+        """
+        if not self.engine or not updates:
+            return []
+        try:
+            with self.get_session() as session:
+                query = text("""
+                    UPDATE orders o
+                    SET payment_status = u.payment_status,
+                        status = u.status,
+                        transaction_id = COALESCE(u.transaction_id, o.transaction_id),
+                        payment_gateway_response = COALESCE(u.payment_gateway_response, o.payment_gateway_response),
+                        updated_at = NOW()
+                    FROM jsonb_to_recordset(CAST(:updates AS jsonb)) AS u(
+                        order_id TEXT, payment_status TEXT, status TEXT,
+                        transaction_id TEXT, payment_gateway_response JSONB
+                    )
+                    WHERE o.order_id = u.order_id AND o.payment_status = 'pending'
+                    RETURNING o.order_id
+                """)
+                result = session.execute(query, {"updates": json.dumps(updates, default=str)})
+                updated = [row[0] for row in result.fetchall()]
+                session.commit()
+                return updated
+        except Exception as e:
+            print(f"Error updating order payments: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    def create_websocket_connections(self, records: List[Dict[str, Any]]) -> int:
+        """Insert WebSocket connection audit rows in one statement. Returns the rows written."""
+        if not self.engine or not records:
+            return 0
+        try:
+            with self.get_session() as session:
+                query = text("""
+                    INSERT INTO websocket_connections
+                        (connection_id, order_id, connection_type, is_active, connected_at, disconnected_at)
+                    SELECT r.connection_id, r.order_id, r.connection_type, r.is_active, r.connected_at, r.disconnected_at
+                    FROM jsonb_to_recordset(CAST(:records AS jsonb)) AS r(
+                        connection_id TEXT, order_id TEXT, connection_type TEXT, is_active BOOLEAN,
+                        connected_at TIMESTAMP, disconnected_at TIMESTAMP
+                    )
+                """)
+                result = session.execute(query, {"records": json.dumps(records, default=str)})
+                session.commit()
+                return result.rowcount
+        except Exception as e:
+            print(f"Error storing connections: {e}")
+            return 0
+    
+    def close_websocket_connections(self, closed: List[Dict[str, Any]]) -> int:
+        """
+        Mark WebSocket connection audit rows inactive in one statement. `closed` is a
+        list of {"connection_id", "disconnected_at"}. Returns the rows updated.
+        """
+        if not self.engine or not closed:
+            return 0
+        try:
+            with self.get_session() as session:
+                query = text("""
+                    UPDATE websocket_connections w
+                    SET is_active = FALSE, disconnected_at = c.disconnected_at
+                    FROM jsonb_to_recordset(CAST(:closed AS jsonb)) AS c(connection_id TEXT, disconnected_at TIMESTAMP)
+                    WHERE w.connection_id = c.connection_id
+                """)
+                result = session.execute(query, {"closed": json.dumps(closed, default=str)})
+                session.commit()
+                return result.rowcount
+        except Exception as e:
+            print(f"Error updating connections: {e}")
+            return 0
+    
+    def get_complete_order_for_invoice(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get complete order data with product, vendor and line items for invoice
+        generation in a single query. `order_id` may also be the order's UUID.
+        """
+        if not self.engine:
+            return None
+        order_uuid = _as_uuid(order_id)
+        items_sql = """(
+                SELECT COALESCE(json_agg(oi ORDER BY oi.position), '[]'::json)
+                FROM order_items oi WHERE oi.order_id = o.order_id
+            )"""
+        try:
+            with self.get_session() as session:
+                for items_expr in ((items_sql, "NULL") if self._order_items_joined else ("NULL",)):
+                    query = text(f"""
+                        SELECT o.*,
+                               CASE WHEN p.id IS NULL THEN NULL ELSE json_build_object(
+                                   'id', p.id, 'name', p.name, 'images', p.images,
+                                   'cover_image_index', p.cover_image_index, 'colors', p.colors,
+                                   'color_images', p.color_images, 'saree_id', p.saree_id
+                               ) END AS product,
+                               CASE WHEN v.id IS NULL THEN NULL ELSE json_build_object(
+                                   'id', v.id, 'name', v.name, 'vendor_code', v.vendor_code
+                               ) END AS vendor,
+                               {items_expr} AS items
                         FROM orders o
                         LEFT JOIN products p ON o.product_id = p.id
                         LEFT JOIN vendors v ON o.vendor_id = v.id
-                        WHERE o.id = :order_id::uuid
+                        WHERE o.order_id = :order_id OR o.id = CAST(:order_uuid AS uuid)
+                        ORDER BY (o.order_id = :order_id) DESC
                         LIMIT 1
                     """)
-                    result = session.execute(query, {"order_id": order_id})
-                    row = result.fetchone()
+                    try:
+                        row = session.execute(query, {"order_id": order_id, "order_uuid": order_uuid}).fetchone()
+                        break
+                    except Exception as e:
+                        if items_expr == "NULL":
+                            raise
+                        # order_items not created yet (db/create_order_items.sql)
+                        print(f"Invoice query without order_items: {e}")
+                        session.rollback()
+                        self._order_items_joined = False
                 
-                if row:
-                    order = dict(row._mapping)
-                    # Convert types
-                    if order.get("id"):
-                        order["id"] = str(order["id"])
-                    if order.get("product_id"):
-                        order["product_id"] = str(order["product_id"])
-                    if order.get("customer_id"):
-                        order["customer_id"] = str(order["customer_id"])
-                    if order.get("vendor_id"):
-                        order["vendor_id"] = str(order["vendor_id"])
-                    
-                    # Format product data
-                    if order.get("product_name"):
-                        order["product"] = {
-                            "id": order.get("product_id"),
-                            "name": order.get("product_name"),
-                            "images": order.get("images"),
-                            "cover_image_index": order.get("cover_image_index"),
-                            "colors": order.get("colors"),
-                            "color_images": order.get("color_images"),
-                            "saree_id": order.get("saree_id")
-                        }
-                    
-                    # Format vendor data
-                    if order.get("vendor_name"):
-                        order["vendor"] = {
-                            "id": order.get("vendor_id"),
-                            "name": order.get("vendor_name"),
-                            "vendor_code": order.get("vendor_code")
-                        }
-                    
-                    # Convert timestamps
-                    for key in ["created_at", "updated_at"]:
-                        if order.get(key) and isinstance(order[key], datetime):
-                            order[key] = order[key].isoformat()
-                    
-                    return order
-                return None
+                if not row:
+                    return None
+                
+                order = dict(row._mapping)
+                # Convert types
+                for key in ["id", "product_id", "customer_id", "vendor_id"]:
+                    if order.get(key):
+                        order[key] = str(order[key])
+                if order.get("items") is None:
+                    order.pop("items", None)
+                
+                # Convert timestamps
+                for key in ["created_at", "updated_at"]:
+                    if order.get(key) and isinstance(order[key], datetime):
+                        order[key] = order[key].isoformat()
+                
+                return order
         except Exception as e:
             print(f"Error fetching complete order: {e}")
             import traceback
             traceback.print_exc()
             return None
     
+    def _discount_from_row(self, row: Any) -> Dict[str, Any]:
+        discount = dict(row._mapping)
+        if discount.get("id"):
+            discount["id"] = str(discount["id"])
+        for key, value in discount.items():
+            if isinstance(value, datetime):
+                discount[key] = value.isoformat()
+            elif key in ("discount_value", "maximum_discount_amount", "minimum_purchase_amount") and value is not None:
+                discount[key] = float(value)
+        return discount
+    
+    def get_store_discount(self, code: str) -> Optional[Dict[str, Any]]:
+        """Active store discount by code (case-insensitive, via the code index)."""
+        if not self.engine or not code:
+            return None
+        try:
+            with self.get_session() as session:
+                row = session.execute(text("""
+                    SELECT * FROM store_discounts
+                    WHERE upper(discount_code) = upper(:code) AND is_active = TRUE
+                    LIMIT 1
+                """), {"code": code.strip()}).fetchone()
+                return self._discount_from_row(row) if row else None
+        except Exception as e:
+            print(f"Error fetching store discount: {e}")
+            return None
+    
+    def redeem_store_discount(self, discount_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Count one use of a discount if it is active, within its dates and below
+        max_uses (unset or 0 means unlimited), in a single conditional UPDATE.
+        Returns the updated row, or None when the discount can no longer be used.
+        """
+        if not self.engine:
+            return None
+        try:
+            with self.get_session() as session:
+                row = session.execute(text("""
+                    UPDATE store_discounts
+                    SET current_uses = COALESCE(current_uses, 0) + 1, updated_at = NOW()
+                    WHERE id = CAST(:id AS uuid)
+                      AND is_active = TRUE
+                      AND (start_date IS NULL OR start_date <= NOW())
+                      AND (end_date IS NULL OR end_date >= NOW())
+                      AND (COALESCE(max_uses, 0) <= 0 OR COALESCE(current_uses, 0) < max_uses)
+                    RETURNING *
+                """), {"id": discount_id}).fetchone()
+                session.commit()
+                return self._discount_from_row(row) if row else None
+        except Exception as e:
+            print(f"Error redeeming store discount: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    def release_store_discount(self, discount_id: str) -> bool:
+        """Give back a use counted by redeem_store_discount (e.g. the bill was not created)."""
+        if not self.engine:
+            return False
+        try:
+            with self.get_session() as session:
+                result = session.execute(text("""
+                    UPDATE store_discounts
+                    SET current_uses = GREATEST(COALESCE(current_uses, 0) - 1, 0), updated_at = NOW()
+                    WHERE id = CAST(:id AS uuid)
+                """), {"id": discount_id})
+                session.commit()
+                return result.rowcount > 0
+        except Exception as e:
+            print(f"Error releasing store discount: {e}")
+            return False
+    
     def get_pincode_details(self, pincode: str) -> Optional[Dict[str, Any]]:
         """Get pincode delivery details."""
         if not self.engine:
@@ -0,0 +1,27 @@
+"""Classification of database errors raised by either backend."""
+
+from typing import Optional
+
+# Postgres SQLSTATE undefined_function
+UNDEFINED_FUNCTION = "42883"
+# PostgREST: no function matches the RPC name/arguments in its schema cache
+PGRST_FUNCTION_NOT_FOUND = "PGRST202"
+
+
+def error_code(error: BaseException) -> Optional[str]:
+    """SQLSTATE or PostgREST code of a database error, if it carries one."""
+    # SQLAlchemy wraps the driver error in .orig (psycopg2: pgcode, asyncpg/psycopg: sqlstate)
+    for candidate in (getattr(error, "orig", None), error):
+        for attribute in ("pgcode", "sqlstate", "code"):
+            code = getattr(candidate, attribute, None)
+            if isinstance(code, str) and code:
+                return code
+    return None
+
+
+def is_undefined_function(error: BaseException) -> bool:
+    """
+    True when a database function is missing (its SQL script has not been
+    run yet), as opposed to the function failing.
+    """
+    return error_code(error) in (UNDEFINED_FUNCTION, PGRST_FUNCTION_NOT_FOUND)
@@ -1,8 +1,10 @@
 """Unified database service that can use either Render PostgreSQL or Supabase."""
 
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from ..config import get_settings
+from .customer_search import NORMALIZED_COLUMNS
 from .database import database_service
 from .supabase_client import supabase_service
 
@@ -92,6 +94,16 @@ class UnifiedDatabaseService:
             return None
         return self.service.get_product_by_name(product_name)
     
+    def get_product_by_sku(self, sku: str) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_product_by_sku(sku)
+    
+    def get_products_updated_since(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.get_products_updated_since(since)
+    
     def get_categories(self) -> List[Dict[str, Any]]:
         if not self.service:
             return []
@@ -127,26 +139,148 @@ class UnifiedDatabaseService:
             return None
         return self.service.create_order(order_data)
     
-    def get_orders_by_email(self, email: str) -> List[Dict[str, Any]]:
+    def get_order_items(self, order_id: str) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.get_order_items(order_id)
+    
+    def get_sales_summary(self) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_sales_summary()
+    
+    def get_inventory_summary(self) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_inventory_summary()
+    
+    def get_top_products(self, limit: int = 10, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.get_top_products(limit, since)
+    
+    def search_customers(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.search_customers(query, limit)
+    
+    def get_customer_stats(self, phone: str) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_customer_stats(phone)
+    
+    def rebuild_customer_stats(self) -> Optional[int]:
+        if not self.service:
+            return None
+        return self.service.rebuild_customer_stats()
+    
+    def record_stock_movements(
+        self,
+        movement_type: str,
+        items: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        if not self.service:
+            return None
+        return self.service.record_stock_movements(movement_type, items, reference_id=reference_id, note=note)
+    
+    def adjust_stock_level(
+        self, product_id: str, stock: int, reference_id: Optional[str] = None, note: Optional[str] = None
+    ) -> Optional[int]:
+        if not self.service:
+            return None
+        return self.service.adjust_stock_level(product_id, stock, reference_id=reference_id, note=note)
+    
+    def set_color_stock_levels(
+        self,
+        product_id: str,
+        color_stock: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        if not self.service:
+            return None
+        return self.service.set_color_stock_levels(product_id, color_stock, reference_id=reference_id, note=note)
+    
+    def get_stock_movements(self, product_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
         if not self.service:
             return []
-        return self.service.get_orders_by_email(email)
+        return self.service.get_stock_movements(product_id=product_id, limit=limit)
     
-    def get_orders_by_customer(self, email: Optional[str] = None, phone: Optional[str] = None) -> List[Dict[str, Any]]:
+    def get_stock_movement_summary(self, since: Optional[str] = None, until: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_stock_movement_summary(since=since, until=until)
+    
+    def process_store_refund(
+        self,
+        bill_id: str,
+        items: List[Dict[str, Any]],
+        reason: Optional[str] = None,
+        refund_amount: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.process_store_refund(bill_id, items, reason=reason, refund_amount=refund_amount)
+    
+    def get_orders_by_email(self, email: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.get_orders_by_email(email, limit=limit, offset=offset)
+    
+    def get_orders_by_customer(
+        self, email: Optional[str] = None, phone: Optional[str] = None, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
         if not self.service:
             return []
-        return self.service.get_orders_by_customer(email=email, phone=phone)
+        return self.service.get_orders_by_customer(email=email, phone=phone, limit=limit, offset=offset)
     
     def get_order_by_order_id(self, order_id: str) -> Optional[Dict[str, Any]]:
         if not self.service:
             return None
         return self.service.get_order_by_order_id(order_id)
     
+    def get_pending_payment_orders(self, created_before: datetime, created_after: datetime, limit: int = 200) -> List[Dict[str, Any]]:
+        if not self.service:
+            return []
+        return self.service.get_pending_payment_orders(created_before, created_after, limit)
+    
+    def bulk_update_order_payments(self, updates: List[Dict[str, Any]]) -> List[str]:
+        if not self.service:
+            return []
+        return self.service.bulk_update_order_payments(updates)
+    
+    def create_websocket_connections(self, records: List[Dict[str, Any]]) -> int:
+        if not self.service:
+            return 0
+        return self.service.create_websocket_connections(records)
+    
+    def close_websocket_connections(self, closed: List[Dict[str, Any]]) -> int:
+        if not self.service:
+            return 0
+        return self.service.close_websocket_connections(closed)
+    
     def get_complete_order_for_invoice(self, order_id: str) -> Optional[Dict[str, Any]]:
         if not self.service:
             return None
         return self.service.get_complete_order_for_invoice(order_id)
     
+    def get_store_discount(self, code: str) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.get_store_discount(code)
+    
+    def redeem_store_discount(self, discount_id: str) -> Optional[Dict[str, Any]]:
+        if not self.service:
+            return None
+        return self.service.redeem_store_discount(discount_id)
+    
+    def release_store_discount(self, discount_id: str) -> bool:
+        if not self.service:
+            return False
+        return self.service.release_store_discount(discount_id)
+    
     def get_pincode_details(self, pincode: str) -> Optional[Dict[str, Any]]:
         if not self.service:
             return None
@@ -183,6 +317,8 @@ class UnifiedDatabaseService:
         if not self.service:
             return None
         if hasattr(self.service, 'admin_update'):
+            # Edited rows often come back with their generated columns, which cannot be set
+            data = {k: v for k, v in data.items() if k not in NORMALIZED_COLUMNS}
             return self.service.admin_update(table_name, item_id, data, id_column)
         return None
     
@@ -0,0 +1,109 @@
+"""Store discount codes: cached lookup, validation and atomic usage counting."""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+from .parsing import parse_timestamp
+
+
+def _minimum_purchase(discount: Dict[str, Any]) -> float:
+    return float(discount.get("minimum_purchase_amount") or discount.get("minimum_amount") or 0)
+
+
+class DiscountService:
+    """
+    Active store discounts, cached per worker by upper-cased code.
+
+    The cache is only used to reject bad codes and price a cart quickly;
+    `redeem()` is the authority on whether a use is still available, since
+    it counts the use with one conditional UPDATE in the database.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._by_code: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+
+    def _load(self) -> None:
+        discounts = db_service.admin_get_all("store_discounts", filters={"is_active": True})
+        self._by_code = {
+            str(d.get("discount_code")).strip().upper(): d for d in discounts if d.get("discount_code")
+        }
+        self._loaded_at = time.monotonic()
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        """Active discount for `code`, or None. Blocking; call from a thread in async code."""
+        key = (code or "").strip().upper()
+        if not key:
+            return None
+        if time.monotonic() - self._loaded_at >= self.settings.discount_cache_seconds:
+            self._load()
+        discount = self._by_code.get(key)
+        if discount is None:
+            # Created since the cache was loaded? One indexed lookup
+            discount = db_service.get_store_discount(key)
+            if discount:
+                self._by_code[key] = discount
+        return discount
+
+    @staticmethod
+    def check(discount: Dict[str, Any], amount: Optional[float] = None) -> Optional[str]:
+        """Why `discount` cannot be used right now (None if it can)."""
+        now = datetime.now(timezone.utc)
+        start = parse_timestamp(discount.get("start_date"))
+        end = parse_timestamp(discount.get("end_date"))
+        if start and start > now:
+            return "Discount not yet active"
+        if end and end < now:
+            return "Discount has expired"
+        # No limit when max_uses is unset or 0, as in redeem_store_discount
+        max_uses = discount.get("max_uses")
+        if max_uses and max_uses > 0 and (discount.get("current_uses") or 0) >= max_uses:
+            return "Discount usage limit reached"
+        minimum = _minimum_purchase(discount)
+        if amount is not None and minimum and amount < minimum:
+            return f"Minimum purchase amount of ₹{minimum:g} required"
+        return None
+
+    @staticmethod
+    def amount_for(discount: Dict[str, Any], subtotal: float) -> float:
+        """Discount granted on `subtotal`."""
+        value = float(discount.get("discount_value") or 0)
+        if discount.get("discount_type") == "percentage":
+            amount = subtotal * (value / 100)
+            if discount.get("maximum_discount_amount"):
+                amount = min(amount, float(discount["maximum_discount_amount"]))
+            return amount
+        return value
+
+    def redeem(self, discount: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Count one use. Returns (updated discount, None) or (None, reason) when
+        the discount ran out or expired in the meantime.
+        """
+        updated = db_service.redeem_store_discount(str(discount.get("id")))
+        key = str(discount.get("discount_code") or "").strip().upper()
+        if updated:
+            self._by_code[key] = updated
+            return updated, None
+        # Re-read it so the cache and the message reflect the current state
+        fresh = db_service.get_store_discount(key)
+        if fresh:
+            self._by_code[key] = fresh
+        else:
+            self._by_code.pop(key, None)
+        return None, (self.check(fresh) if fresh else None) or "Discount usage limit reached"
+
+    def release(self, discount: Dict[str, Any]) -> None:
+        """Undo a redeem() whose bill was not created."""
+        if db_service.release_store_discount(str(discount.get("id"))):
+            key = str(discount.get("discount_code") or "").strip().upper()
+            cached = self._by_code.get(key)
+            if cached and cached.get("current_uses"):
+                self._by_code[key] = {**cached, "current_uses": cached["current_uses"] - 1}
+
+
+discount_service = DiscountService()
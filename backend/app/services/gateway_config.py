@@ -0,0 +1,200 @@
+"""Cached payment gateway configuration, loaded from the database."""
+
+import threading
+import time
+import traceback
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+
+# Stored credentials use either camelCase (admin UI) or snake_case keys
+ZOHOPAY_KEY_MAPPING = {
+    "accountId": "account_id",
+    "accessToken": "access_token",
+    "apiKey": "api_key",
+    "refreshToken": "refresh_token",
+    "clientId": "client_id",
+    "clientSecret": "client_secret",
+}
+
+
+@dataclass(frozen=True, slots=True)
+class ZohoPayConfig:
+    access_token: Optional[str] = None
+    api_key: Optional[str] = None
+    account_id: Optional[str] = None
+    refresh_token: Optional[str] = None
+    client_id: Optional[str] = None
+    client_secret: Optional[str] = None
+    api_domain: Optional[str] = None
+    domain: str = "IN"
+    environment: Optional[str] = None
+    is_enabled: bool = True
+    source: str = "payment_config"
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Flat dict in the shape the ZohoPay routes have always used."""
+        data = {k: v for k, v in asdict(self).items() if k not in ("extra", "source", "is_enabled") and v is not None}
+        return {**self.extra, **data}
+
+
+@dataclass(frozen=True, slots=True)
+class EasebuzzConfig:
+    merchant_key: Optional[str] = None
+    salt: Optional[str] = None
+    environment: str = "test"
+    is_enabled: bool = True
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = dict(self.extra)
+        data.update({"merchant_key": self.merchant_key, "salt": self.salt, "environment": self.environment})
+        return data
+
+
+def _credentials(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Unwrap `encrypted_keys` (optionally nested under `encrypted_data`)."""
+    encrypted_keys = record.get("encrypted_keys") or {}
+    if isinstance(encrypted_keys, dict) and "encrypted_data" in encrypted_keys:
+        encrypted_keys = encrypted_keys["encrypted_data"]
+    return encrypted_keys if isinstance(encrypted_keys, dict) else {}
+
+
+def load_zohopay_config() -> Optional[ZohoPayConfig]:
+    records = db_service.admin_get_all("payment_config", filters={"payment_method": "zohopay"})
+    if records:
+        record = records[0]
+        data = _credentials(record)
+        if data:
+            normalized = {ZOHOPAY_KEY_MAPPING.get(k, k): v for k, v in data.items()}
+            known = {name for name in ZohoPayConfig.__dataclass_fields__ if name != "extra"}
+            return ZohoPayConfig(
+                access_token=normalized.get("access_token"),
+                # Widget API key falls back to the OAuth access token
+                api_key=normalized.get("api_key") or normalized.get("access_token"),
+                account_id=normalized.get("account_id"),
+                refresh_token=normalized.get("refresh_token"),
+                client_id=normalized.get("client_id"),
+                client_secret=normalized.get("client_secret"),
+                api_domain=normalized.get("api_domain"),
+                domain=normalized.get("domain") or "IN",
+                environment=normalized.get("environment"),
+                is_enabled=bool(record.get("is_enabled", True)),
+                extra={k: v for k, v in {**data, **normalized}.items() if k not in known},
+            )
+
+    tokens = db_service.admin_get_all("zoho_oauth_tokens")
+    if tokens:
+        token = tokens[0]
+        return ZohoPayConfig(
+            access_token=token.get("access_token"),
+            api_key=token.get("api_key") or token.get("access_token"),
+            account_id=token.get("account_id") or None,
+            refresh_token=token.get("refresh_token") or None,
+            api_domain=token.get("api_domain"),
+            source="zoho_oauth_tokens",
+        )
+    return None
+
+
+def load_easebuzz_config() -> Optional[EasebuzzConfig]:
+    records = db_service.admin_get_all("payment_config", filters={"payment_method": "easebuzz"})
+    if not records:
+        return None
+    record = records[0]
+    merged = dict(_credentials(record))
+    configuration = record.get("configuration") or {}
+    if isinstance(configuration, dict):
+        merged.update(configuration)
+    if not merged:
+        return None
+    return EasebuzzConfig(
+        merchant_key=merged.get("merchantKey") or merged.get("merchant_key"),
+        salt=merged.get("salt") or merged.get("saltKey"),
+        environment=merged.get("environment", "test"),
+        is_enabled=bool(record.get("is_enabled", True)),
+        extra=merged,
+    )
+
+
+LOADERS: Dict[str, Callable[[], Any]] = {
+    "zohopay": load_zohopay_config,
+    "easebuzz": load_easebuzz_config,
+}
+
+
+class GatewayConfigRegistry:
+    """
+    Keeps the parsed config of each gateway in memory.
+
+    A config is read from the database once and then served from memory.
+    Admin writes call `refresh()` so changes apply immediately in this
+    worker; other workers pick them up when their copy goes stale, which
+    is refreshed in the background while the stale copy keeps serving.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._configs: Dict[str, Any] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+
+    def _load(self, gateway: str) -> Any:
+        if not db_service.is_available():
+            return None
+        try:
+            config = LOADERS[gateway]()
+        except Exception as e:
+            print(f"Error loading {gateway} config: {e}")
+            traceback.print_exc()
+            # Keep serving the last good copy
+            return self._configs.get(gateway)
+        with self._lock:
+            self._configs[gateway] = config
+            self._loaded_at[gateway] = time.monotonic()
+        return config
+
+    def _refresh_in_background(self, gateway: str) -> None:
+        with self._lock:
+            if gateway in self._refreshing:
+                return
+            self._refreshing.add(gateway)
+
+        def run() -> None:
+            try:
+                self._load(gateway)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(gateway)
+
+        threading.Thread(target=run, name=f"{gateway}-config-refresh", daemon=True).start()
+
+    def get(self, gateway: str) -> Any:
+        loaded_at = self._loaded_at.get(gateway)
+        if loaded_at is None:
+            return self._load(gateway)
+        if time.monotonic() - loaded_at > self.settings.gateway_config_ttl_seconds:
+            self._refresh_in_background(gateway)
+        return self._configs.get(gateway)
+
+    def zohopay(self) -> Optional[ZohoPayConfig]:
+        return self.get("zohopay")
+
+    def easebuzz(self) -> Optional[EasebuzzConfig]:
+        return self.get("easebuzz")
+
+    def refresh(self, gateway: Optional[str] = None) -> None:
+        """Reload one gateway (or all) right away, e.g. after an admin write."""
+        for name in [gateway] if gateway else list(LOADERS):
+            if name in LOADERS:
+                self._load(name)
+
+    def warm(self) -> None:
+        self.refresh()
+
+
+gateway_configs = GatewayConfigRegistry()
@@ -0,0 +1,185 @@
+"""Shared, pooled HTTP clients for payment gateway calls."""
+
+import importlib.util
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+
+from ..config import Settings, get_settings
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Failures where the request never reached the gateway, so even a POST is safe to resend
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Extra failures that are retried for idempotent requests (GET/HEAD)
+IDEMPOTENT_ERRORS = CONNECT_ERRORS + (httpx.ReadTimeout, httpx.RemoteProtocolError)
+RETRY_STATUS_CODES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Latency samples kept per gateway for percentiles
+LATENCY_WINDOW = 500
+
+
+class RetryableStatus(Exception):
+    def __init__(self, response: httpx.Response) -> None:
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+
+class GatewayLatency:
+    """Rolling latency and error counters for one gateway."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, elapsed_ms: float, failed: bool) -> None:
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.samples.append(elapsed_ms)
+        if failed:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class GatewayClient:
+    """
+    Long-lived `httpx.AsyncClient` for one gateway, with retries and latency metrics.
+
+    `async with gateway_http.client("phonepe") as client:` borrows the shared
+    client; leaving the block does not close it.
+    """
+
+    def __init__(self, name: str, settings: Settings) -> None:
+        self.name = name
+        self.settings = settings
+        self.latency = GatewayLatency()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            settings = self.settings
+            self._client = httpx.AsyncClient(
+                http2=settings.gateway_http2 and HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(settings.gateway_http_timeout, connect=settings.gateway_http_connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=settings.gateway_http_max_connections,
+                    max_keepalive_connections=settings.gateway_http_max_keepalive,
+                    keepalive_expiry=settings.gateway_http_keepalive_expiry,
+                ),
+                follow_redirects=False,
+            )
+        return self._client
+
+    async def request(self, method: str, url: str, *, retry: bool = True, **kwargs: Any) -> httpx.Response:
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        retry_errors = IDEMPOTENT_ERRORS if idempotent else CONNECT_ERRORS
+
+        def should_retry(exc: BaseException) -> bool:
+            if isinstance(exc, RetryableStatus):
+                return idempotent
+            return isinstance(exc, retry_errors)
+
+        attempts = max(1, self.settings.gateway_http_retries) if retry else 1
+        client = self._get_client()
+        response: Optional[httpx.Response] = None
+
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(attempts),
+                wait=wait_exponential_jitter(initial=0.2, max=2.0),
+                retry=retry_if_exception(should_retry),
+                reraise=True,
+            ):
+                with attempt:
+                    if attempt.retry_state.attempt_number > 1:
+                        self.latency.retries += 1
+                    started = time.perf_counter()
+                    failed = True
+                    try:
+                        response = await client.request(method, url, **kwargs)
+                        failed = response.status_code >= 500
+                    finally:
+                        self.latency.observe((time.perf_counter() - started) * 1000, failed)
+                    if idempotent and response.status_code in RETRY_STATUS_CODES:
+                        raise RetryableStatus(response)
+        except RetryableStatus as exc:
+            # Out of retries: hand the last response back like any other status
+            return exc.response
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> "GatewayClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        return None
+
+
+class GatewayHttpRegistry:
+    """One pooled client per payment gateway, created on first use."""
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._clients: Dict[str, GatewayClient] = {}
+
+    def client(self, gateway: str) -> GatewayClient:
+        client = self._clients.get(gateway)
+        if client is None:
+            client = GatewayClient(gateway, self.settings)
+            self._clients[gateway] = client
+        return client
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: client.latency.snapshot() for name, client in self._clients.items()}
+
+    async def close(self) -> None:
+        for client in self._clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Error closing {client.name} HTTP client: {e}")
+
+
+gateway_http = GatewayHttpRegistry()
@@ -0,0 +1,217 @@
+"""Parked POS carts (held transactions), kept apart from store_bills."""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from ..config import Settings, get_settings
+from .customer_search import normalize_phone
+from .db_service import db_service
+from .parsing import parse_json_list, parse_timestamp
+
+TABLE = "store_held_carts"
+
+
+def _cart_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    cart = dict(row)
+    cart["id"] = str(row.get("id"))
+    cart["items"] = parse_json_list(row.get("items"))
+    for key in ("created_at", "expires_at"):
+        if isinstance(cart.get(key), datetime):
+            cart[key] = cart[key].isoformat()
+    return cart
+
+
+class HeldCartStore:
+    """
+    Parked carts by id, with per-terminal and per-customer-phone indexes, so
+    parking, listing and resuming a cart never touch the sales tables.
+
+    Every cart is written through to `store_held_carts`, so it survives
+    restarts and other workers see it: listings reload the (small) table once
+    it is older than `held_carts_sync_seconds`, and resuming an id this worker
+    has not seen yet looks it up directly. Carts expire
+    `held_cart_ttl_seconds` after they were parked; expired rows are deleted
+    on the next reload.
+
+    All methods may query the database; call them from a thread in async code.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._carts: Dict[str, Dict[str, Any]] = {}
+        self._by_terminal: Dict[str, Dict[str, None]] = {}
+        self._by_phone: Dict[str, Dict[str, None]] = {}
+        # Carts whose database write failed: only this worker knows about them
+        self._unsaved: set = set()
+        # Monotonic time this worker finished writing / deleting a cart's row, so a
+        # reload whose read started earlier neither drops new carts nor revives removed ones
+        self._held_at: Dict[str, float] = {}
+        self._removed_at: Dict[str, float] = {}
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def _add(self, cart: Dict[str, Any]) -> None:
+        hold_id = cart["id"]
+        self._carts[hold_id] = cart
+        if cart.get("terminal_id"):
+            self._by_terminal.setdefault(str(cart["terminal_id"]), {})[hold_id] = None
+        phone = normalize_phone(cart.get("customer_phone"))
+        if phone:
+            self._by_phone.setdefault(phone, {})[hold_id] = None
+
+    def _remove(self, hold_id: str) -> Optional[Dict[str, Any]]:
+        cart = self._carts.pop(hold_id, None)
+        self._unsaved.discard(hold_id)
+        self._held_at.pop(hold_id, None)
+        if cart is None:
+            return None
+        for index, key in (
+            (self._by_terminal, str(cart.get("terminal_id") or "")),
+            (self._by_phone, normalize_phone(cart.get("customer_phone")) or ""),
+        ):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(hold_id, None)
+                if not ids:
+                    index.pop(key, None)
+        return cart
+
+    @staticmethod
+    def _expired(cart: Dict[str, Any], now: datetime) -> bool:
+        expires_at = parse_timestamp(cart.get("expires_at"))
+        return expires_at is not None and expires_at <= now
+
+    def _sync(self) -> None:
+        """Reload from the database if due, dropping (and deleting) expired carts."""
+        if time.monotonic() - self._synced_at < self.settings.held_carts_sync_seconds:
+            return
+        started = time.monotonic()
+        rows = db_service.admin_get_all(TABLE, order_by="created_at", desc=False)
+        now = datetime.now(timezone.utc)
+        expired = []
+        with self._lock:
+            # Unsaved carts, and carts held while the table was being read
+            local = {
+                hold_id: cart for hold_id, cart in self._carts.items()
+                if hold_id in self._unsaved or self._held_at.get(hold_id, 0.0) >= started
+            }
+            carts = [
+                cart for cart in (_cart_from_row(row) for row in rows)
+                if cart["id"] not in local and self._removed_at.get(cart["id"], 0.0) < started
+            ]
+            self._carts, self._by_terminal, self._by_phone = {}, {}, {}
+            for cart in carts + list(local.values()):
+                if self._expired(cart, now):
+                    expired.append(cart["id"])
+                else:
+                    self._add(cart)
+            self._unsaved = {hold_id for hold_id in self._unsaved if hold_id in self._carts}
+            # Changes made before the read started are reflected in it
+            self._held_at = {k: t for k, t in self._held_at.items() if t >= started and k in self._carts}
+            self._removed_at = {k: t for k, t in self._removed_at.items() if t >= started}
+            self._synced_at = time.monotonic()
+        for hold_id in expired:
+            db_service.admin_delete(TABLE, hold_id)
+
+    def hold(
+        self,
+        customer_name: Optional[str],
+        items: List[Dict[str, Any]],
+        customer_phone: Optional[str] = None,
+        terminal_id: Optional[str] = None,
+        notes: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Park a cart. Returns it with its `id`, `hold_number` and `expires_at`."""
+        hold_id = str(uuid4())
+        now = datetime.now(timezone.utc)
+        cart = {
+            "id": hold_id,
+            "hold_number": f"HOLD-{datetime.now().strftime('%Y%m%d')}-{hold_id[:8]}",
+            "terminal_id": terminal_id,
+            "customer_name": customer_name,
+            "customer_phone": customer_phone,
+            "items": items,
+            "notes": notes,
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(seconds=self.settings.held_cart_ttl_seconds)).isoformat(),
+        }
+        created = db_service.admin_create(TABLE, {**cart, "items": json.dumps(items)})
+        with self._lock:
+            self._add(cart)
+            self._held_at[hold_id] = time.monotonic()
+            if not created:
+                print(f"Warning: held cart {hold_id} was not saved to {TABLE}; it is only kept by this worker")
+                self._unsaved.add(hold_id)
+        return cart
+
+    def list_carts(self, terminal_id: Optional[str] = None, phone: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Carts still held, oldest first, optionally of one terminal and/or customer phone."""
+        self._sync()
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            if terminal_id or phone:
+                hold_ids: Optional[set] = None
+                for index, key in ((self._by_terminal, terminal_id), (self._by_phone, normalize_phone(phone))):
+                    if key:
+                        ids = set(index.get(str(key), {}))
+                        hold_ids = ids if hold_ids is None else hold_ids & ids
+                carts = [self._carts[hold_id] for hold_id in hold_ids or ()]
+            else:
+                carts = list(self._carts.values())
+        carts = [cart for cart in carts if not self._expired(cart, now)]
+        return sorted(carts, key=lambda cart: cart.get("created_at") or "")
+
+    def get(self, hold_id: str) -> Optional[Dict[str, Any]]:
+        """A held cart without resuming it, or None (unknown or expired)."""
+        with self._lock:
+            cart = self._carts.get(hold_id)
+        if cart is None:
+            # Parked on another worker since the last reload?
+            row = db_service.admin_get_by_id(TABLE, hold_id)
+            if not row:
+                return None
+            cart = _cart_from_row(row)
+            with self._lock:
+                self._add(cart)
+        if self._expired(cart, datetime.now(timezone.utc)):
+            self.discard(hold_id)
+            return None
+        return cart
+
+    def resume(self, hold_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Take a cart back to the till: returns it and removes it from the store.
+        None if it is unknown, expired or was resumed by someone else first.
+        """
+        cart = self.get(hold_id)
+        if cart is None:
+            return None
+        with self._lock:
+            unsaved = hold_id in self._unsaved
+            self._remove(hold_id)
+        # The delete is the claim: of two tills resuming the same cart only one removes the row
+        if not unsaved and not db_service.admin_delete(TABLE, hold_id):
+            return None
+        self._deleted(hold_id)
+        return cart
+
+    def discard(self, hold_id: str) -> bool:
+        """Drop a held cart. False if it was not held."""
+        with self._lock:
+            removed = self._remove(hold_id) is not None
+        deleted = db_service.admin_delete(TABLE, hold_id)
+        self._deleted(hold_id)
+        return deleted or removed
+
+    def _deleted(self, hold_id: str) -> None:
+        # A reload that read the table before the delete may have put the cart back
+        with self._lock:
+            self._remove(hold_id)
+            self._removed_at[hold_id] = time.monotonic()
+
+
+held_cart_store = HeldCartStore()
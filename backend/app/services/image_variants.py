@@ -0,0 +1,222 @@
+"""Resized WebP/AVIF derivatives of product images, cached in Cloudflare R2."""
+
+import asyncio
+import hashlib
+import io
+import json
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+try:
+    from PIL import Image, ImageOps, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+    print("Warning: Pillow not installed. Image variants disabled. Install with: pip install Pillow")
+
+from ..config import Settings, get_settings
+from .storage import R2StorageClient, storage_client
+
+# Variant name -> maximum width in pixels (height follows the aspect ratio)
+VARIANT_WIDTHS: Dict[str, int] = {
+    "thumb": 200,
+    "card": 600,
+    "zoom": 1600,
+}
+
+VARIANT_PREFIX = "_variants"
+
+CONTENT_TYPES = {
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+VariantMap = Dict[str, Dict[str, str]]
+
+
+def render_variants(
+    data: bytes,
+    widths: Tuple[Tuple[str, int], ...],
+    formats: Tuple[str, ...],
+    quality: int,
+) -> Dict[Tuple[str, str], bytes]:
+    """
+    Decode `data` once and encode every (variant, format) pair.
+
+    Runs inside a worker process, so it only takes and returns picklable values.
+    """
+    rendered: Dict[Tuple[str, str], bytes] = {}
+    with Image.open(io.BytesIO(data)) as opened:
+        source = ImageOps.exif_transpose(opened)
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "A" in source.getbands() else "RGB")
+        for name, width in widths:
+            image = source.copy()
+            # thumbnail() keeps the aspect ratio and never upscales
+            image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            for fmt in formats:
+                buffer = io.BytesIO()
+                image.save(buffer, format=fmt.upper(), quality=quality)
+                rendered[(name, fmt)] = buffer.getvalue()
+    return rendered
+
+
+class ImageVariantService:
+    """
+    Generates fixed-size product image variants in a process pool and stores
+    them in R2 under deterministic keys, so URLs can be derived without a lookup.
+    """
+
+    def __init__(self, storage: Optional[R2StorageClient] = None, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self.storage = storage or storage_client
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.formats = self._supported_formats()
+
+    def _supported_formats(self) -> Tuple[str, ...]:
+        if not PIL_AVAILABLE:
+            return ()
+        wanted = [f.strip().lower() for f in self.settings.image_variant_formats.split(",") if f.strip()]
+        supported = []
+        for fmt in wanted:
+            try:
+                if fmt in CONTENT_TYPES and features.check(fmt):
+                    supported.append(fmt)
+            except Exception:
+                continue
+        return tuple(supported)
+
+    def is_enabled(self) -> bool:
+        return (
+            self.settings.image_variants_enabled
+            and bool(self.formats)
+            and bool(self.settings.r2_public_base_url)
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.settings.image_variant_workers)
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _source_id(self, image: str) -> str:
+        """Stable key stem for an R2 key or an external image URL."""
+        key = self.storage.key_from_public_url(image) if "://" in image else image
+        if key:
+            # Keep the extension so a.jpg and a.png get different variants
+            stem, ext = posixpath.splitext(key.lstrip("/"))
+            return f"{stem}-{ext.lstrip('.').lower()}" if ext else stem
+        return "external/" + hashlib.sha1(image.encode("utf-8")).hexdigest()
+
+    def _sentinel(self) -> Tuple[str, str]:
+        return list(VARIANT_WIDTHS)[-1], self.formats[-1]
+
+    def variant_key(self, image: str, variant: str, fmt: str) -> str:
+        return f"{VARIANT_PREFIX}/{variant}/{self._source_id(image)}.{fmt}"
+
+    def variant_map(self, image: Optional[str]) -> VariantMap:
+        """{variant: {format: public_url}} for an image, or {} when variants are off."""
+        if not image or not isinstance(image, str) or not self.is_enabled():
+            return {}
+        return {
+            variant: {
+                fmt: self.storage.public_url(self.variant_key(image, variant, fmt))
+                for fmt in self.formats
+            }
+            for variant in VARIANT_WIDTHS
+        }
+
+    @staticmethod
+    def stored_variants(product: Dict[str, Any]) -> Dict[str, VariantMap]:
+        """{image: variant map} saved on a product row for images whose variants were generated."""
+        stored = product.get("image_variants")
+        # JSONB object, or that object encoded as a JSON string
+        while isinstance(stored, str):
+            try:
+                stored = json.loads(stored)
+            except ValueError:
+                return {}
+        return stored if isinstance(stored, dict) else {}
+
+    async def generate(self, image: str, data: bytes) -> VariantMap:
+        """Render every variant of `data` off the event loop and upload them."""
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(
+            self._get_executor(),
+            render_variants,
+            data,
+            tuple(VARIANT_WIDTHS.items()),
+            self.formats,
+            self.settings.image_variant_quality,
+        )
+        sentinel = self._sentinel()
+        await asyncio.gather(*(
+            self.storage.upload_bytes(self.variant_key(image, variant, fmt), body, CONTENT_TYPES[fmt])
+            for (variant, fmt), body in rendered.items()
+            if (variant, fmt) != sentinel
+        ))
+        # Written last so its presence means the whole set is in R2
+        await self.storage.upload_bytes(
+            self.variant_key(image, *sentinel), rendered[sentinel], CONTENT_TYPES[sentinel[1]]
+        )
+        return self.variant_map(image)
+
+    async def upload_image(self, key: str, data: bytes, content_type: Optional[str] = None) -> Dict[str, Any]:
+        """Upload an original image and its variants in one step."""
+        await self.storage.upload_bytes(key, data, content_type)
+        variants = await self.generate(key, data) if self.is_enabled() else {}
+        return {"key": key, "url": self.storage.public_url(key), "variants": variants}
+
+    async def _load_source(self, image: str) -> bytes:
+        key = self.storage.key_from_public_url(image) if "://" in image else image
+        if key:
+            return await self.storage.download_bytes(key)
+        async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+            response = await client.get(image)
+            response.raise_for_status()
+            return response.content
+
+    async def ensure_variants(self, image: str) -> VariantMap:
+        """Generate variants for `image` unless they are already cached in R2."""
+        if not self.is_enabled():
+            return {}
+        if await self.storage.object_exists(self.variant_key(image, *self._sentinel())):
+            return self.variant_map(image)
+        data = await self._load_source(image)
+        return await self.generate(image, data)
+
+    async def ensure_product_variants(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ensure variants for every image and colour image of a product.
+        `variants` maps each image that has them to its variant map.
+        """
+        images = [img for img in (product.get("images") or []) if isinstance(img, str)]
+        for group in product.get("color_images") or []:
+            if isinstance(group, list):
+                images.extend(img for img in group if isinstance(img, str))
+
+        semaphore = asyncio.Semaphore(self.settings.image_variant_workers)
+        failed: List[str] = []
+        variants: Dict[str, VariantMap] = {}
+
+        async def ensure(image: str) -> None:
+            async with semaphore:
+                try:
+                    variants[image] = await self.ensure_variants(image)
+                except Exception as e:
+                    print(f"Error generating variants for {image}: {e}")
+                    failed.append(image)
+
+        unique = list(dict.fromkeys(images))
+        await asyncio.gather(*(ensure(image) for image in unique))
+        return {"processed": len(unique) - len(failed), "failed": failed, "variants": variants}
+
+
+image_variant_service = ImageVariantService()
@@ -0,0 +1,72 @@
+"""Per-order cache of rendered invoice payloads."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from ..config import Settings, get_settings
+from .broadcast import payment_broadcast
+
+
+class InvoiceCache:
+    """
+    Keeps the invoice payload of orders whose payment is final.
+
+    An invoice is looked up by order_id or by the order's UUID, so each
+    payload is stored under both. Entries expire after
+    `invoice_cache_seconds` and are dropped as soon as this worker sees a
+    payment status update or an admin edit for the order.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._entries: "OrderedDict[str, Tuple[str, Dict[str, Any], float]]" = OrderedDict()
+        self._keys: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            order_id, payload, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._drop(order_id)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def put(self, order_id: str, payload: Dict[str, Any], aliases: Iterable[Optional[str]] = ()) -> None:
+        if not order_id or self.settings.invoice_cache_seconds <= 0:
+            return
+        keys = tuple(dict.fromkeys(k for k in (order_id, *aliases) if k))
+        expires_at = time.monotonic() + self.settings.invoice_cache_seconds
+        with self._lock:
+            self._drop(order_id)
+            self._keys[order_id] = keys
+            for key in keys:
+                self._entries[key] = (order_id, payload, expires_at)
+            while len(self._entries) > self.settings.invoice_cache_size:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._drop(evicted)
+
+    def invalidate(self, order_id: Optional[str]) -> None:
+        if not order_id:
+            return
+        with self._lock:
+            entry = self._entries.get(order_id)
+            # Accept the UUID too, mapping it back to the order_id
+            self._drop(entry[0] if entry else order_id)
+
+    def _drop(self, order_id: str) -> None:
+        for key in self._keys.pop(order_id, (order_id,)):
+            self._entries.pop(key, None)
+
+    async def on_broadcast(self, message: Dict[str, Any]) -> None:
+        if message.get("type") == "payment_status_update":
+            self.invalidate(message.get("order_id"))
+
+
+invoice_cache = InvoiceCache()
+payment_broadcast.subscribe(invoice_cache.on_broadcast)
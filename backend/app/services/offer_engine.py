@@ -0,0 +1,213 @@
+"""Active offers compiled into pricing rules, used to quote storefront carts."""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+from .parsing import parse_json_list, parse_timestamp
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class OfferRule:
+    id: str
+    title: str
+    offer_type: str
+    priority: int
+    start: Optional[datetime]
+    end: Optional[datetime]
+    # Lower-cased product names
+    products: FrozenSet[str]
+    # single_product_bulk: (min_quantity, unit price), highest min_quantity first
+    tiers: Tuple[Tuple[float, float], ...]
+    # bundle_offer: unit price whatever the quantity
+    bundle_price: Optional[float]
+
+    def is_live(self, now: datetime) -> bool:
+        return (self.start is None or self.start <= now) and (self.end is None or self.end >= now)
+
+    def unit_price(self, quantity: float) -> Optional[float]:
+        """Offer price per unit when the cart holds `quantity` units of the product, or None."""
+        if self.bundle_price is not None:
+            return self.bundle_price
+        for min_quantity, tier_price in self.tiers:
+            if quantity >= min_quantity:
+                return tier_price
+        return None
+
+    def summary(self) -> Dict[str, Any]:
+        return {"id": self.id, "title": self.title, "offer_type": self.offer_type}
+
+
+def compile_offer(offer: Dict[str, Any]) -> Optional[OfferRule]:
+    """
+    Pricing rule for an offer row, or None when it cannot change any price.
+
+    Follows calculateOfferPrice in the storefront CartProvider: bulk offers
+    price by the highest tier the product's quantity reaches, bundle offers
+    by their first condition, and no other offer type changes a price.
+    """
+    offer_type = str(offer.get("offer_type") or "")
+    conditions = [c for c in parse_json_list(offer.get("conditions")) if isinstance(c, dict)]
+    tiers = []
+    bundle_price = None
+    if offer_type == "single_product_bulk":
+        for condition in conditions:
+            min_quantity = _number(condition.get("min_quantity"))
+            price = _number(condition.get("price"))
+            if min_quantity is not None and price is not None:
+                tiers.append((min_quantity, price))
+        tiers.sort(key=lambda tier: tier[0], reverse=True)
+    elif offer_type == "bundle_offer" and conditions:
+        bundle_price = _number(conditions[0].get("price"))
+    if not tiers and bundle_price is None:
+        return None
+    products = frozenset(str(p).lower() for p in parse_json_list(offer.get("applicable_products")) if p)
+    if not products:
+        return None
+    return OfferRule(
+        id=str(offer.get("id")),
+        title=offer.get("title") or "",
+        offer_type=offer_type,
+        priority=int(offer.get("priority") or 0),
+        start=parse_timestamp(offer.get("start_date")),
+        end=parse_timestamp(offer.get("end_date")),
+        products=products,
+        tiers=tuple(tiers),
+        bundle_price=bundle_price,
+    )
+
+
+class OfferEngine:
+    """
+    Active offers compiled once into rules indexed by lower-cased product
+    name (the storefront cart's key), highest priority first.
+
+    The rules are rebuilt every `offer_rules_refresh_seconds`, or on the next
+    quote after `invalidate()` (called by the admin offer routes). Date
+    windows are checked at quote time, so an offer stops applying the moment
+    it ends.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._offers: List[Dict[str, Any]] = []
+        self._by_name: Dict[str, List[OfferRule]] = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._loaded_at = 0.0
+
+    def _due(self) -> bool:
+        return not self._loaded_at or time.monotonic() - self._loaded_at >= self.settings.offer_rules_refresh_seconds
+
+    async def refresh(self, force: bool = False) -> None:
+        if not (force or self._due()):
+            return
+        async with self._lock:
+            if not (force or self._due()):
+                return
+            offers = await asyncio.to_thread(db_service.get_offers, is_active=True)
+            self.load(offers)
+
+    def load(self, offers: List[Dict[str, Any]]) -> None:
+        """Compile and index `offers` (ordered by priority, as get_offers() returns them)."""
+        by_name: Dict[str, List[OfferRule]] = {}
+        for offer in offers:
+            rule = compile_offer(offer)
+            if rule is None:
+                continue
+            for name in rule.products:
+                by_name.setdefault(name, []).append(rule)
+        for rules in by_name.values():
+            # Stable: equal priorities keep get_offers() order
+            rules.sort(key=lambda rule: rule.priority, reverse=True)
+        self._offers, self._by_name = offers, by_name
+        self._loaded_at = time.monotonic()
+
+    async def active_offers(self) -> List[Dict[str, Any]]:
+        """Offers whose date window is open right now, highest priority first."""
+        await self.refresh()
+        now = datetime.now(timezone.utc)
+        return [
+            offer for offer in self._offers
+            if (parse_timestamp(offer.get("start_date")) or now) <= now <= (parse_timestamp(offer.get("end_date")) or now)
+        ]
+
+    def _rules_for(self, product: Dict[str, Any], now: datetime) -> List[OfferRule]:
+        name = str(product.get("name") or "").lower()
+        return [rule for rule in self._by_name.get(name, ()) if rule.is_live(now)] if name else []
+
+    async def quote(self, lines: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Price a cart. `lines` are (product, cart line) pairs, the cart line
+        holding `quantity` and optionally `color`/`size`.
+
+        Same rules as the storefront cart: each product gets the lowest unit
+        price any live offer on its name gives for the product's total
+        quantity in the cart, ties going to the higher priority offer.
+        """
+        await self.refresh()
+        now = datetime.now(timezone.utc)
+        lines = list(lines)
+
+        product_quantities: Dict[str, float] = {}
+        for product, line in lines:
+            product_id = str(product.get("id"))
+            product_quantities[product_id] = product_quantities.get(product_id, 0) + line["quantity"]
+        products = {str(product.get("id")): product for product, _ in lines}
+
+        best: Dict[str, Tuple[float, Optional[OfferRule]]] = {}
+        for pid, product in products.items():
+            best_price, best_rule = float(product.get("price") or 0), None
+            for rule in self._rules_for(product, now):
+                offer_price = rule.unit_price(product_quantities[pid])
+                if offer_price is not None and offer_price < best_price:
+                    best_price, best_rule = offer_price, rule
+            best[pid] = (best_price, best_rule)
+
+        items = []
+        subtotal = discount = 0.0
+        for product, line in lines:
+            pid = str(product.get("id"))
+            quantity = line["quantity"]
+            price = float(product.get("price") or 0)
+            unit_price, rule = best[pid]
+            total_stock = product.get("total_stock")
+            items.append({
+                "product_id": pid,
+                "name": product.get("name"),
+                "color": line.get("color"),
+                "size": line.get("size"),
+                "quantity": quantity,
+                "original_price": price,
+                "price": round(unit_price, 2),
+                "line_total": round(unit_price * quantity, 2),
+                "savings": round((price - unit_price) * quantity, 2),
+                "applied_offer": rule.summary() if rule else None,
+                "in_stock": total_stock is None or product_quantities[pid] <= (total_stock or 0),
+            })
+            subtotal += price * quantity
+            discount += (price - unit_price) * quantity
+
+        return {
+            "items": items,
+            "item_count": sum(line["quantity"] for _, line in lines),
+            "subtotal": round(subtotal, 2),
+            "discount": round(discount, 2),
+            "total": round(subtotal - discount, 2),
+            "quoted_at": now.isoformat(),
+        }
+
+offer_engine = OfferEngine()
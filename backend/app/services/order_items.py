@@ -0,0 +1,97 @@
+"""Line items of an order, derived from the checkout payload."""
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+def parse_applied_offer(applied_offer: Any) -> Optional[Dict[str, Any]]:
+    """`applied_offer` arrives as a dict, a JSON string, or JSON stored as a jsonb string."""
+    for _ in range(2):
+        if not isinstance(applied_offer, str):
+            break
+        try:
+            applied_offer = json.loads(applied_offer)
+        except ValueError:
+            return None
+    return applied_offer if isinstance(applied_offer, dict) else None
+
+
+def _to_int(value: Any, default: int = 1) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def build_order_items(order: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Rows for `order_items`: one per cart line in `applied_offer.items`, or a
+    single row from the order columns for single-product orders.
+    """
+    order_id = order.get("order_id")
+    offer = parse_applied_offer(order.get("applied_offer")) or {}
+    lines = offer.get("items") if isinstance(offer.get("items"), list) else []
+
+    items = []
+    for position, line in enumerate(line for line in lines if isinstance(line, dict)):
+        quantity = max(1, _to_int(line.get("quantity")))
+        price = _to_float(line.get("price"))
+        color = line.get("color") or next(iter(line.get("colors") or []), None)
+        size = line.get("size") or next(iter(line.get("sizes") or []), None)
+        items.append({
+            "order_id": order_id,
+            "position": position,
+            "product_id": line.get("productId") or line.get("product_id"),
+            "saree_id": line.get("sareeId") or line.get("saree_id"),
+            "name": line.get("name") or "",
+            "color": color,
+            "size": size,
+            "image": line.get("image"),
+            "quantity": quantity,
+            "unit_price": price,
+            "line_total": price * quantity,
+        })
+
+    if not items:
+        quantity = max(1, _to_int(order.get("quantity")))
+        amount = _to_float(order.get("amount"))
+        items.append({
+            "order_id": order_id,
+            "position": 0,
+            "product_id": order.get("product_id"),
+            "saree_id": order.get("saree_id"),
+            "name": order.get("product_name") or "",
+            "color": next(iter(order.get("product_colors") or []), None),
+            "size": next(iter(order.get("product_sizes") or []), None),
+            "image": None,
+            "quantity": quantity,
+            "unit_price": amount / quantity,
+            "line_total": amount,
+        })
+
+    for item in items:
+        if item["product_id"] is not None:
+            item["product_id"] = str(item["product_id"])
+    return items
+
+
+def invoice_items(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """`order_items` rows in the invoice item shape used by the storefront."""
+    return [{
+        "productId": str(row["product_id"]) if row.get("product_id") is not None else None,
+        "name": row.get("name") or "",
+        "quantity": _to_int(row.get("quantity")),
+        "price": _to_float(row.get("unit_price")),
+        "total": _to_float(row.get("line_total")),
+        "image": row.get("image"),
+        "colors": [row["color"]] if row.get("color") else [],
+        "sizes": [row["size"]] if row.get("size") else [],
+        "sareeId": row.get("saree_id"),
+    } for row in sorted(rows, key=lambda r: r.get("position") or 0)]
@@ -0,0 +1,29 @@
+"""Parsing of loosely typed database values shared by the service caches."""
+
+import json
+from datetime import datetime, timezone
+from typing import Any, List, Optional
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Timezone-aware datetime from a datetime or ISO string (naive means UTC), or None."""
+    if isinstance(value, datetime):
+        parsed = value
+    elif value:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    else:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def parse_json_list(value: Any) -> List[Any]:
+    """A JSON array column, also when stored as that array encoded as a JSON string; [] otherwise."""
+    while isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
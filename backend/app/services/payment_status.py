@@ -0,0 +1,164 @@
+"""In-process cache and change notifications for order payment status."""
+
+import asyncio
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from ..config import Settings, get_settings
+from .broadcast import payment_broadcast
+from .db_service import db_service
+
+# Fields that make up the state a waiting client cares about
+STATUS_FIELDS = ("status", "payment_status", "transaction_id")
+FINAL_PAYMENT_STATUSES = {"paid", "failed", "refunded"}
+MAX_CACHED_ORDERS = 10000
+
+
+def status_version(snapshot: Optional[Dict[str, Any]]) -> int:
+    """Checksum of the status fields, identical on every worker for the same state."""
+    if not snapshot:
+        return 0
+    return zlib.crc32("|".join(str(snapshot.get(k) or "") for k in STATUS_FIELDS).encode())
+
+
+@dataclass(slots=True)
+class StatusEntry:
+    snapshot: Optional[Dict[str, Any]]
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def version(self) -> int:
+        return status_version(self.snapshot)
+
+
+def _load_status(order_id: str) -> Optional[Dict[str, Any]]:
+    """Current status from payment_sessions and orders (the order wins when both exist)."""
+    snapshot: Dict[str, Any] = {}
+    sessions = db_service.admin_get_all("payment_sessions", filters={"order_id": order_id})
+    if sessions:
+        session = sessions[0]
+        snapshot = {
+            "order_id": order_id,
+            "gateway": session.get("gateway"),
+            "status": session.get("status"),
+            "payment_status": session.get("payment_status"),
+            "transaction_id": session.get("transaction_id"),
+            "amount": session.get("amount"),
+        }
+    orders = db_service.admin_get_all("orders", filters={"order_id": order_id})
+    if orders:
+        order = orders[0]
+        # Webhooks update the order, so its status is fresher than the session's
+        snapshot.update({k: v for k, v in {
+            "order_id": order_id,
+            "status": order.get("status"),
+            "payment_status": order.get("payment_status"),
+            "transaction_id": order.get("transaction_id"),
+            "amount": order.get("amount"),
+        }.items() if v is not None or k not in snapshot})
+    return snapshot or None
+
+
+class PaymentStatusHub:
+    """
+    Serves payment status from a short-lived per-order cache and lets
+    callers wait for the next change.
+
+    Changes arrive from the payment broadcast (webhooks on any worker) and
+    from PhonePe status checks. Waiters also re-read the database once the
+    cache goes stale, so changes made elsewhere are noticed too; concurrent
+    waiters on the same order share that read.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._entries: "OrderedDict[str, StatusEntry]" = OrderedDict()
+        self._events: Dict[str, asyncio.Event] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+
+    def _store(self, order_id: str, snapshot: Optional[Dict[str, Any]]) -> StatusEntry:
+        entry = self._entries.get(order_id)
+        if entry is None:
+            entry = StatusEntry(snapshot=snapshot)
+            self._entries[order_id] = entry
+            while len(self._entries) > MAX_CACHED_ORDERS:
+                evicted, _ = self._entries.popitem(last=False)
+                self._notify(evicted)
+        else:
+            changed = entry.version != status_version(snapshot)
+            entry.snapshot = snapshot
+            entry.loaded_at = time.monotonic()
+            if changed:
+                self._notify(order_id)
+        self._entries.move_to_end(order_id)
+        return entry
+
+    def _notify(self, order_id: str) -> None:
+        event = self._events.pop(order_id, None)
+        if event is not None:
+            event.set()
+
+    def publish(self, order_id: str, changes: Dict[str, Any]) -> None:
+        """Apply a known status change and wake up everyone waiting on the order."""
+        if not order_id:
+            return
+        entry = self._entries.get(order_id)
+        if entry is None or entry.snapshot is None:
+            # Nobody has asked for this order here; the next read loads it in full
+            self._entries.pop(order_id, None)
+            return
+        snapshot = {**entry.snapshot, **{k: v for k, v in changes.items() if v is not None}}
+        self._store(order_id, snapshot)
+
+    async def on_broadcast(self, message: Dict[str, Any]) -> None:
+        if message.get("type") == "payment_status_update":
+            self.publish(message.get("order_id"), {k: message.get(k) for k in STATUS_FIELDS})
+
+    async def _refresh(self, order_id: str) -> StatusEntry:
+        task = self._loading.get(order_id)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(_load_status, order_id))
+            self._loading[order_id] = task
+            task.add_done_callback(lambda _: self._loading.pop(order_id, None))
+        snapshot = await asyncio.shield(task)
+        return self._store(order_id, snapshot)
+
+    def _is_fresh(self, entry: StatusEntry) -> bool:
+        return time.monotonic() - entry.loaded_at < self.settings.payment_status_cache_seconds
+
+    async def get(self, order_id: str) -> StatusEntry:
+        entry = self._entries.get(order_id)
+        if entry is not None and self._is_fresh(entry):
+            return entry
+        if not db_service.is_available():
+            return entry or StatusEntry(snapshot=None)
+        return await self._refresh(order_id)
+
+    async def wait_for_change(self, order_id: str, version: Optional[int], timeout: float) -> StatusEntry:
+        """Return as soon as the order's version differs from `version`, or after `timeout`."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        entry = await self.get(order_id)
+        while version is not None and entry.version == version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = self._events.setdefault(order_id, asyncio.Event())
+            # Wake up when the cache goes stale so changes made elsewhere are seen
+            slice_ = min(remaining, max(0.5, self.settings.payment_status_cache_seconds))
+            try:
+                await asyncio.wait_for(event.wait(), timeout=slice_)
+            except asyncio.TimeoutError:
+                pass
+            entry = await self.get(order_id)
+        return entry
+
+    @staticmethod
+    def is_final(snapshot: Optional[Dict[str, Any]]) -> bool:
+        return bool(snapshot) and (snapshot.get("payment_status") or "").lower() in FINAL_PAYMENT_STATUSES
+
+
+payment_status_hub = PaymentStatusHub()
+payment_broadcast.subscribe(payment_status_hub.on_broadcast)
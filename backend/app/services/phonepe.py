@@ -13,9 +13,16 @@ import httpx
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 from ..config import Settings, get_settings
+from .gateway_http import GatewayClient, gateway_http
 
 logger = logging.getLogger(__name__)
 
+# PhonePe order states that settle a payment -> (payment_status, order status)
+PHONEPE_FINAL_STATES = {
+    "COMPLETED": ("paid", "confirmed"),
+    "FAILED": ("failed", "cancelled"),
+}
+
 
 def mask_middle(value: Optional[str], visible: int = 6) -> str:
     if not value:
@@ -34,6 +41,16 @@ def sha256_hex(message: str) -> str:
     return hashlib.sha256(message.encode("utf-8")).hexdigest()
 
 
+def store_order_id(merchant_order_id: str, body: Dict[str, Any]) -> str:
+    """
+    Our order id for a PhonePe merchantOrderId, from udf2 or the `<order>_<millis>` format.
+    Prefer the payment session: retry ids (`<order>_<millis>_<nnnn>`, cut to 40
+    characters) cannot be split back into the order id.
+    """
+    meta_info = body.get("metaInfo") if isinstance(body.get("metaInfo"), dict) else {}
+    return meta_info.get("udf2") or merchant_order_id.rsplit("_", 1)[0]
+
+
 class PhonePeInitRequest(BaseModel):
     model_config = ConfigDict(extra="allow")
 
@@ -91,7 +108,7 @@ class PhonePeService:
 
     async def _get_oauth_token(
         self,
-        client: httpx.AsyncClient,
+        client: GatewayClient,
         client_id: str,
         client_secret: str,
         client_version: str,
@@ -105,22 +122,55 @@ class PhonePeService:
             if self._oauth_cache and (self._oauth_cache.expires_at - 60) > int(time.time()):
                 return self._oauth_cache.token, "cache"
 
-            token_url = f"{oauth_base_url.rstrip('/')}/v1/oauth/token"
-            payload = {
-                "client_id": client_id,
-                "client_version": client_version,
-                "client_secret": client_secret,
-                "grant_type": "client_credentials",
-            }
-            resp = await client.post(token_url, data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
-            resp.raise_for_status()
-            data = resp.json()
-            token = data.get("access_token")
-            if not token:
-                raise RuntimeError("OAuth token missing from response")
-            expires_at = int(data.get("expires_at") or (int(time.time()) + 3300))
-            self._oauth_cache = OAuthCache(token=token, expires_at=expires_at)
-            return token, "fresh"
+            self._oauth_cache = await self._fetch_oauth_token(client, client_id, client_secret, client_version, oauth_base_url)
+            return self._oauth_cache.token, "fresh"
+
+    async def _fetch_oauth_token(
+        self,
+        client: GatewayClient,
+        client_id: str,
+        client_secret: str,
+        client_version: str,
+        oauth_base_url: str,
+    ) -> OAuthCache:
+        token_url = f"{oauth_base_url.rstrip('/')}/v1/oauth/token"
+        payload = {
+            "client_id": client_id,
+            "client_version": client_version,
+            "client_secret": client_secret,
+            "grant_type": "client_credentials",
+        }
+        resp = await client.post(token_url, data=payload, headers={"Content-Type": "application/x-www-form-urlencoded"})
+        resp.raise_for_status()
+        data = resp.json()
+        token = data.get("access_token")
+        if not token:
+            raise RuntimeError("OAuth token missing from response")
+        expires_at = int(data.get("expires_at") or (int(time.time()) + 3300))
+        return OAuthCache(token=token, expires_at=expires_at)
+
+    def has_oauth_credentials(self) -> bool:
+        return bool(self.settings.phonepe_enabled and self.settings.phonepe_client_id and self.settings.phonepe_client_secret)
+
+    def cached_oauth_token(self) -> Optional[OAuthCache]:
+        return self._oauth_cache
+
+    def set_oauth_token(self, token: str, expires_at: int) -> None:
+        """Adopt a token fetched elsewhere (e.g. by another worker)."""
+        self._oauth_cache = OAuthCache(token=token, expires_at=int(expires_at))
+
+    async def refresh_oauth_token(self) -> OAuthCache:
+        """Fetch a new OAuth token with the configured credentials and cache it."""
+        settings = self.settings
+        async with self._cache_lock:
+            self._oauth_cache = await self._fetch_oauth_token(
+                gateway_http.client("phonepe"),
+                settings.phonepe_client_id or "",
+                settings.phonepe_client_secret or "",
+                settings.phonepe_client_version or "1",
+                settings.phonepe_oauth_base_url or "https://api.phonepe.com/apis/identity-manager",
+            )
+            return self._oauth_cache
 
     async def initiate_payment(self, request: PhonePeInitRequest) -> Dict[str, Any]:
         settings = self.settings
@@ -222,7 +272,7 @@ class PhonePeService:
         token_source: Optional[str] = None
         x_verify: Optional[str] = None
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway_http.client("phonepe") as client:
             if client_id and client_secret:
                 try:
                     o_auth_token, token_source = await self._get_oauth_token(client, client_id, client_secret, client_version, oauth_base_url)
@@ -286,6 +336,7 @@ class PhonePeService:
                 if checkout_v2 and remote_status == 417 and isinstance(remote_body, dict) and remote_body.get("code") == "INVALID_TRANSACTION_ID":
                     fallback_gateway_order = f"{sanitized_base}_{int(time.time()*1000)}_{str(time.time_ns())[-4:]}"[:40]
                     retry_payload = checkout_v2_payload | {"merchantOrderId": fallback_gateway_order}
+                    gateway_order_id = fallback_gateway_order
                     retry_headers = headers.copy()
                     if merchant_secret:
                         raw_for_sig = json.dumps(retry_payload, separators=(",", ":"), default=str)
@@ -355,6 +406,7 @@ class PhonePeService:
 
                 return {
                     "status": 1,
+                    "merchantOrderId": gateway_order_id,
                     "remoteStatus": remote_status,
                     "remoteBody": remote_body,
                     "remoteHeaders": {
@@ -420,7 +472,7 @@ class PhonePeService:
             "details": request.details,
         }
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
+        async with gateway_http.client("phonepe") as client:
             try:
                 access_token, token_source = await self._get_oauth_token(
                     client,
@@ -0,0 +1,173 @@
+"""In-memory product catalog for the store POS (barcode scans and catalog sync)."""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+from .parsing import parse_json_list, parse_timestamp
+
+# Re-read this far behind the newest `updated_at` seen, for writes that committed late
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def pos_product(product: Dict[str, Any], category_names: Dict[Any, str]) -> Dict[str, Any]:
+    """Product in the shape the POS uses, with stock and images already parsed."""
+    price = product.get("price", 0)
+    total_stock = product.get("total_stock", 0)
+    cat_id = product.get("category_id")
+    return {
+        "id": product.get("id"),
+        "name": product.get("name"),
+        "sku": product.get("sku"),
+        "price": price,
+        "original_price": product.get("original_price"),
+        "images": product.get("images", []),
+        "colors": product.get("colors", []),
+        "color_images": parse_json_list(product.get("color_images")),
+        "sizes": product.get("sizes", []),
+        "category_id": cat_id,
+        "category_name": category_names.get(cat_id, "Uncategorized") if cat_id else "Uncategorized",
+        "total_stock": total_stock,
+        "stock_status": product.get("stock_status", "in_stock"),
+        "color_stock": parse_json_list(product.get("color_stock")),
+        "stock_value": (price or 0) * (total_stock or 0),
+        "description": product.get("description"),
+        "updated_at": product.get("updated_at"),
+    }
+
+
+class PosCatalog:
+    """
+    Keeps every product keyed by id, plus an upper-cased SKU -> id map for scans.
+
+    Reads refresh the catalog incrementally (products whose `updated_at`
+    moved past the newest one seen) at most every `pos_catalog_refresh_seconds`,
+    or right away after `mark_stale()` is called for a local stock change, so
+    stock changed by other workers shows up within that interval. A full
+    reload every `pos_catalog_full_refresh_seconds` drops deleted products
+    and picks up category renames.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._products: Dict[str, Dict[str, Any]] = {}
+        self._by_sku: Dict[str, str] = {}
+        self._category_names: Dict[Any, str] = {}
+        self._sorted: Optional[List[Dict[str, Any]]] = None
+        self._watermark: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def mark_stale(self) -> None:
+        """Fetch changed products on the next read (call after changing stock)."""
+        self._stale = True
+
+    def _index(self, product: Dict[str, Any], advance: bool = True) -> None:
+        product_id = str(product.get("id"))
+        previous = self._products.get(product_id)
+        if previous and previous.get("sku"):
+            self._by_sku.pop(str(previous["sku"]).strip().upper(), None)
+        item = pos_product(product, self._category_names)
+        self._products[product_id] = item
+        if item.get("sku"):
+            self._by_sku[str(item["sku"]).strip().upper()] = product_id
+        updated_at = parse_timestamp(product.get("updated_at"))
+        if advance and updated_at and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+        self._sorted = None
+
+    def _fetch(self, full: bool) -> tuple:
+        """Blocking reads for a refresh: (categories or None, changed products)."""
+        categories = db_service.admin_get_all("categories") if full else None
+        since = None if full or self._watermark is None else (self._watermark - SYNC_OVERLAP).isoformat()
+        return categories, db_service.get_products_updated_since(since)
+
+    async def refresh(self, force: bool = False) -> None:
+        if not (force or self._due()):
+            return
+        async with self._lock:
+            if not (force or self._due()):
+                return
+            full = self._full_due()
+            self._stale = False
+            categories, products = await asyncio.to_thread(self._fetch, full)
+            if full and not products and self._products:
+                # Most likely a failed read: keep serving the current catalog and retry soon
+                self._checked_at = time.monotonic()
+                return
+            # Indexing happens on the event loop, so readers never see a half-updated map
+            if full:
+                self._category_names = {c.get("id"): c.get("name", "Uncategorized") for c in categories}
+                self._products, self._by_sku, self._watermark = {}, {}, None
+            for product in products:
+                self._index(product)
+            self._sorted = None
+            self._checked_at = time.monotonic()
+            if full:
+                self._loaded_at = self._checked_at
+
+    def _full_due(self) -> bool:
+        return not self._loaded_at or time.monotonic() - self._loaded_at >= self.settings.pos_catalog_full_refresh_seconds
+
+    def _due(self) -> bool:
+        return (
+            self._stale
+            or self._full_due()
+            or time.monotonic() - self._checked_at >= self.settings.pos_catalog_refresh_seconds
+        )
+
+    async def products(self) -> List[Dict[str, Any]]:
+        """All products ordered by name."""
+        await self.refresh()
+        if self._sorted is None:
+            self._sorted = sorted(self._products.values(), key=lambda p: (p.get("name") or "").lower())
+        return self._sorted
+
+    async def lookup_sku(self, sku: str) -> Optional[Dict[str, Any]]:
+        """Product for a scanned barcode/SKU, or None."""
+        code = (sku or "").strip().upper()
+        if not code:
+            return None
+        await self.refresh()
+        product_id = self._by_sku.get(code)
+        if product_id:
+            return self._products.get(product_id)
+        # Created since the last refresh? One indexed lookup before giving up
+        product = await asyncio.to_thread(db_service.get_product_by_sku, code)
+        if not product:
+            return None
+        # Not a regular refresh, so it must not move the watermark past unseen changes
+        self._index(product, advance=False)
+        return self._products.get(str(product.get("id")))
+
+    async def get_many(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Products by id (ids not in the catalog are left out)."""
+        await self.refresh()
+        return {pid: self._products[pid] for pid in product_ids if pid in self._products}
+
+    async def changes_since(self, since: Optional[str]) -> Dict[str, Any]:
+        """Products changed at or after `since` (all of them without it) and the cursor for the next call."""
+        await self.refresh()
+        cutoff = parse_timestamp(since)
+        if since and cutoff is None:
+            raise ValueError("updated_since must be an ISO 8601 timestamp")
+        products = await self.products()
+        if cutoff is not None:
+            cutoff -= SYNC_OVERLAP
+            products = [
+                p for p in products
+                if (parse_timestamp(p.get("updated_at")) or cutoff) >= cutoff
+            ]
+        return {
+            "products": products,
+            "full": cutoff is None,
+            "next_updated_since": self._watermark.isoformat() if self._watermark else since,
+        }
+
+
+pos_catalog = PosCatalog()
@@ -0,0 +1,132 @@
+"""Local SigV4 presigning for Cloudflare R2 GET URLs."""
+
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import quote
+
+from ..config import Settings, get_settings
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+REGION = "auto"
+SERVICE = "s3"
+# SigV4 query-string signatures may not be valid for longer than 7 days
+MAX_EXPIRES = 7 * 24 * 60 * 60
+
+
+def _hmac_sha256(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _uri_encode(value: str, safe: str = "-_.~") -> str:
+    return quote(value, safe=safe)
+
+
+class R2Presigner:
+    """
+    Computes presigned R2 GET URLs without an S3 client.
+
+    Signing times are aligned to fixed-width expiry buckets so the same
+    (key, expires_in) pair produces an identical URL for the whole bucket.
+    Each URL is issued with enough extra lifetime to stay valid for at least
+    `expires_in` seconds from the moment it is handed out, and is cached
+    until its bucket ends.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None, max_entries: Optional[int] = None) -> None:
+        self.settings = settings or get_settings()
+        self.bucket_seconds = max(1, self.settings.r2_presign_bucket_seconds)
+        self.max_entries = max_entries or self.settings.r2_presign_cache_size
+        self._cache: "OrderedDict[Tuple[str, int, int], Tuple[str, float]]" = OrderedDict()
+        self._signing_keys: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def host(self) -> str:
+        return f"{self.settings.r2_account_id}.r2.cloudflarestorage.com"
+
+    def _signing_key(self, datestamp: str) -> bytes:
+        key = self._signing_keys.get(datestamp)
+        if key is None:
+            k_date = _hmac_sha256(f"AWS4{self.settings.r2_secret_access_key}".encode("utf-8"), datestamp)
+            k_region = _hmac_sha256(k_date, REGION)
+            k_service = _hmac_sha256(k_region, SERVICE)
+            key = _hmac_sha256(k_service, "aws4_request")
+            # Only the current (and possibly previous) day is ever needed
+            self._signing_keys = {datestamp: key}
+        return key
+
+    def sign(self, key: str, expires_in: int, signed_at: int) -> str:
+        """Build a presigned GET URL for `key` signed at epoch second `signed_at`."""
+        moment = datetime.fromtimestamp(signed_at, tz=timezone.utc)
+        amz_date = moment.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = moment.strftime("%Y%m%d")
+        credential_scope = f"{datestamp}/{REGION}/{SERVICE}/aws4_request"
+
+        canonical_uri = "/" + _uri_encode(self.settings.r2_bucket_name) + "/" + _uri_encode(key, safe="-_.~/")
+        query = {
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.settings.r2_access_key_id}/{credential_scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(min(max(1, expires_in), MAX_EXPIRES)),
+            "X-Amz-SignedHeaders": "host",
+        }
+        canonical_query = "&".join(
+            f"{_uri_encode(name)}={_uri_encode(value)}" for name, value in sorted(query.items())
+        )
+        canonical_request = "\n".join([
+            "GET",
+            canonical_uri,
+            canonical_query,
+            f"host:{self.host}\n",
+            "host",
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            ALGORITHM,
+            amz_date,
+            credential_scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(
+            self._signing_key(datestamp),
+            string_to_sign.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+        return f"https://{self.host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
+
+    def presign(self, key: str, expires_in: int = 900, now: Optional[float] = None) -> str:
+        """Return a cached or freshly signed GET URL valid for at least `expires_in` seconds."""
+        now = time.time() if now is None else now
+        bucket_index = int(now // self.bucket_seconds)
+        cache_key = (key, expires_in, bucket_index)
+
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached and cached[1] > now:
+                self._cache.move_to_end(cache_key)
+                return cached[0]
+
+        bucket_start = bucket_index * self.bucket_seconds
+        url = self.sign(key, expires_in + self.bucket_seconds, bucket_start)
+
+        with self._lock:
+            self._cache[cache_key] = (url, bucket_start + self.bucket_seconds)
+            self._cache.move_to_end(cache_key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return url
+
+    def presign_many(self, keys: Iterable[str], expires_in: int = 900) -> Dict[str, str]:
+        """Presign a batch of keys (e.g. a product grid) with a single clock read."""
+        now = time.time()
+        return {key: self.presign(key, expires_in, now=now) for key in keys}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._signing_keys = {}
@@ -0,0 +1,146 @@
+"""Background reconciliation of orders still waiting for a payment result."""
+
+import asyncio
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+from .phonepe import PHONEPE_FINAL_STATES, PhonePeService, PhonePeStatusRequest, service as phonepe_service
+
+# (max order age, how often orders of that age are checked), youngest first.
+# Fresh orders settle quickly, so they are checked often; older ones rarely change.
+AGE_BANDS = [
+    (timedelta(minutes=15), 60),
+    (timedelta(hours=2), 300),
+    (None, 1800),
+]
+
+
+class PaymentReconciler:
+    """
+    Resolves pending PhonePe orders whose webhook or redirect never arrived.
+
+    Each cycle looks at pending orders in age bands, asks PhonePe for the
+    status of the due ones with bounded concurrency, settles the completed
+    and failed ones in a single bulk update and broadcasts the change.
+    Orders that are no longer pending by then (a webhook won) are skipped.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None, phonepe: Optional[PhonePeService] = None) -> None:
+        self.settings = settings or get_settings()
+        self.phonepe = phonepe or phonepe_service
+        self._task: Optional[asyncio.Task] = None
+        self._band_checked_at: Dict[int, float] = {}
+        self.stats = {"cycles": 0, "checked": 0, "settled": 0, "errors": 0}
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if not self.settings.reconcile_enabled or self.is_running():
+            return
+        if not self.phonepe.has_oauth_credentials() or not db_service.is_available():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error reconciling pending payments: {e}")
+                traceback.print_exc()
+            await asyncio.sleep(self.settings.reconcile_interval_seconds)
+
+    def _due_bands(self, now: datetime) -> List[tuple]:
+        """Age windows (created_before, created_after) whose check interval has elapsed."""
+        windows = []
+        younger = timedelta(seconds=self.settings.reconcile_min_age_seconds)
+        oldest = timedelta(hours=self.settings.reconcile_max_age_hours)
+        for index, (max_age, every) in enumerate(AGE_BANDS):
+            older = min(max_age, oldest) if max_age else oldest
+            checked_at = self._band_checked_at.get(index)
+            if older > younger and (checked_at is None or time.monotonic() - checked_at >= every):
+                self._band_checked_at[index] = time.monotonic()
+                windows.append((now - younger, now - older))
+            younger = max(younger, older)
+        return windows
+
+    async def _check(self, order: Dict[str, Any], semaphore: asyncio.Semaphore) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                result = await self.phonepe.get_order_status(
+                    PhonePeStatusRequest(merchantOrderId=order["gateway_order_id"], details=False)
+                )
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Error checking PhonePe status for {order.get('order_id')}: {e}")
+                return None
+        self.stats["checked"] += 1
+        state = str(result.get("state") or "").upper()
+        if result.get("status") != 1 or state not in PHONEPE_FINAL_STATES:
+            return None
+        payment_status, order_status = PHONEPE_FINAL_STATES[state]
+        return {
+            "order_id": order["order_id"],
+            "payment_status": payment_status,
+            "status": order_status,
+            "transaction_id": result.get("transactionId"),
+            "payment_gateway_response": result.get("raw") if isinstance(result.get("raw"), dict) else None,
+        }
+
+    async def run_once(self) -> int:
+        """Run one reconciliation cycle. Returns the number of orders settled."""
+        now = datetime.now(timezone.utc)
+        orders: List[Dict[str, Any]] = []
+        for created_before, created_after in self._due_bands(now):
+            orders.extend(await asyncio.to_thread(
+                db_service.get_pending_payment_orders,
+                created_before,
+                created_after,
+                self.settings.reconcile_batch_size,
+            ))
+        self.stats["cycles"] += 1
+        if not orders:
+            return 0
+
+        semaphore = asyncio.Semaphore(max(1, self.settings.reconcile_concurrency))
+        results = await asyncio.gather(*(self._check(order, semaphore) for order in orders))
+        updates = [update for update in results if update]
+        if not updates:
+            return 0
+
+        updated = set(await asyncio.to_thread(db_service.bulk_update_order_payments, updates))
+        self.stats["settled"] += len(updated)
+
+        from ..api.payments.websocket import broadcast_payment_update
+        for update in updates:
+            if update["order_id"] in updated:
+                try:
+                    await broadcast_payment_update(
+                        update["order_id"], update["status"], update["payment_status"], update["transaction_id"]
+                    )
+                except Exception as ws_error:
+                    print(f"WebSocket broadcast error: {ws_error}")
+        if updated:
+            print(f"🔄 Reconciled {len(updated)} pending PhonePe orders")
+        return len(updated)
+
+
+payment_reconciler = PaymentReconciler()
@@ -1,11 +1,19 @@
+import asyncio
 import io
+from contextlib import AsyncExitStack, asynccontextmanager
 from dataclasses import dataclass
-from typing import AsyncIterator, Optional
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterable, List, Optional, Union
 
 import aioboto3
 from botocore.client import Config
 
 from ..config import Settings, get_settings
+from .r2_presigner import R2Presigner
+
+# S3 DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+# S3/R2 require every multipart part except the last to be at least 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
 
 
 @dataclass
@@ -19,11 +27,19 @@ class R2ObjectInfo:
 class R2StorageClient:
     """
     Thin wrapper around Cloudflare R2 (S3-compatible) using aioboto3.
+
+    A single S3 client (and its connection pool) is shared by every call.
+    It is opened by `start()` at application startup, or lazily on first use,
+    and released by `close()` on shutdown.
     """
 
     def __init__(self, settings: Optional[Settings] = None) -> None:
         self.settings = settings or get_settings()
         self._session = aioboto3.Session()
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._shared_client: Any = None
+        self._client_lock = asyncio.Lock()
+        self._presigner: Optional[R2Presigner] = None
 
     def _verify_settings(self) -> None:
         required = [
@@ -47,18 +63,59 @@ class R2StorageClient:
     def _endpoint_url(self) -> str:
         return f"https://{self.settings.r2_account_id}.r2.cloudflarestorage.com"
 
-    async def _client(self):
+    def is_started(self) -> bool:
+        return self._shared_client is not None
+
+    async def start(self) -> None:
+        """Open the shared S3 client. Safe to call more than once."""
         self._verify_settings()
-        return self._session.client(
-            "s3",
-            endpoint_url=self._endpoint_url(),
-            aws_access_key_id=self.settings.r2_access_key_id,
-            aws_secret_access_key=self.settings.r2_secret_access_key,
-            region_name="auto",
-            config=Config(signature_version="s3v4"),
-        )
+        async with self._client_lock:
+            if self._shared_client is not None:
+                return
+            stack = AsyncExitStack()
+            try:
+                self._shared_client = await stack.enter_async_context(
+                    self._session.client(
+                        "s3",
+                        endpoint_url=self._endpoint_url(),
+                        aws_access_key_id=self.settings.r2_access_key_id,
+                        aws_secret_access_key=self.settings.r2_secret_access_key,
+                        region_name="auto",
+                        config=Config(
+                            signature_version="s3v4",
+                            max_pool_connections=self.settings.r2_max_pool_connections,
+                        ),
+                    )
+                )
+            except Exception:
+                await stack.aclose()
+                raise
+            self._exit_stack = stack
+
+    async def close(self) -> None:
+        """Close the shared S3 client and its connection pool."""
+        async with self._client_lock:
+            stack = self._exit_stack
+            self._exit_stack = None
+            self._shared_client = None
+        if stack is not None:
+            await stack.aclose()
+
+    @asynccontextmanager
+    async def _client(self) -> AsyncIterator[Any]:
+        if self._shared_client is None:
+            await self.start()
+        yield self._shared_client
+
+    def _part_size(self) -> int:
+        return max(self.settings.r2_multipart_chunk_size, MIN_PART_SIZE)
 
     async def upload_bytes(self, key: str, data: bytes, content_type: Optional[str] = None) -> str:
+        if len(data) >= self.settings.r2_multipart_threshold:
+            part_size = self._part_size()
+            parts = (data[offset:offset + part_size] for offset in range(0, len(data), part_size))
+            return await self._multipart_upload(key, parts, content_type)
+
         async with self._client() as client:
             params = {"Bucket": self.settings.r2_bucket_name, "Key": key, "Body": data}
             if content_type:
@@ -69,31 +126,185 @@ class R2StorageClient:
     async def upload_stream(
         self,
         key: str,
-        stream: io.BytesIO,
+        stream: Union[io.BytesIO, BinaryIO],
+        content_type: Optional[str] = None,
+    ) -> str:
+        """
+        Upload a binary stream without buffering it whole.
+
+        Streams smaller than the multipart threshold go up in a single
+        `put_object`; larger ones are read part by part and uploaded
+        concurrently.
+        """
+        part_size = self._part_size()
+        first = stream.read(max(part_size, self.settings.r2_multipart_threshold))
+        if len(first) < self.settings.r2_multipart_threshold:
+            return await self.upload_bytes(key, first, content_type)
+
+        def parts() -> Iterable[bytes]:
+            for offset in range(0, len(first), part_size):
+                yield first[offset:offset + part_size]
+            while True:
+                chunk = stream.read(part_size)
+                if not chunk:
+                    break
+                yield chunk
+
+        return await self._multipart_upload(key, parts(), content_type)
+
+    async def _multipart_upload(
+        self,
+        key: str,
+        parts: Iterable[bytes],
         content_type: Optional[str] = None,
     ) -> str:
+        """Upload `parts` as a multipart object with bounded concurrency."""
+        bucket = self.settings.r2_bucket_name
+        concurrency = max(1, self.settings.r2_multipart_concurrency)
+
         async with self._client() as client:
-            params = {
-                "Bucket": self.settings.r2_bucket_name,
-                "Key": key,
-                "Body": stream,
-            }
+            create_params = {"Bucket": bucket, "Key": key}
             if content_type:
-                params["ContentType"] = content_type
-            await client.upload_fileobj(stream, self.settings.r2_bucket_name, key, ExtraArgs={"ContentType": content_type} if content_type else None)
+                create_params["ContentType"] = content_type
+            upload = await client.create_multipart_upload(**create_params)
+            upload_id = upload["UploadId"]
+
+            completed: List[Dict[str, Any]] = []
+            in_flight: set = set()
+
+            async def upload_part(part_number: int, body: bytes) -> None:
+                response = await client.upload_part(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )
+                completed.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+            try:
+                for part_number, body in enumerate(parts, 1):
+                    # Keep at most `concurrency` parts in memory/in flight
+                    if len(in_flight) >= concurrency:
+                        done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                    in_flight.add(asyncio.create_task(upload_part(part_number, body)))
+
+                if in_flight:
+                    await asyncio.gather(*in_flight)
+                    in_flight = set()
+
+                completed.sort(key=lambda part: part["PartNumber"])
+                await client.complete_multipart_upload(
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": completed},
+                )
+            except BaseException:
+                for task in in_flight:
+                    task.cancel()
+                try:
+                    await client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+                except Exception as e:
+                    print(f"Error aborting multipart upload for {key}: {e}")
+                raise
         return key
 
+    async def download_stream(
+        self,
+        key: str,
+        chunk_size: int = 1024 * 1024,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream an object (or the inclusive byte range `start`-`end`) in chunks.
+        """
+        params = {"Bucket": self.settings.r2_bucket_name, "Key": key}
+        if start is not None or end is not None:
+            params["Range"] = f"bytes={start or 0}-{'' if end is None else end}"
+
+        async with self._client() as client:
+            response = await client.get_object(**params)
+            body = response["Body"]
+            try:
+                async for chunk in body.iter_chunks(chunk_size):
+                    yield chunk
+            finally:
+                body.close()
+
+    async def object_exists(self, key: str) -> bool:
+        async with self._client() as client:
+            try:
+                await client.head_object(Bucket=self.settings.r2_bucket_name, Key=key)
+                return True
+            except client.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return False
+                raise
+
+    async def download_bytes(self, key: str) -> bytes:
+        chunks = [chunk async for chunk in self.download_stream(key)]
+        return b"".join(chunks)
+
+    def public_url(self, key: str) -> Optional[str]:
+        """Public URL for `key` when R2_PUBLIC_BASE_URL is configured."""
+        if not self.settings.r2_public_base_url:
+            return None
+        return f"{self.settings.r2_public_base_url.rstrip('/')}/{key.lstrip('/')}"
+
+    def key_from_public_url(self, url: str) -> Optional[str]:
+        """Inverse of `public_url`; None for URLs outside the public R2 bucket."""
+        base = self.settings.r2_public_base_url
+        if not base or not url:
+            return None
+        base = base.rstrip("/") + "/"
+        if not url.startswith(base):
+            return None
+        return url[len(base):].split("?", 1)[0]
+
     async def delete_object(self, key: str) -> None:
         async with self._client() as client:
             await client.delete_object(Bucket=self.settings.r2_bucket_name, Key=key)
 
-    async def generate_presigned_url(self, key: str, expires_in: int = 900) -> str:
+    async def delete_objects(self, keys: Iterable[str]) -> List[str]:
+        """
+        Delete many objects in batches of 1000.
+
+        Returns the keys that could not be deleted.
+        """
+        key_list = list(keys)
+        failed: List[str] = []
         async with self._client() as client:
-            return await client.generate_presigned_url(
-                ClientMethod="get_object",
-                Params={"Bucket": self.settings.r2_bucket_name, "Key": key},
-                ExpiresIn=expires_in,
-            )
+            for offset in range(0, len(key_list), DELETE_BATCH_SIZE):
+                batch = key_list[offset:offset + DELETE_BATCH_SIZE]
+                response = await client.delete_objects(
+                    Bucket=self.settings.r2_bucket_name,
+                    Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                )
+                for error in response.get("Errors", []):
+                    print(f"Error deleting {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+                    failed.append(error.get("Key"))
+        return failed
+
+    def _get_presigner(self) -> R2Presigner:
+        if self._presigner is None:
+            self._verify_settings()
+            self._presigner = R2Presigner(self.settings)
+        return self._presigner
+
+    def presign_url(self, key: str, expires_in: int = 900) -> str:
+        """Presign a GET URL locally from cached credentials (no S3 client call)."""
+        return self._get_presigner().presign(key, expires_in)
+
+    def presign_urls(self, keys: Iterable[str], expires_in: int = 900) -> Dict[str, str]:
+        """Presign GET URLs for many keys at once, e.g. a product grid."""
+        return self._get_presigner().presign_many(keys, expires_in)
+
+    async def generate_presigned_url(self, key: str, expires_in: int = 900) -> str:
+        return self.presign_url(key, expires_in)
 
     async def list_objects(self, prefix: str = "") -> AsyncIterator[R2ObjectInfo]:
         async with self._client() as client:
@@ -109,5 +320,3 @@ class R2StorageClient:
 
 
 storage_client = R2StorageClient()
-
-
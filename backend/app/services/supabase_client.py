@@ -1,9 +1,23 @@
 """Supabase client service for database operations."""
 
+import re
+import uuid
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 from supabase import create_client, Client
 from ..config import get_settings
+from .customer_search import customer_search_terms, normalize_email, normalize_phone
+from .db_errors import is_undefined_function
+from .order_items import build_order_items
+
+
+def _as_uuid(value: str) -> Optional[str]:
+    """`value` if it is a UUID, else None (orders are looked up by order_id or id)."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
 
 
 class SupabaseService:
@@ -12,6 +26,8 @@ class SupabaseService:
     def __init__(self) -> None:
         settings = get_settings()
         self.client: Optional[Client] = None
+        # Cleared when order_items is missing, so invoices are loaded without it
+        self._order_items_embedded = True
         
         if settings.supabase_url and settings.supabase_key:
             self.client = create_client(settings.supabase_url, settings.supabase_key)
@@ -102,6 +118,33 @@ class SupabaseService:
         except Exception:
             return None
     
+    def get_product_by_sku(self, sku: str) -> Optional[Dict[str, Any]]:
+        """Get a product (active or not) by SKU, case-insensitively."""
+        if not self.client or not sku:
+            return None
+        sku = sku.strip()
+        try:
+            response = self.client.table("products").select("*").ilike("sku", sku).limit(5).execute()
+            # ilike treats _ as a wildcard, so confirm the exact match
+            return next((p for p in response.data or [] if (p.get("sku") or "").upper() == sku.upper()), None)
+        except Exception as e:
+            print(f"Error fetching product by SKU from Supabase: {e}")
+            return None
+    
+    def get_products_updated_since(self, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """All products (active or not) changed at or after `since`, oldest change first; all products without it."""
+        if not self.client:
+            return []
+        try:
+            query = self.client.table("products").select("*")
+            if since:
+                query = query.gte("updated_at", since)
+            response = query.order("updated_at", desc=False).execute()
+            return response.data or []
+        except Exception as e:
+            print(f"Error fetching updated products from Supabase: {e}")
+            return []
+    
     def get_categories(self) -> List[Dict[str, Any]]:
         """Get all active categories."""
         if not self.client:
@@ -150,21 +193,14 @@ class SupabaseService:
             query = self.client.table("offers").select("*")
             
             if is_active:
-                query = query.eq("is_active", True)
-                # Fetch all active offers and filter by date in Python
-                # Supabase PostgREST has limitations with complex OR conditions
+                # Date window filtered by PostgREST (repeated or= filters are ANDed)
+                query = (
+                    query.eq("is_active", True)
+                    .or_(f'start_date.is.null,start_date.lte."{today}"')
+                    .or_(f'end_date.is.null,end_date.gte."{today}"')
+                )
                 response = query.order("priority", desc=True).execute()
-                offers = response.data if response.data else []
-                
-                # Filter by date range in Python
-                filtered_offers = []
-                for offer in offers:
-                    start_ok = not offer.get("start_date") or offer.get("start_date") <= today
-                    end_ok = not offer.get("end_date") or offer.get("end_date") >= today
-                    if start_ok and end_ok:
-                        filtered_offers.append(offer)
-                
-                return filtered_offers
+                return response.data if response.data else []
             else:
                 response = query.order("priority", desc=True).execute()
                 return response.data if response.data else []
@@ -241,46 +277,348 @@ class SupabaseService:
             return None
         try:
             response = self.client.table("orders").insert(order_data).execute()
-            return response.data[0] if response.data else None
+            if not response.data:
+                return None
+            try:
+                self.client.table("order_items").upsert(
+                    build_order_items(order_data), on_conflict="order_id,position", ignore_duplicates=True
+                ).execute()
+            except Exception as e:
+                print(f"Error creating order items in Supabase: {e}")
+            return response.data[0]
         except Exception as e:
             print(f"Error creating order in Supabase: {e}")
             return None
     
-    def get_orders_by_email(self, email: str) -> List[Dict[str, Any]]:
-        """Get orders by customer email."""
+    def get_order_items(self, order_id: str) -> List[Dict[str, Any]]:
+        """Line items of an order, in cart order."""
+        if not self.client:
+            return []
+        try:
+            response = self.client.table("order_items").select("*").eq("order_id", order_id).order("position").execute()
+            return response.data or []
+        except Exception as e:
+            print(f"Error fetching order items from Supabase: {e}")
+            return []
+    
+    def get_sales_summary(self) -> Optional[Dict[str, Any]]:
+        """Not available through PostgREST; callers fall back to scanning orders."""
+        return None
+    
+    def get_inventory_summary(self) -> Optional[Dict[str, Any]]:
+        """Stock totals and breakdowns from the inventory_summary() RPC; None if it is missing."""
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("inventory_summary", {}).execute()
+            return response.data if isinstance(response.data, dict) else None
+        except Exception as e:
+            print(f"Error fetching inventory summary from Supabase: {e}")
+            return None
+    
+    def get_top_products(self, limit: int = 10, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Best-selling products of paid orders by revenue, from order_items."""
+        if not self.client:
+            return []
+        try:
+            query = (
+                self.client.table("order_items")
+                .select("product_id, name, quantity, line_total, order_id, orders!inner(payment_status, created_at)")
+                .eq("orders.payment_status", "paid")
+            )
+            if since:
+                query = query.gte("orders.created_at", since)
+            totals: Dict[str, Dict[str, Any]] = {}
+            for row in query.execute().data or []:
+                key = row.get("product_id") or row.get("name") or ""
+                entry = totals.setdefault(key, {
+                    "product_id": row.get("product_id"), "name": row.get("name"),
+                    "units": 0, "revenue": 0.0, "order_ids": set(),
+                })
+                entry["units"] += int(row.get("quantity") or 0)
+                entry["revenue"] += float(row.get("line_total") or 0)
+                entry["order_ids"].add(row.get("order_id"))
+            ranked = sorted(totals.values(), key=lambda e: e["revenue"], reverse=True)[:limit]
+            return [{**{k: v for k, v in e.items() if k != "order_ids"}, "orders": len(e["order_ids"])} for e in ranked]
+        except Exception as e:
+            print(f"Error fetching top products from Supabase: {e}")
+            return []
+    
+    def search_customers(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        POS customer search on the indexed normalized columns: name word
+        prefixes, email prefixes or phone prefixes, plus bill-only customers
+        for phone searches. Spend and purchase counts come from customer_stats.
+        """
         if not self.client:
             return []
+        # PostgREST filter syntax has no LIKE escapes, so drop its special characters
+        terms = customer_search_terms(re.sub(r'[\\%_*,()"]', "", query or ""))
+        patterns = {k: v.replace("%", "*") for k, v in terms.items() if v}
+        if not patterns:
+            return []
+        try:
+            if "phone_prefix" in patterns:
+                condition = f'phone_normalized.like."{patterns["phone_prefix"]}"'
+            else:
+                condition = ",".join([
+                    f'name.ilike."{patterns["name_prefix"]}"',
+                    f'name.ilike."{patterns["name_word_prefix"]}"',
+                    f'email_normalized.like."{patterns["email_prefix"]}"',
+                ])
+            customers = (
+                self.client.table("customers")
+                .select("*")
+                .or_(condition)
+                .order("name")
+                .limit(limit)
+                .execute()
+            ).data or []
+            results = [{**c, "_phone": c.get("phone_normalized")} for c in customers]
+            
+            if "phone_prefix" in patterns and len(results) < limit:
+                known = {c.get("phone_normalized") for c in customers}
+                bills = (
+                    self.client.table("store_bills")
+                    .select("customer_name, customer_phone, customer_email, customer_phone_normalized")
+                    .like("customer_phone_normalized", patterns["phone_prefix"])
+                    .order("created_at", desc=True)
+                    .limit(limit * 5)
+                    .execute()
+                ).data or []
+                for bill in bills:
+                    phone = bill.get("customer_phone_normalized")
+                    if len(results) >= limit or not phone or phone in known:
+                        continue
+                    known.add(phone)
+                    results.append({
+                        "id": f"bill_customer_{bill.get('customer_phone')}",
+                        "name": bill.get("customer_name"),
+                        "phone": bill.get("customer_phone"),
+                        "email": bill.get("customer_email"),
+                        "_phone": phone,
+                    })
+            
+            phones = list({r["_phone"] for r in results if r.get("_phone")})
+            stats: Dict[str, Dict[str, Any]] = {}
+            if phones:
+                rows = (
+                    self.client.table("customer_stats")
+                    .select("phone_normalized, total_spent, order_count, last_purchase_at")
+                    .in_("phone_normalized", phones)
+                    .execute()
+                ).data or []
+                stats = {row["phone_normalized"]: row for row in rows}
+            for r in results:
+                row = stats.get(r.pop("_phone", None)) or {}
+                r["total_spent"] = float(row.get("total_spent") or 0)
+                r["order_count"] = int(row.get("order_count") or 0)
+                r["last_purchase_at"] = row.get("last_purchase_at")
+            return results
+        except Exception as e:
+            print(f"Error searching customers in Supabase: {e}")
+            return []
+    
+    def get_customer_stats(self, phone: str) -> Optional[Dict[str, Any]]:
+        """Lifetime stats of the customer with this phone from customer_stats."""
+        phone_normalized = normalize_phone(phone)
+        if not self.client or not phone_normalized:
+            return None
         try:
             response = (
-                self.client.table("orders")
+                self.client.table("customer_stats")
                 .select("*")
-                .eq("customer_email", email)
-                .order("created_at", desc=True)
+                .eq("phone_normalized", phone_normalized)
+                .limit(1)
                 .execute()
             )
-            return response.data if response.data else []
+            if not response.data:
+                return None
+            stats = response.data[0]
+            for key in ("store_spent", "online_spent", "total_spent"):
+                stats[key] = float(stats.get(key) or 0)
+            return stats
         except Exception as e:
-            print(f"Error fetching orders from Supabase: {e}")
+            print(f"Error fetching customer stats from Supabase: {e}")
+            return None
+    
+    def rebuild_customer_stats(self) -> Optional[int]:
+        """Recompute customer_stats from store bills and orders. Returns the number of customers."""
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("rebuild_customer_stats", {}).execute()
+            return int(response.data or 0)
+        except Exception as e:
+            print(f"Error rebuilding customer stats in Supabase: {e}")
+            return None
+    
+    def record_stock_movements(
+        self,
+        movement_type: str,
+        items: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        """Append stock movements with the record_stock_movements() RPC; None if it does not exist, raises on other errors."""
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("record_stock_movements", {
+                "p_movement_type": movement_type,
+                "p_items": items,
+                "p_reference_id": reference_id,
+                "p_note": note,
+            }).execute()
+            return int(response.data or 0)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"record_stock_movements() not found in Supabase (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error recording stock movements in Supabase: {e}")
+            raise
+    
+    def adjust_stock_level(
+        self, product_id: str, stock: int, reference_id: Optional[str] = None, note: Optional[str] = None
+    ) -> Optional[int]:
+        """
+        Set a product's stock with the adjust_stock_level() RPC. Returns the change;
+        None if the product or the function does not exist. Other errors are raised.
+        """
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("adjust_stock_level", {
+                "p_product_id": product_id,
+                "p_stock": int(stock),
+                "p_reference_id": reference_id,
+                "p_note": note,
+            }).execute()
+            return None if response.data is None else int(response.data)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"adjust_stock_level() not found in Supabase (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error adjusting stock level in Supabase: {e}")
+            raise
+    
+    def set_color_stock_levels(
+        self,
+        product_id: str,
+        color_stock: List[Dict[str, Any]],
+        reference_id: Optional[str] = None,
+        note: Optional[str] = None,
+    ) -> Optional[int]:
+        """
+        Set a product's per-colour stock with the set_color_stock_levels() RPC. Returns
+        the change in total stock; None if the product or the function does not exist.
+        Other errors are raised.
+        """
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("set_color_stock_levels", {
+                "p_product_id": product_id,
+                "p_color_stock": color_stock,
+                "p_reference_id": reference_id,
+                "p_note": note,
+            }).execute()
+            return None if response.data is None else int(response.data)
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"set_color_stock_levels() not found in Supabase (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error setting colour stock levels in Supabase: {e}")
+            raise
+    
+    def get_stock_movements(self, product_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Latest stock movements, optionally of one product."""
+        if not self.client:
+            return []
+        try:
+            query = self.client.table("stock_movements").select("*, products(name, sku)")
+            if product_id:
+                query = query.eq("product_id", product_id)
+            response = query.order("created_at", desc=True).order("id", desc=True).limit(limit).execute()
+            movements = []
+            for row in response.data or []:
+                product = row.pop("products", None) or {}
+                row["product_name"] = product.get("name")
+                row["product_sku"] = product.get("sku")
+                movements.append(row)
+            return movements
+        except Exception as e:
+            print(f"Error fetching stock movements from Supabase: {e}")
             return []
     
-    def get_orders_by_customer(self, email: Optional[str] = None, phone: Optional[str] = None) -> List[Dict[str, Any]]:
-        """Get orders by customer email or phone."""
+    def get_stock_movement_summary(self, since: Optional[str] = None, until: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Movement totals per type and product from the stock_movement_summary() RPC; None if it is missing."""
         if not self.client:
+            return None
+        try:
+            response = self.client.rpc("stock_movement_summary", {"p_since": since, "p_until": until}).execute()
+            return response.data if isinstance(response.data, dict) else None
+        except Exception as e:
+            print(f"Error fetching stock movement summary from Supabase: {e}")
+            return None
+    
+    def process_store_refund(
+        self,
+        bill_id: str,
+        items: List[Dict[str, Any]],
+        reason: Optional[str] = None,
+        refund_amount: Optional[float] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """Refund a store bill with the process_store_refund() RPC; None if it does not exist, raises on other errors."""
+        if not self.client:
+            return None
+        try:
+            response = self.client.rpc("process_store_refund", {
+                "p_bill_id": bill_id,
+                "p_items": items,
+                "p_reason": reason,
+                "p_refund_amount": refund_amount,
+            }).execute()
+            if not isinstance(response.data, dict):
+                raise RuntimeError(f"process_store_refund() returned {response.data!r}")
+            return response.data
+        except Exception as e:
+            if is_undefined_function(e):
+                print(f"process_store_refund() not found in Supabase (run db/create_stock_movements.sql): {e}")
+                return None
+            print(f"Error processing store refund in Supabase: {e}")
+            raise
+    
+    def get_orders_by_email(self, email: str, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Get orders by customer email, newest first."""
+        return self.get_orders_by_customer(email=email, limit=limit, offset=offset)
+    
+    def get_orders_by_customer(
+        self, email: Optional[str] = None, phone: Optional[str] = None, limit: int = 50, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Get orders by customer email or phone, newest first, one page at a time.
+        Both are equality lookups on the indexed normalized columns.
+        """
+        if not self.client:
+            return []
+        if email:
+            column, value = "customer_email_normalized", normalize_email(email)
+        elif phone:
+            column, value = "customer_phone_normalized", normalize_phone(phone)
+        else:
+            return []
+        if not value:
             return []
         try:
-            query = self.client.table("orders").select("*")
-            
-            if email:
-                query = query.eq("customer_email", email)
-            elif phone:
-                # Clean phone number for comparison
-                clean_phone = phone.replace(" ", "").replace("-", "").replace("+", "")
-                # Note: This is a simple match, might need better phone normalization
-                query = query.ilike("customer_phone", f"%{clean_phone}%")
-            else:
-                return []
-            
-            response = query.order("created_at", desc=True).execute()
+            response = (
+                self.client.table("orders")
+                .select("*")
+                .eq(column, value)
+                .order("created_at", desc=True)
+                .range(offset, offset + limit - 1)
+                .execute()
+            )
             return response.data if response.data else []
         except Exception as e:
             print(f"Error fetching orders from Supabase: {e}")
@@ -303,68 +641,241 @@ class SupabaseService:
             print(f"Error fetching order from Supabase: {e}")
             return None
     
-    def get_complete_order_for_invoice(self, order_id: str) -> Optional[Dict[str, Any]]:
-        """Get complete order data with product information for invoice generation."""
+    def get_pending_payment_orders(self, created_before: datetime, created_after: datetime, limit: int = 200) -> List[Dict[str, Any]]:
+        """PhonePe orders still waiting for payment, oldest first, with their latest merchant order id."""
         if not self.client:
-            return None
+            return []
         try:
-            # First try by order_id
             response = (
                 self.client.table("orders")
-                .select("*, product:products(*), vendor:vendors(id, name, vendor_code)")
-                .eq("order_id", order_id)
-                .single()
+                .select("order_id, payment_method, amount, created_at")
+                .eq("payment_status", "pending")
+                .lt("created_at", created_before.isoformat())
+                .gte("created_at", created_after.isoformat())
+                .order("created_at", desc=False)
+                .limit(limit)
                 .execute()
             )
-            
-            if response.data:
-                order = response.data
-                # If product join failed, try to get product by name
-                if not order.get("product") and order.get("product_name"):
-                    base_name = order["product_name"].split(" (")[0] if " (" in order["product_name"] else order["product_name"]
-                    product_response = (
-                        self.client.table("products")
-                        .select("id, name, images, cover_image_index, colors, color_images, saree_id")
-                        .eq("name", base_name)
-                        .maybe_single()
-                        .execute()
-                    )
-                    if product_response.data:
-                        order["product"] = product_response.data
-                return order
-            
-            # If not found by order_id, try by UUID
+            orders = response.data or []
+            if not orders:
+                return []
+            sessions = (
+                self.client.table("payment_sessions")
+                .select("order_id, transaction_id, created_at")
+                .eq("gateway", "phonepe")
+                .in_("order_id", [o["order_id"] for o in orders])
+                .order("created_at", desc=True)
+                .execute()
+            )
+            latest: Dict[str, str] = {}
+            for session in sessions.data or []:
+                latest.setdefault(session["order_id"], session.get("transaction_id"))
+            for order in orders:
+                order["gateway_order_id"] = latest.get(order["order_id"])
+            return [order for order in orders if order["gateway_order_id"]]
+        except Exception as e:
+            print(f"Error fetching pending orders from Supabase: {e}")
+            return []
+    
+    def bulk_update_order_payments(self, updates: List[Dict[str, Any]]) -> List[str]:
+        """Settle pending orders; orders that are no longer pending are left untouched."""
+        if not self.client or not updates:
+            return []
+        updated = []
+        for update in updates:
             try:
-                uuid_response = (
+                data = {
+                    "payment_status": update["payment_status"],
+                    "status": update["status"],
+                    "updated_at": datetime.utcnow().isoformat(),
+                }
+                if update.get("transaction_id"):
+                    data["transaction_id"] = update["transaction_id"]
+                if update.get("payment_gateway_response"):
+                    data["payment_gateway_response"] = update["payment_gateway_response"]
+                response = (
                     self.client.table("orders")
-                    .select("*, product:products(*), vendor:vendors(id, name, vendor_code)")
-                    .eq("id", order_id)
-                    .single()
+                    .update(data)
+                    .eq("order_id", update["order_id"])
+                    .eq("payment_status", "pending")
                     .execute()
                 )
-                if uuid_response.data:
-                    order = uuid_response.data
-                    # If product join failed, try to get product by name
-                    if not order.get("product") and order.get("product_name"):
-                        base_name = order["product_name"].split(" (")[0] if " (" in order["product_name"] else order["product_name"]
-                        product_response = (
-                            self.client.table("products")
-                            .select("id, name, images, cover_image_index, colors, color_images, saree_id")
-                            .eq("name", base_name)
-                            .maybe_single()
-                            .execute()
-                        )
-                        if product_response.data:
-                            order["product"] = product_response.data
-                    return order
-            except:
-                pass
-            
+                if response.data:
+                    updated.append(update["order_id"])
+            except Exception as e:
+                print(f"Error updating order payment in Supabase: {e}")
+        return updated
+    
+    def create_websocket_connections(self, records: List[Dict[str, Any]]) -> int:
+        """Insert WebSocket connection audit rows in one request. Returns the rows written."""
+        if not self.client or not records:
+            return 0
+        try:
+            response = self.client.table("websocket_connections").insert(records).execute()
+            return len(response.data or [])
+        except Exception as e:
+            print(f"Error storing connections in Supabase: {e}")
+            return 0
+    
+    def close_websocket_connections(self, closed: List[Dict[str, Any]]) -> int:
+        """
+        Mark WebSocket connection audit rows inactive in one request. PostgREST cannot
+        set a different value per row in one update, so disconnected_at is the latest
+        of the batch (accurate to the audit flush interval). Returns the rows updated.
+        """
+        if not self.client or not closed:
+            return 0
+        try:
+            response = (
+                self.client.table("websocket_connections")
+                .update({"is_active": False, "disconnected_at": max(c["disconnected_at"] for c in closed)})
+                .in_("connection_id", [c["connection_id"] for c in closed])
+                .execute()
+            )
+            return len(response.data or [])
+        except Exception as e:
+            print(f"Error updating connections in Supabase: {e}")
+            return 0
+    
+    def get_complete_order_for_invoice(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get complete order data with product, vendor and line items for invoice
+        generation in one embedded select. `order_id` may also be the order's UUID.
+        """
+        if not self.client:
             return None
+        order_uuid = _as_uuid(order_id)
+        columns = "*, product:products(*), vendor:vendors(id, name, vendor_code)"
+        try:
+            for select in ((f"{columns}, items:order_items(*)", columns) if self._order_items_embedded else (columns,)):
+                query = self.client.table("orders").select(select)
+                if order_uuid:
+                    query = query.or_(f"order_id.eq.{order_id},id.eq.{order_uuid}")
+                else:
+                    query = query.eq("order_id", order_id)
+                try:
+                    response = query.limit(2).execute()
+                    break
+                except Exception as e:
+                    if select == columns:
+                        raise
+                    # order_items not created yet (db/create_order_items.sql)
+                    print(f"Invoice query without order_items: {e}")
+                    self._order_items_embedded = False
+            
+            rows = response.data or []
+            if not rows:
+                return None
+            order = next((r for r in rows if r.get("order_id") == order_id), rows[0])
+            if isinstance(order.get("items"), list):
+                order["items"].sort(key=lambda item: item.get("position") or 0)
+            
+            # Orders without product_id: match the product by name
+            if not order.get("product") and order.get("product_name"):
+                base_name = order["product_name"].split(" (")[0] if " (" in order["product_name"] else order["product_name"]
+                product_response = (
+                    self.client.table("products")
+                    .select("id, name, images, cover_image_index, colors, color_images, saree_id")
+                    .eq("name", base_name)
+                    .limit(1)
+                    .execute()
+                )
+                if product_response.data:
+                    order["product"] = product_response.data[0]
+            return order
         except Exception as e:
             print(f"Error fetching complete order from Supabase: {e}")
             return None
     
+    def get_store_discount(self, code: str) -> Optional[Dict[str, Any]]:
+        """Active store discount by code (case-insensitive)."""
+        if not self.client or not code:
+            return None
+        code = code.strip()
+        try:
+            response = (
+                self.client.table("store_discounts")
+                .select("*")
+                .ilike("discount_code", code)
+                .eq("is_active", True)
+                .limit(5)
+                .execute()
+            )
+            # ilike treats _ as a wildcard, so confirm the exact match
+            return next((d for d in response.data or [] if (d.get("discount_code") or "").upper() == code.upper()), None)
+        except Exception as e:
+            print(f"Error fetching store discount from Supabase: {e}")
+            return None
+    
+    def redeem_store_discount(self, discount_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Count one use of a discount if it is active, within its dates and below
+        max_uses. The increment only applies if current_uses is still the value
+        that was checked (compare-and-set), retried a few times under contention.
+        Returns the updated row, or None when the discount can no longer be used.
+        """
+        if not self.client:
+            return None
+        try:
+            for _ in range(5):
+                rows = (
+                    self.client.table("store_discounts")
+                    .select("*")
+                    .eq("id", discount_id)
+                    .eq("is_active", True)
+                    .limit(1)
+                    .execute()
+                ).data or []
+                if not rows:
+                    return None
+                discount = rows[0]
+                now = datetime.utcnow().isoformat()
+                current_uses = discount.get("current_uses")
+                if discount.get("start_date") and discount["start_date"] > now:
+                    return None
+                if discount.get("end_date") and discount["end_date"] < now:
+                    return None
+                # Unset or 0 means unlimited
+                if (discount.get("max_uses") or 0) > 0 and (current_uses or 0) >= discount["max_uses"]:
+                    return None
+                query = (
+                    self.client.table("store_discounts")
+                    .update({"current_uses": (current_uses or 0) + 1, "updated_at": now})
+                    .eq("id", discount_id)
+                )
+                query = query.is_("current_uses", "null") if current_uses is None else query.eq("current_uses", current_uses)
+                updated = query.execute().data or []
+                if updated:
+                    return updated[0]
+            return None
+        except Exception as e:
+            print(f"Error redeeming store discount in Supabase: {e}")
+            return None
+    
+    def release_store_discount(self, discount_id: str) -> bool:
+        """Give back a use counted by redeem_store_discount (e.g. the bill was not created)."""
+        if not self.client:
+            return False
+        try:
+            for _ in range(5):
+                rows = self.client.table("store_discounts").select("current_uses").eq("id", discount_id).limit(1).execute().data or []
+                if not rows or not rows[0].get("current_uses"):
+                    return False
+                current_uses = rows[0]["current_uses"]
+                updated = (
+                    self.client.table("store_discounts")
+                    .update({"current_uses": current_uses - 1, "updated_at": datetime.utcnow().isoformat()})
+                    .eq("id", discount_id)
+                    .eq("current_uses", current_uses)
+                    .execute()
+                ).data
+                if updated:
+                    return True
+            return False
+        except Exception as e:
+            print(f"Error releasing store discount in Supabase: {e}")
+            return False
+    
     def get_pincode_details(self, pincode: str) -> Optional[Dict[str, Any]]:
         """Get pincode delivery details from Supabase."""
         if not self.client:
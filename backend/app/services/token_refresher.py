@@ -0,0 +1,227 @@
+"""Background refresh of payment gateway OAuth tokens ahead of expiry."""
+
+import asyncio
+import random
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+from .gateway_config import gateway_configs
+from .gateway_http import gateway_http
+from .phonepe import PhonePeService, service as phonepe_service
+
+PHONEPE_TOKEN_TABLE = "gateway_oauth_tokens"
+ZOHO_TOKEN_TABLE = "zoho_oauth_tokens"
+
+
+def _parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from an ISO string (naive means UTC) or a number."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def get_zoho_token_row() -> Optional[Dict[str, Any]]:
+    rows = db_service.admin_get_all(ZOHO_TOKEN_TABLE)
+    return rows[0] if rows else None
+
+
+def store_zoho_token(token_data: Dict[str, Any]) -> bool:
+    """Update the single zoho_oauth_tokens row, creating it if needed. False if the write failed."""
+    existing = get_zoho_token_row()
+    if existing:
+        saved = db_service.admin_update(ZOHO_TOKEN_TABLE, existing.get("id"), token_data)
+    else:
+        saved = db_service.admin_create(ZOHO_TOKEN_TABLE, {**token_data, "created_at": datetime.utcnow().isoformat()})
+    if not saved:
+        return False
+    gateway_configs.refresh("zohopay")
+    return True
+
+
+class OAuthTokenRefresher:
+    """
+    Periodically refreshes ZohoPay and PhonePe tokens before they expire.
+
+    Tokens are persisted in the database so every uvicorn worker can adopt
+    the newest one instead of fetching its own. Each worker uses a slightly
+    different refresh margin, so usually one worker refreshes and the
+    others pick its token up on their next check.
+
+    A gateway whose refresh fails is retried with exponential backoff (up to
+    `oauth_refresh_max_backoff_seconds`). A ZohoPay token that was fetched
+    but could not be saved is kept and only its save is retried, so Zoho is
+    not asked for a new token every cycle while the database is failing.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None, phonepe: Optional[PhonePeService] = None) -> None:
+        self.settings = settings or get_settings()
+        self.phonepe = phonepe or phonepe_service
+        self._task: Optional[asyncio.Task] = None
+        self._margin = self.settings.oauth_refresh_margin_seconds + random.randint(
+            0, max(0, self.settings.oauth_refresh_check_seconds)
+        )
+        # refresh name -> (consecutive failures, monotonic time of the next attempt)
+        self._backoff: Dict[str, Tuple[int, float]] = {}
+        # Refreshed ZohoPay token data whose save failed
+        self._unsaved_zoho_token: Optional[Dict[str, Any]] = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if not self.settings.oauth_refresh_enabled or self.is_running():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.settings.oauth_refresh_check_seconds)
+
+    async def run_once(self) -> None:
+        for refresh in (self.refresh_phonepe, self.refresh_zohopay):
+            failures, retry_at = self._backoff.get(refresh.__name__, (0, 0.0))
+            if time.monotonic() < retry_at:
+                continue
+            try:
+                await refresh()
+                self._backoff.pop(refresh.__name__, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                delay = min(
+                    self.settings.oauth_refresh_check_seconds * 2 ** failures,
+                    self.settings.oauth_refresh_max_backoff_seconds,
+                )
+                self._backoff[refresh.__name__] = (failures, time.monotonic() + delay)
+                print(f"Error refreshing OAuth token ({refresh.__name__}), retrying in {delay}s: {e}")
+                traceback.print_exc()
+
+    def _expiring(self, expires_at: Optional[float]) -> bool:
+        return expires_at is None or expires_at - time.time() <= self._margin
+
+    async def refresh_phonepe(self) -> None:
+        if not self.phonepe.has_oauth_credentials():
+            return
+
+        cached = self.phonepe.cached_oauth_token()
+        if cached and not self._expiring(cached.expires_at):
+            return
+
+        # Another worker may already have refreshed it
+        if db_service.is_available():
+            rows = await asyncio.to_thread(
+                db_service.admin_get_all, PHONEPE_TOKEN_TABLE, "updated_at", True, {"gateway": "phonepe"}
+            )
+            row = rows[0] if rows else None
+            shared_expiry = _parse_timestamp(row.get("expires_at")) if row else None
+            if row and row.get("access_token") and not self._expiring(shared_expiry):
+                self.phonepe.set_oauth_token(row["access_token"], int(shared_expiry))
+                return
+        else:
+            row = None
+
+        token = await self.phonepe.refresh_oauth_token()
+        print(f"🔑 PhonePe OAuth token refreshed (expires {datetime.fromtimestamp(token.expires_at, tz=timezone.utc).isoformat()})")
+
+        if db_service.is_available():
+            data = {
+                "gateway": "phonepe",
+                "access_token": token.token,
+                "expires_at": datetime.fromtimestamp(token.expires_at, tz=timezone.utc).isoformat(),
+                "updated_at": datetime.utcnow().isoformat(),
+            }
+            if row:
+                await asyncio.to_thread(db_service.admin_update, PHONEPE_TOKEN_TABLE, row.get("id"), data)
+            else:
+                await asyncio.to_thread(db_service.admin_create, PHONEPE_TOKEN_TABLE, data)
+
+    async def refresh_zohopay(self) -> None:
+        if not db_service.is_available():
+            return
+
+        unsaved = self._unsaved_zoho_token
+        if unsaved and not self._expiring(_parse_timestamp(unsaved["expires_at"])):
+            # Zoho already gave us a token; only the save is left
+            await self._save_zoho_token(unsaved)
+            return
+        self._unsaved_zoho_token = None
+
+        row = await asyncio.to_thread(get_zoho_token_row)
+        if not row or not row.get("refresh_token"):
+            return
+
+        if not self._expiring(_parse_timestamp(row.get("expires_at"))):
+            # Adopt a token another worker stored since our last check
+            config = gateway_configs.zohopay()
+            if config and config.source == ZOHO_TOKEN_TABLE and config.access_token != row.get("access_token"):
+                await asyncio.to_thread(gateway_configs.refresh, "zohopay")
+            return
+
+        config = gateway_configs.zohopay()
+        client_id = self.settings.zoho_client_id or (config.client_id if config else None)
+        client_secret = self.settings.zoho_client_secret or (config.client_secret if config else None)
+        if not client_id or not client_secret:
+            print("⚠️  ZohoPay token is expiring but ZOHO_CLIENT_ID/ZOHO_CLIENT_SECRET are not configured")
+            return
+
+        response = await gateway_http.client("zohopay").post(
+            f"{self.settings.zoho_accounts_url.rstrip('/')}/oauth/v2/token",
+            data={
+                "grant_type": "refresh_token",
+                "client_id": client_id,
+                "client_secret": client_secret,
+                "refresh_token": row["refresh_token"],
+            },
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        result = response.json() if response.status_code in (200, 201) else {"error": response.text[:200]}
+        access_token = result.get("access_token")
+        if not access_token:
+            raise RuntimeError(f"Zoho token refresh failed: {result.get('error_description') or result.get('error')}")
+
+        expires_in = int(result.get("expires_in", 3600))
+        token_data = {
+            "access_token": access_token,
+            "expires_at": (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat(),
+            "expires_in": expires_in,
+            "token_type": result.get("token_type", "Bearer"),
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+        # The stored api_key mirrors the access token unless a separate key was configured
+        if not row.get("api_key") or row.get("api_key") == row.get("access_token"):
+            token_data["api_key"] = access_token
+        print(f"🔑 ZohoPay OAuth token refreshed (expires in {expires_in}s)")
+        await self._save_zoho_token(token_data)
+
+    async def _save_zoho_token(self, token_data: Dict[str, Any]) -> None:
+        if not await asyncio.to_thread(store_zoho_token, token_data):
+            self._unsaved_zoho_token = token_data
+            raise RuntimeError("Refreshed ZohoPay token could not be saved")
+        self._unsaved_zoho_token = None
+
+
+oauth_token_refresher = OAuthTokenRefresher()
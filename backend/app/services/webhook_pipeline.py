@@ -0,0 +1,225 @@
+"""Queued, idempotent processing of payment gateway webhooks."""
+
+import asyncio
+import traceback
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..config import Settings, get_settings
+from .db_service import db_service
+
+WEBHOOK_TABLE = "payment_webhooks"
+
+# Dedupe keys remembered per worker so hot gateway retries skip the database
+RECENT_KEYS_LIMIT = 5000
+
+
+@dataclass(slots=True)
+class WebhookEvent:
+    gateway: str
+    order_id: str
+    payment_id: str
+    status: str
+    payment_status: str
+    order_status: str
+    transaction_id: str
+    payload: Dict[str, Any]
+    # False when the gateway signature was checked and did not match
+    signature_verified: Optional[bool] = None
+    record: Dict[str, Any] = field(default_factory=dict)
+    webhook_id: Optional[str] = None
+
+    @property
+    def dedupe_key(self) -> Optional[str]:
+        if not self.payment_id:
+            return None
+        return f"{self.gateway}:{self.payment_id}:{self.status.lower()}"
+
+
+class WebhookPipeline:
+    """
+    Stores each webhook once and applies it to its order in the background.
+
+    `submit()` records the webhook (a unique `dedupe_key` makes gateway
+    retries no-ops) and queues it, so the route can answer 200 right away.
+    Events are spread over a few worker queues by order_id, which keeps the
+    events of one order in the order they arrived.
+    """
+
+    def __init__(self, settings: Optional[Settings] = None) -> None:
+        self.settings = settings or get_settings()
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._recent: "OrderedDict[str, bool]" = OrderedDict()
+        self._in_flight: set = set()
+        self.stats = {"received": 0, "duplicates": 0, "rejected": 0, "processed": 0, "failed": 0}
+
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._workers)
+
+    async def start(self) -> None:
+        if self.is_running():
+            return
+        count = max(1, self.settings.webhook_workers)
+        self._queues = [asyncio.Queue(maxsize=self.settings.webhook_queue_size) for _ in range(count)]
+        self._workers = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def stop(self) -> None:
+        """Finish queued events (bounded by a timeout), then stop the workers."""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=self.settings.webhook_drain_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            pending = sum(queue.qsize() for queue in self._queues)
+            print(f"⚠️  Webhook pipeline stopped with {pending} queued events (they stay unprocessed in {WEBHOOK_TABLE})")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+
+    def _remember(self, key: str) -> None:
+        self._recent[key] = True
+        self._recent.move_to_end(key)
+        while len(self._recent) > RECENT_KEYS_LIMIT:
+            self._recent.popitem(last=False)
+
+    def _store(self, event: WebhookEvent) -> Optional[bool]:
+        """
+        Insert the webhook row. Returns True when it is new, False for a
+        duplicate that was already processed and None when it could not be
+        stored (the event is still processed).
+        """
+        # A forged copy must not claim the dedupe key of the genuine webhook
+        key = event.dedupe_key if event.signature_verified is not False else None
+        record = {**event.record, "dedupe_key": key} if key else dict(event.record)
+        created = db_service.admin_create(WEBHOOK_TABLE, record)
+        if created:
+            event.webhook_id = created.get("id")
+            return True
+        if not key:
+            return None
+
+        existing = db_service.admin_get_all(WEBHOOK_TABLE, filters={"dedupe_key": key})
+        if not existing:
+            # Not a duplicate, so the insert failed for another reason (e.g. the
+            # dedupe_key column was never added): keep the audit row without it
+            created = db_service.admin_create(WEBHOOK_TABLE, dict(event.record))
+            if created:
+                event.webhook_id = created.get("id")
+            return None
+        row = existing[0]
+        if row.get("processed"):
+            return False
+        # Stored earlier but never applied (e.g. the worker died): let the retry finish it
+        event.webhook_id = row.get("id")
+        return True
+
+    async def submit(self, event: WebhookEvent) -> bool:
+        """Record and queue a webhook. Returns False when it is a duplicate or rejected."""
+        self.stats["received"] += 1
+        key = event.dedupe_key
+        if key and (key in self._recent or key in self._in_flight):
+            self.stats["duplicates"] += 1
+            return False
+
+        if db_service.is_available():
+            try:
+                stored = await asyncio.to_thread(self._store, event)
+            except Exception as e:
+                print(f"Error storing webhook: {e}")
+                stored = None
+            if stored is False:
+                self.stats["duplicates"] += 1
+                if key:
+                    self._remember(key)
+                return False
+
+        if event.signature_verified is False:
+            # Kept in payment_webhooks for auditing, never applied to the order
+            self.stats["rejected"] += 1
+            return False
+
+        if key:
+            self._in_flight.add(key)
+        if not self.is_running():
+            # No workers (e.g. called outside the app lifespan): process inline
+            await self._handle(event)
+            return True
+        queue = self._queues[zlib.crc32((event.order_id or key or "").encode()) % len(self._queues)]
+        await queue.put(event)
+        return True
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while True:
+            event = await queue.get()
+            try:
+                await self._handle(event)
+            finally:
+                queue.task_done()
+
+    async def _handle(self, event: WebhookEvent) -> None:
+        key = event.dedupe_key
+        try:
+            order_updated = await asyncio.to_thread(self._apply, event)
+            self.stats["processed"] += 1
+            if key:
+                self._remember(key)
+            if order_updated:
+                try:
+                    from ..api.payments.websocket import broadcast_payment_update
+                    await broadcast_payment_update(
+                        event.order_id, event.order_status, event.payment_status, event.transaction_id
+                    )
+                except Exception as ws_error:
+                    print(f"WebSocket broadcast error: {ws_error}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Error processing {event.gateway} webhook for order {event.order_id}: {e}")
+            traceback.print_exc()
+        finally:
+            if key:
+                self._in_flight.discard(key)
+
+    def _apply(self, event: WebhookEvent) -> bool:
+        """Update the order and mark the webhook processed. Returns True if an order changed."""
+        if not event.order_id or not db_service.is_available():
+            return False
+        orders = db_service.admin_get_all("orders", filters={"order_id": event.order_id})
+        if not orders:
+            return False
+
+        db_service.admin_update("orders", orders[0].get("id"), {
+            "payment_status": event.payment_status,
+            "status": event.order_status,
+            "transaction_id": event.transaction_id,
+            "payment_gateway_response": event.payload,
+            "updated_at": datetime.utcnow().isoformat(),
+        })
+        if event.webhook_id:
+            db_service.admin_update(WEBHOOK_TABLE, event.webhook_id, {
+                "processed": True,
+                "order_updated": True,
+                "processed_at": datetime.utcnow().isoformat(),
+            })
+        return True
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": sum(queue.qsize() for queue in self._queues),
+            "in_flight": len(self._in_flight),
+            "workers": len(self._workers),
+        }
+
+
+webhook_pipeline = WebhookPipeline()
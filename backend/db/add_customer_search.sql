@@ -0,0 +1,32 @@
+-- Indexed customer search for the POS
+-- Run this SQL script to add normalized phone/email columns and the search indexes.
+-- The columns are generated, so existing rows are filled in and writers need no changes.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Last 10 digits of the phone number ("+91 98765-43210" -> '9876543210'), as in normalize_phone()
+ALTER TABLE customers
+    ADD COLUMN IF NOT EXISTS phone_normalized TEXT
+        GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(phone, ''), '\D', '', 'g'), 10), '')) STORED;
+ALTER TABLE customers
+    ADD COLUMN IF NOT EXISTS email_normalized TEXT
+        GENERATED ALWAYS AS (NULLIF(lower(btrim(COALESCE(email, ''))), '')) STORED;
+
+ALTER TABLE store_bills
+    ADD COLUMN IF NOT EXISTS customer_phone_normalized TEXT
+        GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(customer_phone, ''), '\D', '', 'g'), 10), '')) STORED;
+
+-- Prefix search on phone/email (text_pattern_ops lets LIKE 'abc%' use the btree)
+CREATE INDEX IF NOT EXISTS idx_customers_phone_normalized ON customers(phone_normalized text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_customers_email_normalized ON customers(email_normalized text_pattern_ops);
+-- Word-prefix search on name (ILIKE 'ravi%' / ILIKE '% ravi%')
+CREATE INDEX IF NOT EXISTS idx_customers_name_trgm ON customers USING gin (name gin_trgm_ops);
+
+-- Bill-only customers and per-phone spend
+CREATE INDEX IF NOT EXISTS idx_store_bills_customer_phone_normalized
+    ON store_bills(customer_phone_normalized text_pattern_ops)
+    INCLUDE (final_amount);
+
+COMMENT ON COLUMN customers.phone_normalized IS 'Last 10 digits of phone, used by POS customer search';
+COMMENT ON COLUMN customers.email_normalized IS 'Lower-cased, trimmed email, used by POS customer search';
+COMMENT ON COLUMN store_bills.customer_phone_normalized IS 'Last 10 digits of customer_phone, used by POS customer search';
@@ -0,0 +1,18 @@
+-- Indexed order lookup by customer phone / email ("track my order")
+-- Run this SQL script to add the normalized columns and their indexes.
+-- The columns are generated, so existing orders are backfilled and new orders filled on write.
+
+-- Last 10 digits of the phone number ("+91 98765-43210" -> '9876543210'), as in normalize_phone()
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS customer_phone_normalized TEXT
+        GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(customer_phone, ''), '\D', '', 'g'), 10), '')) STORED;
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS customer_email_normalized TEXT
+        GENERATED ALWAYS AS (NULLIF(lower(btrim(COALESCE(customer_email, ''))), '')) STORED;
+
+-- Equality lookup returning the newest orders first, page by page
+CREATE INDEX IF NOT EXISTS idx_orders_customer_phone_normalized ON orders(customer_phone_normalized, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_customer_email_normalized ON orders(customer_email_normalized, created_at DESC);
+
+COMMENT ON COLUMN orders.customer_phone_normalized IS 'Last 10 digits of customer_phone, used for order lookup by phone';
+COMMENT ON COLUMN orders.customer_email_normalized IS 'Lower-cased, trimmed customer_email, used for order lookup by email';
@@ -0,0 +1,10 @@
+-- Deduplicate payment gateway webhooks
+-- Run this SQL script so retried webhooks (same gateway, payment id and status) are stored once
+
+ALTER TABLE payment_webhooks ADD COLUMN IF NOT EXISTS dedupe_key TEXT;
+
+-- dedupe_key is '<gateway>:<payment_id>:<status>'; older rows keep NULL and are not constrained
+CREATE UNIQUE INDEX IF NOT EXISTS idx_payment_webhooks_dedupe_key ON payment_webhooks(dedupe_key);
+CREATE INDEX IF NOT EXISTS idx_payment_webhooks_order_id ON payment_webhooks(order_id);
+
+COMMENT ON COLUMN payment_webhooks.dedupe_key IS 'gateway:payment_id:status, unique so gateway retries are processed once';
@@ -0,0 +1,8 @@
+-- Product image variants
+-- Run this SQL script to store which product images have resized WebP/AVIF variants in R2.
+-- POST /admin/products/{id}/image-variants fills it in; the storefront only advertises
+-- variant URLs listed here.
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS image_variants JSONB NOT NULL DEFAULT '{}'::jsonb;
+
+COMMENT ON COLUMN products.image_variants IS 'Image URL -> {variant: {format: url}} for images whose variants have been generated';
@@ -0,0 +1,29 @@
+-- Barcode scans and POS catalog sync
+-- Run this SQL script to index products by SKU and by last change.
+--
+-- SKUs must be unique (case-insensitively) for the unique index. List duplicates first with:
+--   SELECT upper(sku), array_agg(id) FROM products WHERE sku <> '' GROUP BY upper(sku) HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku_upper
+    ON products (upper(sku))
+    WHERE sku IS NOT NULL AND sku <> '';
+
+-- Delta sync: products changed since a given time
+CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products(updated_at);
+
+-- Every write bumps updated_at, whichever path made it (admin edits, soft deletes,
+-- stock movements, Supabase REST updates), so delta syncs never miss a change
+CREATE OR REPLACE FUNCTION products_touch_updated_at() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_products_touch_updated_at ON products;
+CREATE TRIGGER trg_products_touch_updated_at
+    BEFORE UPDATE ON products
+    FOR EACH ROW EXECUTE FUNCTION products_touch_updated_at();
+
+COMMENT ON INDEX idx_products_sku_upper IS 'One product per SKU; used by the POS barcode scan';
@@ -0,0 +1,9 @@
+-- Case-insensitive discount code lookup for store billing
+-- Run this SQL script to index store_discounts by upper(discount_code).
+--
+-- Codes must be unique ignoring case for the unique index. List duplicates first with:
+--   SELECT upper(discount_code), array_agg(id) FROM store_discounts GROUP BY upper(discount_code) HAVING COUNT(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_store_discounts_code_upper ON store_discounts (upper(discount_code));
+
+COMMENT ON INDEX idx_store_discounts_code_upper IS 'One discount per code regardless of case; used to validate and redeem codes';
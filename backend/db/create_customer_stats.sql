@@ -0,0 +1,143 @@
+-- Customer lifetime stats (spend, order count, last purchase), one row per customer phone
+-- Run this SQL script to create the projection, the triggers that keep it up to date
+-- and to fill it from existing store bills and online orders.
+--
+-- Triggers on store_bills and orders apply the change of every bill created,
+-- refunded or cancelled and of every order whose payment is confirmed, whichever
+-- code path writes it. rebuild_customer_stats() recomputes the table from scratch;
+-- run it (or POST /admin/customers/stats/rebuild) after bulk imports or manual fixes.
+
+-- Last 10 digits of a phone number, as in app/services/customer_search.py normalize_phone()
+CREATE OR REPLACE FUNCTION normalize_phone(phone TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT NULLIF(right(regexp_replace(COALESCE(phone, ''), '\D', '', 'g'), 10), '')
+$$;
+
+CREATE TABLE IF NOT EXISTS customer_stats (
+    phone_normalized TEXT PRIMARY KEY,
+    store_spent DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    store_bill_count INTEGER NOT NULL DEFAULT 0,
+    online_spent DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    online_order_count INTEGER NOT NULL DEFAULT 0,
+    total_spent DECIMAL(12, 2) GENERATED ALWAYS AS (store_spent + online_spent) STORED,
+    order_count INTEGER GENERATED ALWAYS AS (store_bill_count + online_order_count) STORED,
+    last_purchase_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE customer_stats IS 'Per-customer spend and purchase counts (completed store bills + paid online orders), maintained by triggers';
+
+-- Add (or with negative values, remove) purchases to a customer's stats
+CREATE OR REPLACE FUNCTION apply_customer_stats(
+    p_phone TEXT,
+    p_store_spent NUMERIC,
+    p_store_bills INTEGER,
+    p_online_spent NUMERIC,
+    p_online_orders INTEGER,
+    p_purchased_at TIMESTAMP WITH TIME ZONE
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_phone TEXT := normalize_phone(p_phone);
+BEGIN
+    IF v_phone IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO customer_stats AS cs (
+        phone_normalized, store_spent, store_bill_count, online_spent, online_order_count, last_purchase_at, updated_at
+    )
+    VALUES (
+        v_phone, p_store_spent, p_store_bills, p_online_spent, p_online_orders,
+        CASE WHEN p_store_bills + p_online_orders > 0 THEN p_purchased_at END, CURRENT_TIMESTAMP
+    )
+    ON CONFLICT (phone_normalized) DO UPDATE SET
+        store_spent = cs.store_spent + EXCLUDED.store_spent,
+        store_bill_count = cs.store_bill_count + EXCLUDED.store_bill_count,
+        online_spent = cs.online_spent + EXCLUDED.online_spent,
+        online_order_count = cs.online_order_count + EXCLUDED.online_order_count,
+        last_purchase_at = GREATEST(cs.last_purchase_at, EXCLUDED.last_purchase_at),
+        updated_at = CURRENT_TIMESTAMP;
+END;
+$$;
+
+-- Store bills count while completed (not held, refunded or cancelled)
+CREATE OR REPLACE FUNCTION customer_stats_store_bills() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.status IS NOT DISTINCT FROM NEW.status
+       AND OLD.final_amount IS NOT DISTINCT FROM NEW.final_amount
+       AND OLD.customer_phone IS NOT DISTINCT FROM NEW.customer_phone THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'completed' THEN
+        PERFORM apply_customer_stats(OLD.customer_phone, -COALESCE(OLD.final_amount, 0), -1, 0, 0, NULL);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'completed' THEN
+        PERFORM apply_customer_stats(NEW.customer_phone, COALESCE(NEW.final_amount, 0), 1, 0, 0, NEW.created_at);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Online orders count once their payment is confirmed
+CREATE OR REPLACE FUNCTION customer_stats_orders() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND lower(OLD.payment_status) IS NOT DISTINCT FROM lower(NEW.payment_status)
+       AND OLD.amount IS NOT DISTINCT FROM NEW.amount
+       AND OLD.customer_phone IS NOT DISTINCT FROM NEW.customer_phone THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND lower(OLD.payment_status) = 'paid' THEN
+        PERFORM apply_customer_stats(OLD.customer_phone, 0, 0, -COALESCE(OLD.amount, 0), -1, NULL);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND lower(NEW.payment_status) = 'paid' THEN
+        PERFORM apply_customer_stats(NEW.customer_phone, 0, 0, COALESCE(NEW.amount, 0), 1, NEW.created_at);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_customer_stats_store_bills ON store_bills;
+CREATE TRIGGER trg_customer_stats_store_bills
+    AFTER INSERT OR DELETE OR UPDATE OF status, final_amount, customer_phone ON store_bills
+    FOR EACH ROW EXECUTE FUNCTION customer_stats_store_bills();
+
+DROP TRIGGER IF EXISTS trg_customer_stats_orders ON orders;
+CREATE TRIGGER trg_customer_stats_orders
+    AFTER INSERT OR DELETE OR UPDATE OF payment_status, amount, customer_phone ON orders
+    FOR EACH ROW EXECUTE FUNCTION customer_stats_orders();
+
+-- Recompute every row from store_bills and orders. Returns the number of customers.
+CREATE OR REPLACE FUNCTION rebuild_customer_stats() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_count INTEGER;
+BEGIN
+    -- Bills and orders written meanwhile wait for the rebuild instead of being lost
+    LOCK TABLE customer_stats IN EXCLUSIVE MODE;
+    DELETE FROM customer_stats;
+    INSERT INTO customer_stats (
+        phone_normalized, store_spent, store_bill_count, online_spent, online_order_count, last_purchase_at, updated_at
+    )
+    SELECT phone, SUM(store_spent), SUM(store_bills), SUM(online_spent), SUM(online_orders), MAX(purchased_at), CURRENT_TIMESTAMP
+    FROM (
+        SELECT normalize_phone(customer_phone) AS phone, COALESCE(final_amount, 0) AS store_spent, 1 AS store_bills,
+               0 AS online_spent, 0 AS online_orders, created_at AS purchased_at
+        FROM store_bills
+        WHERE status = 'completed'
+        UNION ALL
+        SELECT normalize_phone(customer_phone), 0, 0, COALESCE(amount, 0), 1, created_at
+        FROM orders
+        WHERE lower(payment_status) = 'paid'
+    ) purchases
+    WHERE phone IS NOT NULL
+    GROUP BY phone;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+SELECT rebuild_customer_stats();
@@ -0,0 +1,14 @@
+-- Payment gateway OAuth tokens shared by all backend workers
+-- Run this SQL script to let the background token refresher persist PhonePe tokens
+-- (ZohoPay tokens stay in zoho_oauth_tokens)
+
+CREATE TABLE IF NOT EXISTS gateway_oauth_tokens (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    gateway VARCHAR(50) UNIQUE NOT NULL,
+    access_token TEXT NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE gateway_oauth_tokens IS 'Latest OAuth access token per payment gateway, refreshed ahead of expiry';
@@ -0,0 +1,75 @@
+-- Inventory valuation computed in the database
+-- Run this SQL script to create inventory_summary(), used by /store/billing/inventory-summary
+-- (directly on PostgreSQL, as an RPC on Supabase).
+
+CREATE OR REPLACE FUNCTION inventory_summary() RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+    WITH items AS (
+        SELECT p.id,
+               COALESCE(p.total_stock, 0) AS stock,
+               COALESCE(p.price, 0) AS price,
+               COALESCE(p.stock_status, 'in_stock') AS stock_status,
+               COALESCE(c.name, 'Uncategorized') AS category_name,
+               -- color_stock may hold a JSON array or that array encoded as a JSON string
+               CASE WHEN jsonb_typeof(NULLIF(p.color_stock::text, '')::jsonb) = 'string'
+                    THEN (NULLIF(p.color_stock::text, '')::jsonb #>> '{}')::jsonb
+                    ELSE NULLIF(p.color_stock::text, '')::jsonb
+               END AS color_stock
+        FROM products p
+        LEFT JOIN categories c ON c.id = p.category_id
+    ),
+    by_category AS (
+        SELECT category_name,
+               COUNT(*) AS product_count,
+               SUM(stock) AS total_stock,
+               SUM(stock * price) AS stock_value
+        FROM items
+        GROUP BY category_name
+    ),
+    colors AS (
+        SELECT items.id,
+               items.price,
+               btrim(entry->>'color') AS color,
+               COALESCE(NULLIF(entry->>'stock', '')::numeric, 0) AS stock
+        FROM items
+        CROSS JOIN LATERAL jsonb_array_elements(
+            CASE WHEN jsonb_typeof(items.color_stock) = 'array' THEN items.color_stock ELSE '[]'::jsonb END
+        ) AS entry
+        WHERE jsonb_typeof(entry) = 'object' AND COALESCE(btrim(entry->>'color'), '') <> ''
+    ),
+    by_color AS (
+        SELECT MIN(color) AS color,
+               COUNT(DISTINCT id) AS product_count,
+               SUM(stock) AS total_stock,
+               SUM(stock * price) AS stock_value
+        FROM colors
+        GROUP BY lower(color)
+    )
+    SELECT jsonb_build_object(
+        'total_products', (SELECT COUNT(*) FROM items),
+        'total_stock', (SELECT COALESCE(SUM(stock), 0) FROM items),
+        'total_stock_value', (SELECT COALESCE(SUM(stock * price), 0) FROM items),
+        'low_stock_count', (SELECT COUNT(*) FROM items WHERE stock_status = 'low_stock'),
+        'out_of_stock_count', (SELECT COUNT(*) FROM items WHERE stock_status = 'out_of_stock'),
+        'category_breakdown', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'category_name', category_name,
+                'product_count', product_count,
+                'total_stock', total_stock,
+                'stock_value', stock_value
+            ) ORDER BY category_name)
+            FROM by_category
+        ), '[]'::jsonb),
+        'color_breakdown', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'color', color,
+                'product_count', product_count,
+                'total_stock', total_stock,
+                'stock_value', stock_value
+            ) ORDER BY total_stock DESC)
+            FROM by_color
+        ), '[]'::jsonb)
+    )
+$$;
+
+COMMENT ON FUNCTION inventory_summary() IS 'Stock totals, valuation and per-category / per-colour breakdown of all products';
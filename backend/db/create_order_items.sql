@@ -0,0 +1,72 @@
+-- Order line items (previously only stored as JSON in orders.applied_offer)
+-- Run this SQL script to create the table and backfill it from existing orders.
+-- The backfill is idempotent and can be re-run safely.
+
+CREATE TABLE IF NOT EXISTS order_items (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    order_id TEXT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL DEFAULT 0,
+    product_id TEXT,
+    saree_id VARCHAR(100),
+    name TEXT NOT NULL DEFAULT '',
+    color VARCHAR(100),
+    size VARCHAR(50),
+    image TEXT,
+    quantity INTEGER NOT NULL DEFAULT 1 CHECK (quantity > 0),
+    unit_price DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    line_total DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (order_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items(product_id);
+
+COMMENT ON TABLE order_items IS 'One row per cart line of an order, written by create_order';
+
+-- Backfill: cart lines from applied_offer.items (stored either as a jsonb object or as a JSON string)
+WITH offers AS (
+    SELECT o.order_id,
+           CASE WHEN jsonb_typeof(o.applied_offer::jsonb) = 'string'
+                THEN (o.applied_offer::jsonb #>> '{}')::jsonb
+                ELSE o.applied_offer::jsonb
+           END AS offer
+    FROM orders o
+    WHERE o.applied_offer IS NOT NULL
+)
+INSERT INTO order_items (order_id, position, product_id, saree_id, name, color, size, image, quantity, unit_price, line_total)
+SELECT offers.order_id,
+       (item.ordinality - 1)::int,
+       COALESCE(item.value->>'productId', item.value->>'product_id'),
+       COALESCE(item.value->>'sareeId', item.value->>'saree_id'),
+       COALESCE(item.value->>'name', ''),
+       COALESCE(item.value->>'color', item.value->'colors'->>0),
+       COALESCE(item.value->>'size', item.value->'sizes'->>0),
+       item.value->>'image',
+       GREATEST(COALESCE(NULLIF(item.value->>'quantity', '')::numeric::int, 1), 1),
+       COALESCE(NULLIF(item.value->>'price', '')::numeric, 0),
+       COALESCE(NULLIF(item.value->>'price', '')::numeric, 0)
+           * GREATEST(COALESCE(NULLIF(item.value->>'quantity', '')::numeric::int, 1), 1)
+FROM offers
+CROSS JOIN LATERAL jsonb_array_elements(
+    CASE WHEN jsonb_typeof(offers.offer->'items') = 'array' THEN offers.offer->'items' ELSE '[]'::jsonb END
+) WITH ORDINALITY AS item(value, ordinality)
+WHERE jsonb_typeof(item.value) = 'object'
+ON CONFLICT (order_id, position) DO NOTHING;
+
+-- Backfill: single-product orders without cart lines
+INSERT INTO order_items (order_id, position, product_id, saree_id, name, color, size, quantity, unit_price, line_total)
+SELECT o.order_id,
+       0,
+       o.product_id::text,
+       o.saree_id,
+       COALESCE(o.product_name, ''),
+       o.product_colors[1],
+       o.product_sizes[1],
+       GREATEST(COALESCE(o.quantity, 1), 1),
+       COALESCE(o.amount, 0) / GREATEST(COALESCE(o.quantity, 1), 1),
+       COALESCE(o.amount, 0)
+FROM orders o
+WHERE o.order_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM order_items oi WHERE oi.order_id = o.order_id)
+ON CONFLICT (order_id, position) DO NOTHING;
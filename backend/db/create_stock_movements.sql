@@ -0,0 +1,432 @@
+-- Stock movements ledger and the stock projections kept from it
+-- Run this SQL script to create stock_movements and the functions every stock change goes
+-- through (directly on PostgreSQL, as RPCs on Supabase). The script can be re-run safely.
+--
+-- record_stock_movements() is the single write path: it appends the movements (sale,
+-- refund, adjustment, online_order) and, in the same statement, applies them to
+-- products.total_stock / color_stock / stock_status and to the matching inventory rows.
+-- POS bills, refunds and admin inventory and product edits all use it; the payment
+-- webhooks can call it as an RPC with movement type 'online_order'.
+
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    color VARCHAR(100),
+    quantity INTEGER NOT NULL CHECK (quantity <> 0),
+    movement_type VARCHAR(30) NOT NULL CHECK (movement_type IN ('sale', 'refund', 'adjustment', 'online_order')),
+    reference_id TEXT,
+    note TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_product_id ON stock_movements(product_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_reference_id ON stock_movements(reference_id);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_created_at ON stock_movements(created_at);
+
+COMMENT ON TABLE stock_movements IS 'Append-only ledger of stock changes; quantity is positive for stock in, negative for stock out';
+COMMENT ON COLUMN stock_movements.reference_id IS 'Store bill id or order id the movement belongs to';
+
+-- Replaced by color_stock_apply()
+DROP FUNCTION IF EXISTS color_stock_add(JSONB, JSONB);
+
+-- products.color_stock as a JSON array (it may be stored as that array encoded as a JSON string)
+CREATE OR REPLACE FUNCTION color_stock_json(p_color_stock JSONB) RETURNS JSONB
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE WHEN jsonb_typeof(v.value) = 'array' THEN v.value ELSE '[]'::jsonb END
+    FROM (
+        SELECT CASE WHEN jsonb_typeof(p_color_stock) = 'string' THEN (p_color_stock #>> '{}')::jsonb
+                    ELSE p_color_stock
+               END AS value
+    ) v
+$$;
+
+-- Sum of the colour entries' stock, or NULL when the product does not track stock per colour
+CREATE OR REPLACE FUNCTION color_stock_total(p_color_stock JSONB) RETURNS INTEGER
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT SUM(GREATEST(COALESCE(NULLIF(e->>'stock', '')::numeric, 0), 0))::integer
+    FROM jsonb_array_elements(color_stock_json(p_color_stock)) AS e
+    WHERE jsonb_typeof(e) = 'object'
+$$;
+
+-- Apply one signed stock change to a colour-tracked color_stock array, the way the POS
+-- always has: stock out of a listed colour never goes below 0; stock out of an unlisted
+-- colour (or no colour) is taken from the colours that have stock, in order. Stock in goes
+-- to its colour, a new entry for an unlisted colour, or the first colour when none is given.
+-- p_applied is the change actually made (smaller than asked when stock ran out).
+CREATE OR REPLACE FUNCTION color_stock_apply(
+    INOUT p_color_stock JSONB,
+    p_color TEXT,
+    p_quantity INTEGER,
+    OUT p_applied INTEGER
+)
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    v_entries JSONB[];
+    v_key TEXT := NULLIF(lower(btrim(p_color)), '');
+    v_index INTEGER;
+    v_first INTEGER;
+    v_stock INTEGER;
+    v_take INTEGER;
+    v_left INTEGER;
+BEGIN
+    p_applied := 0;
+    SELECT COALESCE(array_agg(e ORDER BY ord), '{}') INTO v_entries
+    FROM jsonb_array_elements(color_stock_json(p_color_stock)) WITH ORDINALITY AS t(e, ord);
+    p_color_stock := to_jsonb(v_entries);
+    IF COALESCE(p_quantity, 0) = 0 THEN
+        RETURN;
+    END IF;
+
+    FOR i IN 1..COALESCE(array_length(v_entries, 1), 0) LOOP
+        CONTINUE WHEN jsonb_typeof(v_entries[i]) <> 'object';
+        v_first := COALESCE(v_first, i);
+        IF v_key IS NOT NULL AND lower(btrim(v_entries[i]->>'color')) = v_key THEN
+            v_index := i;
+            EXIT;
+        END IF;
+    END LOOP;
+
+    IF p_quantity > 0 THEN
+        IF v_index IS NULL AND (v_key IS NOT NULL OR v_first IS NULL) THEN
+            v_entries := v_entries || jsonb_build_object('color', btrim(COALESCE(p_color, '')), 'stock', p_quantity);
+        ELSE
+            v_index := COALESCE(v_index, v_first);
+            v_stock := GREATEST(COALESCE(NULLIF(v_entries[v_index]->>'stock', '')::numeric, 0), 0)::integer;
+            v_entries[v_index] := v_entries[v_index] || jsonb_build_object('stock', v_stock + p_quantity);
+        END IF;
+        p_applied := p_quantity;
+    ELSE
+        v_left := -p_quantity;
+        FOR i IN 1..COALESCE(array_length(v_entries, 1), 0) LOOP
+            EXIT WHEN v_left <= 0;
+            CONTINUE WHEN jsonb_typeof(v_entries[i]) <> 'object' OR (v_index IS NOT NULL AND i <> v_index);
+            v_stock := GREATEST(COALESCE(NULLIF(v_entries[i]->>'stock', '')::numeric, 0), 0)::integer;
+            CONTINUE WHEN v_stock = 0 AND v_index IS NULL;
+            v_take := LEAST(v_left, v_stock);
+            v_entries[i] := v_entries[i] || jsonb_build_object('stock', v_stock - v_take);
+            v_left := v_left - v_take;
+        END LOOP;
+        p_applied := p_quantity + v_left;
+    END IF;
+    p_color_stock := to_jsonb(v_entries);
+END;
+$$;
+
+-- Same thresholds the POS has always used
+CREATE OR REPLACE FUNCTION stock_status_for(p_stock NUMERIC) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE WHEN COALESCE(p_stock, 0) <= 0 THEN 'out_of_stock'
+                WHEN p_stock <= 5 THEN 'low_stock'
+                ELSE 'in_stock'
+           END
+$$;
+
+-- Append movements and apply them to products and inventory in one transaction.
+-- p_items is a JSON array of {"product_id", "quantity" (signed), "color"}; lines of the
+-- same product/colour are merged and unknown products are skipped. Stock never goes
+-- below 0, and each movement records the change actually made. For products that track
+-- stock per colour, total_stock is the sum of color_stock after the change; for the
+-- others only total_stock moves. Returns the number of products whose stock changed.
+CREATE OR REPLACE FUNCTION record_stock_movements(
+    p_movement_type TEXT,
+    p_items JSONB,
+    p_reference_id TEXT DEFAULT NULL,
+    p_note TEXT DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_product RECORD;
+    v_line RECORD;
+    v_color_stock JSONB;
+    v_tracks_colors BOOLEAN;
+    v_stock INTEGER;
+    v_applied INTEGER;
+    v_restocked BOOLEAN;
+    v_changed BOOLEAN;
+    v_products INTEGER := 0;
+BEGIN
+    -- Locked in id order, so concurrent movements of the same products queue instead of deadlocking
+    FOR v_product IN
+        SELECT p.id, p.total_stock, p.color_stock::jsonb AS color_stock
+        FROM products p
+        WHERE p.id IN (
+            SELECT (i->>'product_id')::uuid
+            FROM jsonb_array_elements(COALESCE(p_items, '[]'::jsonb)) AS i
+            WHERE COALESCE(i->>'product_id', '') <> ''
+        )
+        ORDER BY p.id
+        FOR UPDATE
+    LOOP
+        v_color_stock := color_stock_json(v_product.color_stock);
+        v_tracks_colors := color_stock_total(v_color_stock) IS NOT NULL;
+        v_stock := GREATEST(COALESCE(v_product.total_stock, 0), 0);
+        v_restocked := FALSE;
+        v_changed := FALSE;
+
+        FOR v_line IN
+            SELECT MIN(NULLIF(btrim(i->>'color'), '')) AS color,
+                   SUM(COALESCE(NULLIF(i->>'quantity', '')::numeric, 0))::integer AS quantity
+            FROM jsonb_array_elements(p_items) AS i
+            WHERE COALESCE(i->>'product_id', '') <> '' AND (i->>'product_id')::uuid = v_product.id
+            GROUP BY NULLIF(lower(btrim(i->>'color')), '')
+            HAVING SUM(COALESCE(NULLIF(i->>'quantity', '')::numeric, 0))::integer <> 0
+            ORDER BY NULLIF(lower(btrim(i->>'color')), '') NULLS LAST
+        LOOP
+            IF v_tracks_colors THEN
+                SELECT r.p_color_stock, r.p_applied INTO v_color_stock, v_applied
+                FROM color_stock_apply(v_color_stock, v_line.color, v_line.quantity) AS r;
+            ELSE
+                v_applied := GREATEST(v_line.quantity, -v_stock);
+                v_stock := v_stock + v_applied;
+            END IF;
+            CONTINUE WHEN v_applied = 0;
+            v_changed := TRUE;
+            v_restocked := v_restocked OR v_applied > 0;
+            INSERT INTO stock_movements (product_id, color, quantity, movement_type, reference_id, note)
+            VALUES (v_product.id, v_line.color, v_applied, p_movement_type, p_reference_id, p_note);
+        END LOOP;
+
+        IF v_tracks_colors THEN
+            v_stock := color_stock_total(v_color_stock);
+        END IF;
+        UPDATE products SET
+            color_stock = CASE WHEN v_tracks_colors THEN v_color_stock ELSE color_stock END,
+            total_stock = v_stock,
+            stock_status = stock_status_for(v_stock),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = v_product.id;
+        UPDATE inventory SET
+            current_stock = v_stock,
+            status = stock_status_for(v_stock),
+            last_restocked = CASE WHEN v_restocked THEN CURRENT_TIMESTAMP ELSE last_restocked END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE product_id::text = v_product.id::text;
+
+        IF v_changed THEN
+            v_products := v_products + 1;
+        END IF;
+    END LOOP;
+    RETURN v_products;
+END;
+$$;
+
+-- Set a product's stock to an absolute level (admin inventory edits) as an 'adjustment'
+-- movement of the difference; for colour-tracked products the difference is applied to
+-- color_stock like any other uncoloured movement. Returns the change actually made, or
+-- NULL if the product does not exist.
+CREATE OR REPLACE FUNCTION adjust_stock_level(
+    p_product_id UUID,
+    p_stock INTEGER,
+    p_reference_id TEXT DEFAULT NULL,
+    p_note TEXT DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_current INTEGER;
+    v_delta INTEGER;
+BEGIN
+    SELECT COALESCE(color_stock_total(color_stock::jsonb), GREATEST(COALESCE(total_stock, 0), 0)) INTO v_current
+    FROM products WHERE id = p_product_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    v_delta := GREATEST(p_stock, 0) - v_current;
+    -- A zero change still brings total_stock and inventory rows that drifted back in line
+    PERFORM record_stock_movements(
+        'adjustment',
+        jsonb_build_array(jsonb_build_object('product_id', p_product_id, 'quantity', v_delta)),
+        p_reference_id,
+        p_note
+    );
+    RETURN (SELECT COALESCE(total_stock, 0) FROM products WHERE id = p_product_id) - v_current;
+END;
+$$;
+
+-- Set a product's colour stock to absolute per-colour levels (admin product edits).
+-- p_color_stock is the full color_stock array to store. Under the product's row lock, the
+-- difference for each colour is recorded as an 'adjustment' movement, then the array is
+-- written as given (stock clamped at 0) with total_stock as its sum; any difference the
+-- colour movements could not express (e.g. a product starting to track colours) is
+-- recorded as one uncoloured adjustment. Returns the change in total stock, or NULL if
+-- the product does not exist.
+CREATE OR REPLACE FUNCTION set_color_stock_levels(
+    p_product_id UUID,
+    p_color_stock JSONB,
+    p_reference_id TEXT DEFAULT NULL,
+    p_note TEXT DEFAULT NULL
+) RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_current JSONB;
+    v_before INTEGER;
+    v_moved INTEGER;
+    v_target JSONB;
+    v_lines JSONB;
+    v_total INTEGER;
+BEGIN
+    SELECT color_stock_json(color_stock::jsonb),
+           COALESCE(color_stock_total(color_stock::jsonb), GREATEST(COALESCE(total_stock, 0), 0))
+    INTO v_current, v_before
+    FROM products WHERE id = p_product_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT COALESCE(jsonb_agg(
+               CASE WHEN jsonb_typeof(e) = 'object'
+                    THEN e || jsonb_build_object(
+                        'stock', GREATEST(COALESCE(NULLIF(e->>'stock', '')::numeric, 0), 0)::integer
+                    )
+                    ELSE e
+               END ORDER BY ord), '[]'::jsonb)
+    INTO v_target
+    FROM jsonb_array_elements(color_stock_json(p_color_stock)) WITH ORDINALITY AS t(e, ord);
+
+    -- First entry per colour, before and after
+    WITH before AS (
+        SELECT DISTINCT ON (lower(btrim(e->>'color')))
+               lower(btrim(e->>'color')) AS color_key, btrim(e->>'color') AS color,
+               GREATEST(COALESCE(NULLIF(e->>'stock', '')::numeric, 0), 0)::integer AS stock
+        FROM jsonb_array_elements(v_current) WITH ORDINALITY AS t(e, ord)
+        WHERE jsonb_typeof(e) = 'object' AND COALESCE(btrim(e->>'color'), '') <> ''
+        ORDER BY lower(btrim(e->>'color')), ord
+    ),
+    after AS (
+        SELECT DISTINCT ON (lower(btrim(e->>'color')))
+               lower(btrim(e->>'color')) AS color_key, btrim(e->>'color') AS color,
+               (e->>'stock')::integer AS stock
+        FROM jsonb_array_elements(v_target) WITH ORDINALITY AS t(e, ord)
+        WHERE jsonb_typeof(e) = 'object' AND COALESCE(btrim(e->>'color'), '') <> ''
+        ORDER BY lower(btrim(e->>'color')), ord
+    )
+    SELECT jsonb_agg(jsonb_build_object(
+               'product_id', p_product_id,
+               'color', COALESCE(a.color, b.color),
+               'quantity', COALESCE(a.stock, 0) - COALESCE(b.stock, 0)
+           ))
+    INTO v_lines
+    FROM before b
+    FULL JOIN after a ON a.color_key = b.color_key
+    WHERE COALESCE(a.stock, 0) <> COALESCE(b.stock, 0);
+
+    PERFORM record_stock_movements('adjustment', COALESCE(v_lines, '[]'::jsonb), p_reference_id, p_note);
+    SELECT COALESCE(total_stock, 0) INTO v_moved FROM products WHERE id = p_product_id;
+
+    v_total := COALESCE(color_stock_total(v_target), CASE WHEN jsonb_array_length(v_target) = 0 THEN v_moved END, 0);
+    IF v_total <> v_moved THEN
+        INSERT INTO stock_movements (product_id, color, quantity, movement_type, reference_id, note)
+        VALUES (p_product_id, NULL, v_total - v_moved, 'adjustment', p_reference_id, p_note);
+    END IF;
+
+    UPDATE products SET
+        color_stock = v_target,
+        total_stock = v_total,
+        stock_status = stock_status_for(v_total),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = p_product_id;
+    UPDATE inventory SET
+        current_stock = v_total,
+        status = stock_status_for(v_total),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE product_id::text = p_product_id::text;
+    RETURN v_total - v_before;
+END;
+$$;
+
+-- Movement totals per type and per product, for stock reports
+CREATE OR REPLACE FUNCTION stock_movement_summary(
+    p_since TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_until TIMESTAMP WITH TIME ZONE DEFAULT NULL
+) RETURNS JSONB
+LANGUAGE sql STABLE AS $$
+    WITH totals AS (
+        SELECT product_id, movement_type, SUM(quantity) AS quantity, COUNT(*) AS movements
+        FROM stock_movements
+        WHERE (p_since IS NULL OR created_at >= p_since)
+          AND (p_until IS NULL OR created_at < p_until)
+        GROUP BY product_id, movement_type
+    ),
+    by_type AS (
+        SELECT movement_type, SUM(quantity) AS quantity, SUM(movements) AS movements
+        FROM totals
+        GROUP BY movement_type
+    ),
+    by_product AS (
+        SELECT product_id, SUM(quantity) AS net, jsonb_object_agg(movement_type, quantity) AS by_type
+        FROM totals
+        GROUP BY product_id
+    )
+    SELECT jsonb_build_object(
+        'by_type', COALESCE((
+            SELECT jsonb_object_agg(movement_type, jsonb_build_object('quantity', quantity, 'movements', movements))
+            FROM by_type
+        ), '{}'::jsonb),
+        'products', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'product_id', bp.product_id,
+                'name', p.name,
+                'sku', p.sku,
+                'net', bp.net,
+                'by_type', bp.by_type,
+                'current_stock', p.total_stock
+            ) ORDER BY bp.net)
+            FROM by_product bp
+            JOIN products p ON p.id = bp.product_id
+        ), '[]'::jsonb)
+    )
+$$;
+
+-- Refund a store bill in one transaction: mark it refunded, put the returned items back
+-- in stock through record_stock_movements() (one locked pass per product, one movement per
+-- colour) and record the movements.
+-- p_items is a JSON array of {"product_id", "quantity", "color"}. Returns
+-- {"status": "success" | "not_found" | "already_refunded", "refund_amount", "products"}.
+CREATE OR REPLACE FUNCTION process_store_refund(
+    p_bill_id UUID,
+    p_items JSONB,
+    p_reason TEXT DEFAULT NULL,
+    p_refund_amount NUMERIC DEFAULT NULL
+) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_status TEXT;
+    v_amount NUMERIC := p_refund_amount;
+    v_products INTEGER;
+BEGIN
+    -- Concurrent refunds of the same bill queue here; only the first one restocks
+    SELECT status INTO v_status FROM store_bills WHERE id = p_bill_id FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+    IF v_status = 'refunded' THEN
+        RETURN jsonb_build_object('status', 'already_refunded');
+    END IF;
+
+    IF v_amount IS NULL THEN
+        SELECT COALESCE(SUM(line_total), 0) INTO v_amount FROM store_bill_items WHERE bill_id = p_bill_id;
+    END IF;
+
+    UPDATE store_bills SET status = 'refunded', updated_at = CURRENT_TIMESTAMP WHERE id = p_bill_id;
+
+    -- Only stock coming back: lines with a quantity of 0 or less are ignored
+    v_products := record_stock_movements(
+        'refund',
+        COALESCE((
+            SELECT jsonb_agg(i)
+            FROM jsonb_array_elements(COALESCE(p_items, '[]'::jsonb)) AS i
+            WHERE COALESCE(NULLIF(i->>'quantity', '')::numeric, 0) > 0
+        ), '[]'::jsonb),
+        p_bill_id::text,
+        p_reason
+    );
+
+    RETURN jsonb_build_object('status', 'success', 'refund_amount', v_amount, 'products', v_products);
+END;
+$$;
+
+COMMENT ON FUNCTION color_stock_apply(JSONB, TEXT, INTEGER) IS 'products.color_stock with one stock change applied, and the change actually made';
+COMMENT ON FUNCTION record_stock_movements(TEXT, JSONB, TEXT, TEXT) IS 'Single write path for stock: appends stock_movements and updates products and inventory';
+COMMENT ON FUNCTION adjust_stock_level(UUID, INTEGER, TEXT, TEXT) IS 'Set a product stock level, recorded as an adjustment movement';
+COMMENT ON FUNCTION set_color_stock_levels(UUID, JSONB, TEXT, TEXT) IS 'Set a product''s per-colour stock levels, recorded as adjustment movements';
+COMMENT ON FUNCTION stock_movement_summary(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE) IS 'Stock movement totals per type and per product';
+COMMENT ON FUNCTION process_store_refund(UUID, JSONB, TEXT, NUMERIC) IS 'Refund a store bill: status, restock and stock_movements in one transaction';
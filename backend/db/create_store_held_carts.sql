@@ -0,0 +1,22 @@
+-- Parked POS carts (held transactions)
+-- Run this SQL script to create the table used by /store/billing/hold and /store/billing/holds.
+-- Held carts used to be written to store_bills with status 'held'; they now live here so
+-- sales queries and analytics on store_bills never see them.
+
+CREATE TABLE IF NOT EXISTS store_held_carts (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    hold_number VARCHAR(50) NOT NULL,
+    terminal_id VARCHAR(100),
+    customer_name VARCHAR(255),
+    customer_phone VARCHAR(50),
+    items JSONB NOT NULL DEFAULT '[]'::jsonb,
+    notes TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_store_held_carts_terminal_id ON store_held_carts(terminal_id);
+CREATE INDEX IF NOT EXISTS idx_store_held_carts_expires_at ON store_held_carts(expires_at);
+
+COMMENT ON TABLE store_held_carts IS 'Carts parked at the POS, resumed or discarded later; rows past expires_at are purged by the backend';
+COMMENT ON COLUMN store_held_carts.terminal_id IS 'POS terminal/counter that parked the cart';
@@ -3,9 +3,9 @@ Migrate storage files from one Supabase instance to another.
 
 This script:
 1. Lists all files in source Supabase storage buckets
-2. Downloads files from source
-3. Uploads files to destination Supabase storage buckets
-4. Optionally updates URLs in database
+2. Copies files to destination buckets concurrently, in memory (no temp files)
+3. Records every copied file (key, size, etag) in a checkpoint manifest
+4. Skips files already copied on a previous run, so an interrupted run resumes
 
 Usage:
     python -m scripts.migrate_storage
@@ -15,15 +15,19 @@ Environment Variables Required:
     SOURCE_SUPABASE_KEY=your_source_service_role_key (needs storage access)
     DEST_SUPABASE_URL=https://dest-project.supabase.co
     DEST_SUPABASE_KEY=your_dest_service_role_key (needs storage access)
+
+Optional:
+    STORAGE_MIGRATION_CONCURRENCY=8  (parallel copies per bucket)
+    STORAGE_MIGRATION_MANIFEST=storage_migration_manifest.json
 """
 
 import os
 import sys
-import asyncio
-from typing import List, Optional
-from pathlib import Path
-import tempfile
-import shutil
+import json
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -34,6 +38,11 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+CONCURRENCY = max(1, int(os.getenv("STORAGE_MIGRATION_CONCURRENCY", "8")))
+MANIFEST_PATH = os.getenv("STORAGE_MIGRATION_MANIFEST", "storage_migration_manifest.json")
+# Persist the manifest after this many completed copies
+MANIFEST_FLUSH_EVERY = 25
+
 
 def get_source_supabase() -> Optional[Client]:
     """Get source Supabase client."""
@@ -88,10 +97,13 @@ def list_bucket_files(client: Client, bucket_name: str) -> List[dict]:
                     file_path = f"{prefix}/{item_name}" if prefix else item_name
                     # Clean up path (remove leading slash if prefix is empty)
                     file_path = file_path.lstrip("/")
+                    metadata = item.get("metadata") or {}
                     files.append({
                         "name": item_name,
                         "path": file_path,
-                        "size": item.get("metadata", {}).get("size", 0),
+                        "size": metadata.get("size", 0),
+                        "etag": metadata.get("eTag"),
+                        "mimetype": metadata.get("mimetype"),
                         "updated_at": item.get("updated_at"),
                     })
                 # If it's a folder (has name but no ID, or metadata indicates folder)
@@ -110,27 +122,19 @@ def list_bucket_files(client: Client, bucket_name: str) -> List[dict]:
     return files
 
 
-def download_file(client: Client, bucket_name: str, file_path: str, local_path: str) -> bool:
-    """Download a file from Supabase storage."""
+def download_file(client: Client, bucket_name: str, file_path: str) -> Optional[bytes]:
+    """Download a file from Supabase storage into memory."""
     try:
         response = client.storage.from_(bucket_name).download(file_path)
-        if response:
-            os.makedirs(os.path.dirname(local_path), exist_ok=True)
-            with open(local_path, "wb") as f:
-                f.write(response)
-            return True
-        return False
+        return response or None
     except Exception as e:
         print(f"⚠️  Error downloading {file_path}: {e}")
-        return False
+        return None
 
 
-def upload_file(client: Client, bucket_name: str, file_path: str, local_path: str, content_type: Optional[str] = None) -> bool:
-    """Upload a file to Supabase storage."""
+def upload_file(client: Client, bucket_name: str, file_path: str, file_data: bytes, content_type: Optional[str] = None) -> bool:
+    """Upload in-memory file data to Supabase storage."""
     try:
-        with open(local_path, "rb") as f:
-            file_data = f.read()
-        
         # Use upsert to overwrite existing files
         # Set file options including content type
         file_options = {
@@ -204,8 +208,83 @@ def list_all_buckets(client: Client) -> List[str]:
         return []
 
 
-def migrate_bucket(source_client: Client, dest_client: Client, bucket_name: str, temp_dir: str) -> dict:
-    """Migrate all files from one bucket to another."""
+class MigrationManifest:
+    """
+    Checkpoint of copied files, keyed by bucket and path.
+
+    Each entry records the source size and etag, so a file is only skipped
+    on resume if it has not changed since it was copied.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.entries: Dict[str, Dict[str, Dict[str, object]]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+                copied = sum(len(files) for files in self.entries.values())
+                print(f"📒 Resuming from manifest {path} ({copied} files already copied)")
+            except Exception as e:
+                print(f"⚠️  Could not read manifest {path}, starting fresh: {e}")
+                self.entries = {}
+
+    def is_copied(self, bucket_name: str, file_info: dict) -> bool:
+        entry = self.entries.get(bucket_name, {}).get(file_info["path"])
+        return bool(entry) and _same_object(entry, file_info)
+
+    def record(self, bucket_name: str, file_info: dict) -> None:
+        with self._lock:
+            self.entries.setdefault(bucket_name, {})[file_info["path"]] = {
+                "size": file_info.get("size", 0),
+                "etag": file_info.get("etag"),
+            }
+            self._pending += 1
+            if self._pending >= MANIFEST_FLUSH_EVERY:
+                self._save_locked()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self) -> None:
+        # Write to a temp file and rename so a crash never leaves a torn manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+        self._pending = 0
+
+
+def _same_object(existing: dict, file_info: dict) -> bool:
+    """True when two listings describe the same content (size, and etag when both have one)."""
+    if (existing.get("size") or 0) != (file_info.get("size") or 0):
+        return False
+    if existing.get("etag") and file_info.get("etag"):
+        return existing["etag"] == file_info["etag"]
+    return True
+
+
+def guess_content_type(file_info: dict) -> Optional[str]:
+    """Prefer the mimetype stored with the source object, else guess from the extension."""
+    return file_info.get("mimetype") or mimetypes.guess_type(file_info["path"])[0]
+
+
+def copy_file(source_client: Client, dest_client: Client, bucket_name: str, file_info: dict) -> Tuple[bool, str]:
+    """Copy a single file between buckets in memory. Returns (ok, message)."""
+    file_path = file_info["path"]
+    data = download_file(source_client, bucket_name, file_path)
+    if data is None:
+        return False, "❌ Download failed"
+    if upload_file(dest_client, bucket_name, file_path, data, guess_content_type(file_info)):
+        return True, "✅"
+    return False, "❌ Upload failed"
+
+
+def migrate_bucket(source_client: Client, dest_client: Client, bucket_name: str, manifest: MigrationManifest) -> dict:
+    """Migrate all files from one bucket to another with bounded concurrency."""
     print(f"\n📦 Migrating bucket: {bucket_name}")
     
     # Check if bucket exists in source
@@ -215,7 +294,7 @@ def migrate_bucket(source_client: Client, dest_client: Client, bucket_name: str,
         error_str = str(e).lower()
         if "not found" in error_str or "404" in error_str:
             print(f"   ℹ️  Bucket {bucket_name} doesn't exist in source, skipping")
-            return {"total": 0, "success": 0, "failed": 0}
+            return {"total": 0, "success": 0, "skipped": 0, "failed": 0}
         # Other error - might exist but empty, continue
     
     # Check if bucket exists in destination
@@ -228,7 +307,7 @@ def migrate_bucket(source_client: Client, dest_client: Client, bucket_name: str,
         print(f"      4. Make it Public (if you want public URLs)")
         print(f"      5. Click 'Create bucket'")
         print(f"   ⚠️  Skipping {bucket_name} - create bucket and run again")
-        return {"total": 0, "success": 0, "failed": 0}
+        return {"total": 0, "success": 0, "skipped": 0, "failed": 0}
     
     # List all files in source bucket
     print(f"   📋 Listing files in source bucket...")
@@ -236,58 +315,57 @@ def migrate_bucket(source_client: Client, dest_client: Client, bucket_name: str,
     
     if not source_files:
         print(f"   ℹ️  No files found in {bucket_name}")
-        return {"total": 0, "success": 0, "failed": 0}
+        return {"total": 0, "success": 0, "skipped": 0, "failed": 0}
     
     print(f"   📊 Found {len(source_files)} files")
     
-    # Migrate each file
+    # Skip files recorded in the manifest or already present in the destination
+    print(f"   📋 Listing files in destination bucket...")
+    dest_files = {f["path"]: f for f in list_bucket_files(dest_client, bucket_name)}
+    pending = []
+    skipped_count = 0
+    for file_info in source_files:
+        existing = dest_files.get(file_info["path"])
+        if manifest.is_copied(bucket_name, file_info) or (existing and _same_object(existing, file_info)):
+            manifest.record(bucket_name, file_info)
+            skipped_count += 1
+        else:
+            pending.append(file_info)
+    
+    if skipped_count:
+        print(f"   ⏭️  Skipping {skipped_count} files already copied")
+    
     success_count = 0
     failed_count = 0
     
-    for i, file_info in enumerate(source_files, 1):
-        file_path = file_info["path"]
-        file_size = file_info.get("size", 0)
-        size_mb = file_size / (1024 * 1024) if file_size > 0 else 0
-        
-        print(f"   [{i}/{len(source_files)}] {file_path} ({size_mb:.2f} MB)", end=" ... ")
-        
-        # Download from source
-        local_file = os.path.join(temp_dir, file_path.replace("/", "_"))
-        if not download_file(source_client, bucket_name, file_path, local_file):
-            print("❌ Download failed")
-            failed_count += 1
-            continue
-        
-        # Upload to destination
-        # Determine content type from file extension
-        content_type = None
-        if file_path.endswith(".jpg") or file_path.endswith(".jpeg"):
-            content_type = "image/jpeg"
-        elif file_path.endswith(".png"):
-            content_type = "image/png"
-        elif file_path.endswith(".gif"):
-            content_type = "image/gif"
-        elif file_path.endswith(".webp"):
-            content_type = "image/webp"
-        elif file_path.endswith(".pdf"):
-            content_type = "application/pdf"
-        
-        if upload_file(dest_client, bucket_name, file_path, local_file, content_type):
-            print("✅")
-            success_count += 1
-        else:
-            print("❌ Upload failed")
-            failed_count += 1
-        
-        # Clean up local file
-        try:
-            os.remove(local_file)
-        except:
-            pass
+    print(f"   🚀 Copying {len(pending)} files with {CONCURRENCY} workers")
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        futures = {
+            executor.submit(copy_file, source_client, dest_client, bucket_name, file_info): file_info
+            for file_info in pending
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            file_info = futures[future]
+            file_size = file_info.get("size", 0)
+            size_mb = file_size / (1024 * 1024) if file_size > 0 else 0
+            try:
+                ok, message = future.result()
+            except Exception as e:
+                ok, message = False, f"❌ {e}"
+            
+            print(f"   [{i}/{len(pending)}] {file_info['path']} ({size_mb:.2f} MB) ... {message}")
+            if ok:
+                manifest.record(bucket_name, file_info)
+                success_count += 1
+            else:
+                failed_count += 1
+    
+    manifest.save()
     
     return {
         "total": len(source_files),
         "success": success_count,
+        "skipped": skipped_count,
         "failed": failed_count
     }
 
@@ -347,21 +425,19 @@ def main():
         print("❌ Migration cancelled")
         return
     
-    # Create temporary directory for downloads
-    temp_dir = tempfile.mkdtemp(prefix="supabase_storage_migration_")
+    manifest = MigrationManifest(MANIFEST_PATH)
     
     try:
         print("\n🚀 Starting migration...")
         print("=" * 60)
         
-        total_stats = {"total": 0, "success": 0, "failed": 0}
+        total_stats = {"total": 0, "success": 0, "skipped": 0, "failed": 0}
         
         # Migrate each bucket
         for bucket in buckets_to_migrate:
-            stats = migrate_bucket(source_client, dest_client, bucket, temp_dir)
-            total_stats["total"] += stats["total"]
-            total_stats["success"] += stats["success"]
-            total_stats["failed"] += stats["failed"]
+            stats = migrate_bucket(source_client, dest_client, bucket, manifest)
+            for key in total_stats:
+                total_stats[key] += stats[key]
         
         # Summary
         print("\n" + "=" * 60)
@@ -369,11 +445,13 @@ def main():
         print("=" * 60)
         print(f"📦 Total files: {total_stats['total']}")
         print(f"✅ Successfully migrated: {total_stats['success']}")
+        print(f"⏭️  Already copied (skipped): {total_stats['skipped']}")
         print(f"❌ Failed: {total_stats['failed']}")
         print()
         
         if total_stats["failed"] > 0:
             print("⚠️  Some files failed to migrate. Check errors above.")
+            print(f"💡 Run the script again to retry only the failed files (progress is kept in {MANIFEST_PATH})")
         else:
             print("✅ All files migrated successfully!")
         
@@ -385,11 +463,8 @@ def main():
         print()
         
     finally:
-        # Clean up temporary directory
-        try:
-            shutil.rmtree(temp_dir)
-        except:
-            pass
+        # Keep progress even if the run is interrupted
+        manifest.save()
 
 
 if __name__ == "__main__":
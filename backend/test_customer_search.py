@@ -0,0 +1,69 @@
+"""
+Test script for customer phone normalization and POS search terms (no database needed)
+"""
+import sys
+import os
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.customer_search import customer_search_terms, normalize_email, normalize_phone
+
+
+def test_normalize_phone():
+    """Phones reduce to the 10-digit subscriber number"""
+    assert normalize_phone("+91 98765-43210") == "9876543210"
+    assert normalize_phone("919876543210") == "9876543210"
+    assert normalize_phone("09876543210") == "9876543210"
+    assert normalize_phone("(987) 654 3210") == "9876543210"
+    assert normalize_phone("12345") == "12345"
+    assert normalize_phone("") is None
+    assert normalize_phone(None) is None
+    assert normalize_phone("n/a") is None
+
+
+def test_normalize_email():
+    """Emails are trimmed and lower-cased"""
+    assert normalize_email("  Priya@Example.COM ") == "priya@example.com"
+    assert normalize_email("") is None
+
+
+def test_phone_terms():
+    """Digit-only queries search phone prefixes of the subscriber number"""
+    assert customer_search_terms("98765") == {
+        "name_prefix": None, "name_word_prefix": None, "phone_prefix": "98765%", "email_prefix": None,
+    }
+    # Country code and trunk zero are dropped
+    assert customer_search_terms("+91 98765")["phone_prefix"] == "98765%"
+    assert customer_search_terms("919876543210")["phone_prefix"] == "9876543210%"
+    assert customer_search_terms("09876")["phone_prefix"] == "9876%"
+    assert customer_search_terms("098765-43210")["phone_prefix"] == "9876543210%"
+    # A short "91..." is a subscriber number prefix, not a country code
+    assert customer_search_terms("9198")["phone_prefix"] == "9198%"
+
+
+def test_name_terms():
+    """Anything else searches names and emails, with LIKE wildcards escaped"""
+    terms = customer_search_terms("  Priya ")
+    assert terms["name_prefix"] == "priya%"
+    assert terms["name_word_prefix"] == "% priya%"
+    assert terms["email_prefix"] == "priya%"
+    assert terms["phone_prefix"] is None
+    assert customer_search_terms("50%_off")["name_prefix"] == "50\\%\\_off%"
+    # Too few digits for a phone search
+    assert customer_search_terms("12")["phone_prefix"] is None
+    assert customer_search_terms("")["name_prefix"] is None
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Testing Customer Search...")
+    print("=" * 60)
+    for test in (test_normalize_phone, test_normalize_email, test_phone_terms, test_name_terms):
+        test()
+        print(f"✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Test script for store discount validation and pricing (no database needed)
+"""
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.discounts import DiscountService
+
+
+def _iso(delta_days):
+    return (datetime.now(timezone.utc) + timedelta(days=delta_days)).isoformat()
+
+
+def test_check_dates():
+    """Discounts only apply inside their date window"""
+    assert DiscountService.check({"start_date": _iso(-1), "end_date": _iso(1)}) is None
+    assert DiscountService.check({"start_date": _iso(1)}) == "Discount not yet active"
+    assert DiscountService.check({"end_date": _iso(-1)}) == "Discount has expired"
+    # Naive timestamps are read as UTC
+    naive = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+    assert DiscountService.check({"end_date": naive}) == "Discount has expired"
+
+
+def test_check_max_uses():
+    """max_uses unset or 0 means unlimited, like redeem_store_discount"""
+    assert DiscountService.check({"max_uses": None, "current_uses": 50}) is None
+    assert DiscountService.check({"max_uses": 0, "current_uses": 50}) is None
+    assert DiscountService.check({"max_uses": 5, "current_uses": 4}) is None
+    assert DiscountService.check({"max_uses": 5, "current_uses": 5}) == "Discount usage limit reached"
+
+
+def test_check_minimum_purchase():
+    """Minimum purchase is checked only when an amount is given"""
+    discount = {"minimum_purchase_amount": 1000}
+    assert DiscountService.check(discount) is None
+    assert DiscountService.check(discount, 1000) is None
+    assert DiscountService.check(discount, 999) == "Minimum purchase amount of ₹1000 required"
+    # Older rows use minimum_amount
+    assert DiscountService.check({"minimum_amount": 500}, 100) == "Minimum purchase amount of ₹500 required"
+
+
+def test_amount_for():
+    """Percentage discounts are capped; fixed ones are their value"""
+    assert DiscountService.amount_for({"discount_type": "percentage", "discount_value": 10}, 2000) == 200
+    capped = {"discount_type": "percentage", "discount_value": 50, "maximum_discount_amount": 300}
+    assert DiscountService.amount_for(capped, 2000) == 300
+    assert DiscountService.amount_for({"discount_type": "fixed", "discount_value": 150}, 2000) == 150
+    assert DiscountService.amount_for({"discount_type": "fixed"}, 2000) == 0
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Testing Store Discounts...")
+    print("=" * 60)
+    for test in (test_check_dates, test_check_max_uses, test_check_minimum_purchase, test_amount_for):
+        test()
+        print(f"✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Test script for the held POS cart store (no database needed: db_service is stubbed)
+"""
+import sys
+import os
+from types import SimpleNamespace
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import held_carts
+from app.services.held_carts import HeldCartStore
+
+ITEMS = [{"product_id": "p1", "quantity": 2, "price": 1000}]
+
+
+class FakeTable:
+    """store_held_carts as the db_service methods HeldCartStore uses see it"""
+
+    def __init__(self):
+        self.rows = {}
+        # Called inside admin_get_all after the rows were read
+        self.after_read = None
+
+    def admin_get_all(self, table, order_by=None, desc=False, filters=None):
+        rows = sorted((dict(row) for row in self.rows.values()), key=lambda row: row[order_by])
+        if self.after_read:
+            hook, self.after_read = self.after_read, None
+            hook()
+        return rows
+
+    def admin_create(self, table, data):
+        self.rows[data["id"]] = dict(data)
+        return dict(data)
+
+    def admin_get_by_id(self, table, item_id):
+        row = self.rows.get(item_id)
+        return dict(row) if row else None
+
+    def admin_delete(self, table, item_id):
+        return self.rows.pop(item_id, None) is not None
+
+
+def _store(ttl=3600):
+    return HeldCartStore(SimpleNamespace(held_cart_ttl_seconds=ttl, held_carts_sync_seconds=0))
+
+
+def _with_table(test):
+    def run():
+        table = FakeTable()
+        original, held_carts.db_service = held_carts.db_service, table
+        try:
+            test(table)
+        finally:
+            held_carts.db_service = original
+    run.__name__ = test.__name__
+    return run
+
+
+@_with_table
+def test_hold_and_list(table):
+    """Held carts are saved and listed oldest first, by terminal and by phone"""
+    store = _store()
+    first = store.hold("Priya", ITEMS, customer_phone="+91 98765 43210", terminal_id="T1")
+    second = store.hold("Ravi", ITEMS, terminal_id="T2")
+    assert set(table.rows) == {first["id"], second["id"]}
+    assert [cart["id"] for cart in store.list_carts()] == [first["id"], second["id"]]
+    assert [cart["id"] for cart in store.list_carts(terminal_id="T2")] == [second["id"]]
+    assert [cart["id"] for cart in store.list_carts(phone="09876543210")] == [first["id"]]
+    assert store.list_carts(terminal_id="T2", phone="9876543210") == []
+    # Another worker sees the cart after a reload, with its items decoded
+    listed = _store().list_carts()
+    assert [cart["id"] for cart in listed] == [first["id"], second["id"]]
+    assert listed[0]["items"] == ITEMS
+
+
+@_with_table
+def test_single_resume(table):
+    """Of two tills resuming the same cart, only one gets it"""
+    till_a, till_b = _store(), _store()
+    cart = till_a.hold("Priya", ITEMS, terminal_id="T1")
+    # Till B has not reloaded yet and finds the cart by id
+    assert till_b.get(cart["id"])["id"] == cart["id"]
+    results = [till_a.resume(cart["id"]), till_b.resume(cart["id"])]
+    assert [result is not None for result in results].count(True) == 1
+    assert cart["id"] not in table.rows
+    assert till_a.list_carts() == [] and till_b.list_carts() == []
+
+
+@_with_table
+def test_ttl_expiry(table):
+    """Expired carts are neither listed nor resumed, and their rows are deleted"""
+    store = _store(ttl=0)
+    cart = store.hold("Priya", ITEMS, terminal_id="T1")
+    assert store.list_carts() == []
+    assert cart["id"] not in table.rows
+    assert store.resume(cart["id"]) is None
+
+
+@_with_table
+def test_reload_race(table):
+    """A reload that read the table earlier keeps new carts and does not revive discarded ones"""
+    store = _store()
+    old = store.hold("Priya", ITEMS, terminal_id="T1")
+    new = {}
+
+    def during_read():
+        new.update(store.hold("Ravi", ITEMS, terminal_id="T1"))
+        assert store.discard(old["id"])
+
+    table.after_read = during_read
+    assert [cart["id"] for cart in store.list_carts()] == [new["id"]]
+    # The next reload agrees with the table
+    assert [cart["id"] for cart in store.list_carts()] == [new["id"]]
+    assert set(table.rows) == {new["id"]}
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Testing Held Carts...")
+    print("=" * 60)
+    for test in (test_hold_and_list, test_single_resume, test_ttl_expiry, test_reload_race):
+        test()
+        print(f"✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()
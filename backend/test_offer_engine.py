@@ -0,0 +1,118 @@
+"""
+Test script for offer compilation and cart quotes (no database needed)
+"""
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+# Add backend directory to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.offer_engine import OfferEngine, compile_offer
+
+SAREE = {"id": "p1", "name": "Silk Saree", "price": 1000, "total_stock": 10}
+DUPATTA = {"id": "p2", "name": "Cotton Dupatta", "price": 400, "total_stock": None}
+
+
+def _iso(delta_days):
+    return (datetime.now(timezone.utc) + timedelta(days=delta_days)).isoformat()
+
+
+def _bulk(offer_id, tiers, priority=0, **extra):
+    return {
+        "id": offer_id,
+        "title": offer_id,
+        "offer_type": "single_product_bulk",
+        "priority": priority,
+        "applicable_products": ["Silk Saree"],
+        "conditions": [{"min_quantity": q, "price": p} for q, p in tiers],
+        **extra,
+    }
+
+
+def _quote(offers, lines):
+    engine = OfferEngine()
+    engine.load(offers)
+    return asyncio.run(engine.quote(lines))
+
+
+def test_compile_offer():
+    """Only bulk and bundle offers with products compile into rules"""
+    rule = compile_offer(_bulk("bulk", [(2, 900), (5, 800)]))
+    assert rule.tiers == ((5, 800), (2, 900))
+    assert rule.products == frozenset({"silk saree"})
+    # Conditions may be stored as a JSON string
+    assert compile_offer(_bulk("json", []) | {"conditions": '[{"min_quantity": 3, "price": 850}]'}).tiers == ((3, 850),)
+    assert compile_offer(_bulk("empty", [])) is None
+    assert compile_offer(_bulk("no-products", [(2, 900)]) | {"applicable_products": []}) is None
+    # The storefront cart ignores percentage/amount offers, so the quote does too
+    assert compile_offer({"id": "pct", "offer_type": "percentage", "discount_percentage": 10,
+                          "applicable_products": ["Silk Saree"]}) is None
+
+
+def test_bulk_tiers():
+    """The highest tier reached by the product's total quantity applies"""
+    offers = [_bulk("bulk", [(2, 900), (5, 800)])]
+    assert _quote(offers, [(SAREE, {"quantity": 1})])["items"][0]["price"] == 1000
+    # Quantities of the same product on different lines add up
+    quote = _quote(offers, [(SAREE, {"quantity": 1, "color": "red"}), (SAREE, {"quantity": 1, "color": "blue"})])
+    assert [item["price"] for item in quote["items"]] == [900, 900]
+    quote = _quote(offers, [(SAREE, {"quantity": 5})])
+    assert quote["items"][0]["price"] == 800
+    assert quote["subtotal"] == 5000 and quote["discount"] == 1000 and quote["total"] == 4000
+
+
+def test_bundle_offer():
+    """Bundle offers use their first condition's price for any quantity"""
+    bundle = {
+        "id": "bundle",
+        "title": "bundle",
+        "offer_type": "bundle_offer",
+        "applicable_products": ["Silk Saree", "Cotton Dupatta"],
+        "conditions": [{"min_quantity": 3, "price": 350}, {"min_quantity": 6, "price": 300}],
+    }
+    quote = _quote([bundle], [(SAREE, {"quantity": 1}), (DUPATTA, {"quantity": 1})])
+    assert [item["price"] for item in quote["items"]] == [350, 350]
+    assert quote["items"][1]["applied_offer"]["id"] == "bundle"
+
+
+def test_priority_ties():
+    """Equal offer prices go to the higher priority offer"""
+    offers = [_bulk("low", [(1, 900)], priority=1), _bulk("high", [(1, 900)], priority=5)]
+    item = _quote(offers, [(SAREE, {"quantity": 1})])["items"][0]
+    assert item["applied_offer"]["id"] == "high"
+    # A lower price still beats a higher priority
+    offers.append(_bulk("cheap", [(1, 850)], priority=0))
+    assert _quote(offers, [(SAREE, {"quantity": 1})])["items"][0]["applied_offer"]["id"] == "cheap"
+
+
+def test_date_windows():
+    """Offers apply only between their start and end dates"""
+    offers = [
+        _bulk("expired", [(1, 500)], start_date=_iso(-10), end_date=_iso(-1)),
+        _bulk("upcoming", [(1, 600)], start_date=_iso(1)),
+        _bulk("live", [(1, 900)], start_date=_iso(-1), end_date=_iso(1)),
+    ]
+    item = _quote(offers, [(SAREE, {"quantity": 1})])["items"][0]
+    assert item["price"] == 900 and item["applied_offer"]["id"] == "live"
+
+
+def test_in_stock():
+    """Lines are flagged when the product's cart quantity exceeds its stock"""
+    quote = _quote([], [(SAREE, {"quantity": 11}), (DUPATTA, {"quantity": 50})])
+    assert [item["in_stock"] for item in quote["items"]] == [False, True]
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Testing Offer Engine...")
+    print("=" * 60)
+    for test in (test_compile_offer, test_bulk_tiers, test_bundle_offer, test_priority_ties, test_date_windows, test_in_stock):
+        test()
+        print(f"✅ {test.__name__}")
+
+
+if __name__ == "__main__":
+    main()